@@ -0,0 +1,78 @@
+"""
+點陣圖格式 (8/4/2/1 bpp) 的大小、載入與解碼基準測試。
+
+把內建 .font 中的 8-bit 灰階字形以轉換工具的 pack_glyph_bitmap 重新打包成各種格式，
+寫成暫存的 .fmap/.font，再用 FontRenderer 載入並解碼全部字形。報告：
+點陣圖資料大小 (即 flash 佔用)、載入時間、解碼吞吐量，並驗證解碼結果等於量化後的原圖。
+
+用法 (於專案根目錄執行):
+    python benchmarks/bench_bitmap_formats.py
+"""
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "tools"))
+
+import main
+import full_hardcode_converter as converter
+
+FORMATS = ("1-byte-grayscale", "4-bit-grayscale", "2-bit-grayscale", "1-bit-mono")
+
+
+def quantize(bitmap, bits_per_pixel):
+    max_level = (1 << bits_per_pixel) - 1
+    return bytes(((value * max_level + 127) // 255) * 255 // max_level for value in bitmap)
+
+
+def build(glyphs, bitmap_format, base_path, font_size):
+    bits_per_pixel = converter.BITMAP_FORMAT_BPP[bitmap_format]
+    records, blob = [], bytearray()
+    for codepoint, record, bitmap in glyphs:
+        offset = len(blob)
+        blob.extend(converter.pack_glyph_bitmap(bitmap, record.width, record.height, bits_per_pixel))
+        records.append({
+            "unicode": codepoint, "offset": offset, "width": record.width, "height": record.height,
+            "x_advance": record.x_advance, "x_offset": record.x_offset, "y_offset": record.y_offset, "padding": 0
+        })
+    converter.write_simulator_font_files(base_path, font_size, converter.pack_font_map_records(records), blob, bitmap_format)
+    return len(blob)
+
+
+def run():
+    source = main.FontRenderer(main.FONT_MAP_PATH, main.FONT_DATA_PATH)
+    glyphs = [(codepoint, record, source.read_bitmap(record)) for codepoint, record in source.font_map.records()]
+    font_size = source.metadata.get("font_size", 12)
+    source.close()
+
+    print(f"{'格式':<18} {'點陣圖 (bytes)':>14} {'比例':>6} {'載入 (ms)':>10} {'解碼 (glyphs/s)':>16}")
+    baseline = None
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for bitmap_format in FORMATS:
+            base_path = os.path.join(temp_dir, bitmap_format)
+            blob_size = build(glyphs, bitmap_format, base_path, font_size)
+            baseline = baseline or blob_size
+
+            start = time.perf_counter()
+            renderer = main.FontRenderer(base_path + ".fmap", base_path + ".font")
+            load_time = time.perf_counter() - start
+
+            bits_per_pixel = renderer.bits_per_pixel
+            start = time.perf_counter()
+            decoded = [renderer.read_bitmap(renderer.font_map.lookup(codepoint)) for codepoint, _, _ in glyphs]
+            decode_time = time.perf_counter() - start
+            for (codepoint, _, bitmap), result in zip(glyphs, decoded):
+                if result != quantize(bitmap, bits_per_pixel):
+                    raise AssertionError(f"{bitmap_format}: U+{codepoint:04X} 解碼結果不一致")
+            renderer.close()
+            print(f"{bitmap_format:<18} {blob_size:>14,} {blob_size / baseline:>6.2f} "
+                  f"{load_time * 1000:>10.2f} {len(glyphs) / decode_time:>16,.0f}")
+    print(f"驗證通過: {len(glyphs)} 個字形在各格式下解碼後皆等於量化後的原圖。")
+
+
+if __name__ == "__main__":
+    run()
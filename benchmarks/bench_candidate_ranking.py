@@ -0,0 +1,121 @@
+"""
+候選字排序的重播基準測試。
+
+把一段文字逐字「打」進輸入法，依每個字在候選字中的位置計算需要翻幾頁 (每頁 9 個，對應 main.py 的 -/=)，
+報告每個上屏字平均的翻頁次數與平均名次。比較的排序方式：
+
+    pool       .imx 資料池中的原始順序
+    frequency  依字頻表重新排序 (模擬轉換工具在建置時排序；預設讀取 ime_data/字頻表.txt，找不到時略過)
+    adaptive   在 pool/frequency 之上啟用 UserFrequency，邊打邊學習
+
+文字中可用「字(注音碼)」標明該處實際的讀音，例如 地(ㄉㄜ5)；沒有標明的字使用它最常見的讀音，
+以該字名次最前的那個注音碼近似 (字頻排序的資料池中，字在最常見的讀音下通常排得最前面)。
+內建範例除了常用字，還有一段反覆出現「試、式、譯、釋、視」等排在第二頁以後的字的文字，
+原始順序需要翻頁，使用者字頻學習後則會移到第一頁。
+
+用法 (於專案根目錄執行):
+    python benchmarks/bench_candidate_ranking.py [--text 檔案.txt] [--freq 字頻表.txt]
+"""
+import argparse
+import os
+import re
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+sys.path.insert(0, ROOT)
+
+import main
+
+DEFAULT_FREQ_PATH = os.path.join(ROOT, "ime_data", "字頻表.txt")
+SAMPLE_TEXT = (
+    "我們今天在學校裡學習中文輸入法，老師說只要多練習就會越打越快。"
+    "這個小小的螢幕可以顯示很多字，也可以用注音一個一個地(ㄉㄜ5)把字打出來。"
+    "天氣很好的時候，我們喜歡到公園裡散步，看看花草樹木，聽聽鳥叫的聲音。"
+    "大家一起努力，把這個專案做得(ㄉㄜ5)更好，讓更多人可以在小裝置上使用中文。"
+    "今天試著用程式翻譯一段文字，再把翻譯的結果解釋給大家聽。"
+    "老師鼓勵我們多做測試，檢視每一段程式的格式是否適合，"
+    "翻譯不通的地方要再解釋清楚，測試通過後再試一次新的程式。"
+)
+ANNOTATION_PATTERN = re.compile(r"(.)(?:\(([^)]+)\))?", re.S)
+
+
+def parse_text(text):
+    """把文字拆成 [(字, 標明的注音碼或 None)]。"""
+    return [(match.group(1), match.group(2)) for match in ANNOTATION_PATTERN.finditer(text)]
+
+
+def build_reverse_map(index):
+    """字 -> 最常見讀音的注音碼 (以字名次最前的那一個注音碼近似)。"""
+    best = {}
+    for position in range(index.count):
+        code = index.key_at(position).decode("utf-8")
+        for rank, char in enumerate(index.candidates_at(position)):
+            if char not in best or rank < best[char][1]:
+                best[char] = (code, rank)
+    return {char: code for char, (code, _) in best.items()}
+
+
+def load_frequency_sorter(freq_path):
+    sys.path.insert(0, os.path.join(ROOT, "tools"))
+    import full_hardcode_converter as converter
+    converter.FREQUENCY_TABLE_PATH = freq_path
+    ranks = converter.load_frequency_ranks()
+    unranked = len(ranks)
+    return lambda candidates: "".join(sorted(candidates, key=lambda char: ranks.get(char, unranked)))
+
+
+def replay(ime, chars, reverse_map, sort_candidates=None, learn=False):
+    page_flips, rank_total, committed, skipped = 0, 0, 0, 0
+    for char, code in chars:
+        candidates = ime.index.lookup(code or reverse_map.get(char, ""))
+        if not candidates or char not in candidates:
+            skipped += 1
+            continue
+        if sort_candidates:
+            candidates = sort_candidates(candidates)
+        if learn:
+            candidates = ime.user_frequency.rerank(candidates)
+        rank = candidates.index(char)
+        page_flips += rank // main.CANDIDATES_PER_PAGE
+        rank_total += rank
+        committed += 1
+        if learn:
+            ime.commit(char)
+    return page_flips, rank_total, committed, skipped
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--text", help="要重播的 UTF-8 文字檔，可用「字(注音碼)」標明讀音 (預設使用內建範例)")
+    parser.add_argument("--freq", default=DEFAULT_FREQ_PATH, help="字頻表路徑，用來模擬建置時的字頻排序")
+    args = parser.parse_args()
+
+    text = SAMPLE_TEXT
+    if args.text:
+        with open(args.text, "r", encoding="utf-8") as f:
+            text = f.read()
+
+    chars = parse_text(text)
+    ime = main.ImeEngine(main.IME_SCHEMES[:1])
+    reverse_map = build_reverse_map(ime.index)
+    modes = [("pool", None)]
+    if os.path.exists(args.freq):
+        modes.append(("frequency", load_frequency_sorter(args.freq)))
+    else:
+        print(f"找不到字頻表 '{args.freq}'，略過 frequency (可用 --freq 指定)。")
+
+    print(f"{'排序方式':<20} {'上屏字數':>8} {'翻頁總數':>8} {'翻頁/字':>8} {'平均名次':>8}")
+    for name, sorter in modes:
+        for learn in (False, True):
+            ime.user_frequency = main.UserFrequency()
+            page_flips, rank_total, committed, skipped = replay(ime, chars, reverse_map, sorter, learn)
+            label = f"{name}+adaptive" if learn else name
+            print(f"{label:<20} {committed:>8} {page_flips:>8} {page_flips / max(committed, 1):>8.3f} {rank_total / max(committed, 1):>8.2f}")
+    if skipped:
+        print(f"({skipped} 個字 (含標點) 不在輸入法索引中，已略過)")
+    ime.close()
+
+
+if __name__ == "__main__":
+    run()
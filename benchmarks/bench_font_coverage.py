@@ -0,0 +1,66 @@
+"""
+字型覆蓋檢查的基準測試。
+
+比較兩種判斷「字型有哪些字」的方式：直接解析 cmap (read_font_cmap)，
+以及逐字渲染後與缺字字形 (.notdef) 比對。報告兩者的耗時與結果差異。
+
+用法 (於專案根目錄執行):
+    python benchmarks/bench_font_coverage.py [--font fonts/Cubic_11.ttf] [--size 12]
+"""
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "tools"))
+
+from PIL import ImageFont
+
+import full_hardcode_converter as converter
+
+# 逐字渲染只檢查 ASCII、CJK 標點與基本漢字區，已足以看出差距
+PROBE_RANGES = ((0x20, 0x7F), (0x3000, 0x3100), (0x4E00, 0xA000))
+
+
+def probe_by_rendering(font):
+    """把每個字渲染出來，與一定不存在的字 (U+10FFFD) 的缺字字形比較。"""
+    def render(char):
+        mask = font.getmask(char)
+        return mask.size, bytes(mask)
+
+    notdef = render(chr(0x10FFFD))
+    return {codepoint for first, last in PROBE_RANGES for codepoint in range(first, last)
+            if render(chr(codepoint)) != notdef}
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--font", default=os.path.join(ROOT, "fonts", "Cubic_11.ttf"), help="TTF/OTF/TTC 字型檔")
+    parser.add_argument("--size", type=int, default=12, help="渲染大小")
+    args = parser.parse_args()
+    if not os.path.exists(args.font):
+        print(f"找不到字型 '{args.font}'，請以 --font 指定。")
+        return
+
+    start = time.perf_counter()
+    cmap = converter.read_font_cmap(args.font)
+    cmap_time = time.perf_counter() - start
+    probed_cmap = {codepoint for codepoint in cmap if any(first <= codepoint < last for first, last in PROBE_RANGES)}
+
+    font = ImageFont.truetype(args.font, args.size)
+    start = time.perf_counter()
+    rendered = probe_by_rendering(font)
+    render_time = time.perf_counter() - start
+    probe_count = sum(last - first for first, last in PROBE_RANGES)
+
+    print(f"{'方式':<14} {'耗時 (s)':>10} {'字數':>8}")
+    print(f"{'讀取 cmap':<14} {cmap_time:>10.3f} {len(cmap):>8,}  (整個字型)")
+    print(f"{'逐字渲染':<14} {render_time:>10.3f} {len(rendered):>8,}  (只檢查 {probe_count:,} 個 codepoint)")
+    # 有字形但渲染結果為空白的字 (空白字元等) 會被渲染法誤判為缺字
+    only_cmap, only_rendered = probed_cmap - rendered, rendered - probed_cmap
+    print(f"檢查範圍內: cmap 有而渲染法判為缺字 {len(only_cmap)} 個，渲染法有而 cmap 沒有 {len(only_rendered)} 個。")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,64 @@
+"""
+字型查找表啟動時間與記憶體的基準測試。
+
+分別在獨立子行程中載入 JSON .map 與二進位 .fmap，報告載入時間、
+行程的 RSS 增量，以及查詢吞吐量。
+
+用法 (於專案根目錄執行):
+    python benchmarks/bench_font_map.py
+"""
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+sys.path.insert(0, ROOT)
+
+JSON_MAP_PATH = os.path.join(ROOT, "output_data", "Cubic_11.ttf_12.map")
+BINARY_MAP_PATH = os.path.join(ROOT, "output_data", "Cubic_11.ttf_12.fmap")
+QUERY_TEXT = "PicoType 模擬器：中文輸入與點陣字型顯示測試。" * 20
+
+
+def max_rss_kb():
+    # Linux 上 ru_maxrss 的單位是 KB
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def child(mode):
+    import main
+    rss_before = max_rss_kb()
+    start = time.perf_counter()
+    font_map = main.JsonFontMap(JSON_MAP_PATH) if mode == "json" else main.BinaryFontMap(BINARY_MAP_PATH)
+    load_time = time.perf_counter() - start
+    rss_after = max_rss_kb()
+
+    codepoints = [ord(c) for c in QUERY_TEXT]
+    start = time.perf_counter()
+    for codepoint in codepoints:
+        font_map.lookup(codepoint)
+    query_time = time.perf_counter() - start
+    font_map.close()
+    print(json.dumps({
+        "mode": mode, "load_ms": load_time * 1000, "rss_delta_kb": rss_after - rss_before,
+        "lookups_per_s": len(codepoints) / query_time,
+    }))
+
+
+def run():
+    print(f"{'格式':<8} {'載入 (ms)':>10} {'RSS 增量 (KB)':>14} {'查詢/秒':>12}")
+    for mode in ("json", "binary"):
+        output = subprocess.run([sys.executable, __file__, "--child", mode],
+                                capture_output=True, text=True, check=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"{mode:<8} {result['load_ms']:>10.2f} {result['rss_delta_kb']:>14} {result['lookups_per_s']:>12,.0f}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "--child":
+        child(sys.argv[2])
+    else:
+        run()
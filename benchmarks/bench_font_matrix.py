@@ -0,0 +1,92 @@
+"""
+建置矩陣 (多個字型大小一次建置) 的基準測試。
+
+以同一個字型的多個大小比較兩種作法：
+    逐次建置  每個大小各自開啟字型檔、讀取 cmap、渲染並打包 (等同每次修改 FONT_SIZE 後重跑轉換工具)
+    建置矩陣  convert_font_matrix：字型檔只讀取一次，各大小共用字元集與 codepoint 區段表
+報告耗時與標頭檔中字型索引 (區段表 + 精簡紀錄) 的大小，並驗證兩者的紀錄與點陣圖相同。不使用建置快取。
+
+用法 (於專案根目錄執行):
+    python benchmarks/bench_font_matrix.py [--font fonts/Cubic_11.ttf] [--sizes 12 16 24] [--chars 3000]
+"""
+import argparse
+import contextlib
+import io
+import os
+import struct
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "tools"))
+
+import full_hardcode_converter as converter
+
+
+def separate_builds(font_path, sizes, charset):
+    """每個大小都重新讀取字型檔與 cmap，回傳 {大小: (區段表, 精簡紀錄, 點陣圖)}。"""
+    results = {}
+    for size in sizes:
+        source = converter.FontSource(font_path)
+        font_chars = {chr(codepoint) for codepoint in source.cmap()}
+        size_charset = "".join(char for char in charset if char in font_chars)
+        glyphs = converter.rasterize_charset(source, size, size_charset, workers=1)
+        font_map_data, font_bitmap_data = converter.pack_glyphs(size_charset, glyphs)
+        ranges, records = converter.pack_compact_font_map(font_map_data)
+        results[size] = (ranges, records, bytes(font_bitmap_data))
+    return results
+
+
+def matrix_build(font_path, sizes, charset):
+    variants = converter.convert_font_matrix(charset, [{"name": "bench", "path": font_path, "sizes": sizes}], workers=1)
+    results = {}
+    for variant in variants:
+        ranges, records = converter.pack_compact_font_map(variant.font_map_data)
+        results[variant.size] = (ranges, records, bytes(variant.font_bitmap_data))
+    return results
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--font", default=os.path.join(ROOT, "fonts", "Cubic_11.ttf"), help="TTF/OTF/TTC 字型檔")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[12, 16, 24], help="要建置的大小")
+    parser.add_argument("--chars", type=int, default=3000, help="取字型 cmap 中前 N 個字元作為字元集")
+    args = parser.parse_args()
+    if not os.path.exists(args.font):
+        print(f"找不到字型 '{args.font}'，請以 --font 指定。")
+        return
+    charset = "".join(chr(codepoint) for codepoint in sorted(converter.read_font_cmap(args.font))[:args.chars])
+
+    timings, outputs = {}, {}
+    for label, build in (("逐次建置", separate_builds), ("建置矩陣", matrix_build)):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            outputs[label] = build(args.font, args.sizes, charset)
+        timings[label] = time.perf_counter() - start
+
+    separate, matrix = outputs["逐次建置"], outputs["建置矩陣"]
+    record_size = struct.calcsize(converter.FONT_MAP_COMPACT_FORMAT)
+    # 逐次建置時每個大小各有一份區段表；建置矩陣只輸出一份，字形缺漏時以佔位紀錄補齊
+    separate_index = sum(len(ranges) + len(records) for ranges, records, _ in separate.values())
+    matrix_index = len(next(iter(matrix.values()))[0]) + sum(len(records) for _, records, _ in matrix.values())
+    print(f"字元集 {len(charset):,} 個字元，大小 {', '.join(map(str, args.sizes))}")
+    print(f"{'方式':<10} {'耗時 (s)':>10} {'字型索引 (bytes)':>18} {'點陣圖 (bytes)':>16}")
+    for label, index_size in (("逐次建置", separate_index), ("建置矩陣", matrix_index)):
+        bitmap_size = sum(len(bitmap) for _, _, bitmap in outputs[label].values())
+        print(f"{label:<10} {timings[label]:>10.2f} {index_size:>18,} {bitmap_size:>16,}")
+
+    for size in args.sizes:
+        if separate[size][2] != matrix[size][2]:
+            raise AssertionError(f"大小 {size} 的點陣圖不一致")
+        # 去掉佔位紀錄後應與逐次建置相同
+        matrix_records = b"".join(matrix[size][1][i:i + record_size] for i in range(0, len(matrix[size][1]), record_size)
+                                  if any(matrix[size][1][i:i + record_size]))
+        if separate[size][1] != matrix_records:
+            raise AssertionError(f"大小 {size} 的紀錄不一致")
+    placeholders = sum(len(records) // record_size for _, records, _ in matrix.values()) \
+        - sum(len(records) // record_size for _, records, _ in separate.values())
+    print(f"驗證通過: 各大小的紀錄與點陣圖相同 (建置矩陣另有 {placeholders} 筆缺字佔位紀錄)。")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,76 @@
+"""
+字型對應表佈局 (完整/精簡紀錄、有無分頁表) 的基準測試。
+
+以內建 .fmap 的紀錄分別寫出四種佈局的暫存檔：完整紀錄 + 二分搜尋 (版本 1)、完整紀錄 + 分頁表 (版本 2)、
+精簡紀錄 + 區段表二分搜尋、精簡紀錄 + 分頁表 (版本 3)。報告檔案大小，以及命中與未命中時
+每秒的查詢數，並驗證各佈局的查詢結果相同。
+
+用法 (於專案根目錄執行):
+    python benchmarks/bench_font_page_table.py
+"""
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "tools"))
+
+import main
+import full_hardcode_converter as converter
+
+QUERY_ROUNDS = 5
+# 未命中的查詢: 字元集中沒有的 CJK 字與超出目錄範圍的 codepoint
+MISS_CODEPOINTS = list(range(0x3400, 0x3500)) + list(range(0x20000, 0x20100))
+LAYOUTS = (
+    ("完整 + 二分搜尋", "full", False),
+    ("完整 + 分頁表", "full", True),
+    ("精簡 + 區段表", "compact", False),
+    ("精簡 + 分頁表", "compact", True),
+)
+
+
+def measure(font_map, codepoints):
+    start = time.perf_counter()
+    for _ in range(QUERY_ROUNDS):
+        for codepoint in codepoints:
+            font_map.lookup(codepoint)
+    return QUERY_ROUNDS * len(codepoints) / (time.perf_counter() - start)
+
+
+def run():
+    source = main.BinaryFontMap(main.FONT_MAP_PATH)
+    font_size = source.metadata["font_size"]
+    font_map_data = converter.pack_font_map_records([
+        {"unicode": codepoint, "offset": record.offset, "width": record.width, "height": record.height,
+         "x_advance": record.x_advance, "x_offset": record.x_offset, "y_offset": record.y_offset, "padding": 0}
+        for codepoint, record in source.records()])
+    hit_codepoints = [codepoint for codepoint, _ in source.records()]
+    source.close()
+    record_bytes = len(font_map_data)
+
+    directory, pages = converter.build_font_page_table(font_map_data)
+    print(f"紀錄陣列: {record_bytes:,} bytes ({len(hit_codepoints)} 筆)")
+    print(f"分頁表: 目錄 {len(directory):,} bytes + {len(pages) // (2 * main.FONT_PAGE_SIZE)} 個分頁 {len(pages):,} bytes"
+          f" (額外 {(len(directory) + len(pages)) / record_bytes:.0%})")
+
+    print(f"{'佈局':<16} {'檔案 (bytes)':>12} {'命中 (查詢/秒)':>16} {'未命中 (查詢/秒)':>18}")
+    results = {}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for label, record_mode, page_table in LAYOUTS:
+            path = os.path.join(temp_dir, f"{record_mode}-{page_table}.fmap")
+            converter.write_font_map_file(path, font_size, font_map_data, page_table=page_table, record_mode=record_mode)
+            font_map = main.BinaryFontMap(path)
+            hits, misses = measure(font_map, hit_codepoints), measure(font_map, MISS_CODEPOINTS)
+            results[label] = [font_map.lookup(codepoint) for codepoint in hit_codepoints + MISS_CODEPOINTS]
+            font_map.close()
+            print(f"{label:<16} {os.path.getsize(path):>12,} {hits:>16,.0f} {misses:>18,.0f}")
+    if any(result != results[LAYOUTS[0][0]] for result in results.values()):
+        raise AssertionError("各佈局的查詢結果不一致")
+    print("驗證通過: 各佈局的查詢結果一致。")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,114 @@
+"""
+字形圖集 (GlyphAtlas) 的基準測試。
+
+比較 draw_string 的兩種作法：每個字一個 Surface 逐一 blit (舊作法，GLYPH_ATLAS_ENABLED = False)，
+以及從圖集以一次 Surface.blits 畫出整個字串。報告：
+
+    冷啟動    第一次繪製 --chars 個不同的字 (需建立字形) 的耗時與保留的 Surface 數
+    熱繪製    重複繪製編輯區長度的字串時，每秒字串數與每字耗時
+    預先載入  把整個字型放進圖集的耗時、頁數與空間使用率
+
+並驗證圖集的 draw_string 與舊作法的 draw_string 畫出的字串寬度與像素完全相同 (排版數值見 FontRenderer.glyph_metrics)。
+
+用法 (於專案根目錄執行):
+    python benchmarks/bench_glyph_atlas.py [--chars 3000] [--rounds 2000]
+"""
+import argparse
+import os
+import sys
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pygame
+
+import main
+
+SAMPLE = "中文輸入法測試，這是一段用來排版的文字。PicoType 12px."
+COLOR = main.COLOR_TEXT
+LINE_WIDTH = main.EDITOR_AREA_RECT.width - 10
+
+
+def sample_lines(renderer):
+    """把 SAMPLE 依編輯區寬度切成數行 (與實際畫面上每次 draw_string 的長度相當)。"""
+    layout = main.TextLayout(renderer.char_advance, LINE_WIDTH)
+    layout.update(SAMPLE * 4)
+    return [layout.line_text(index) for index in range(layout.line_count())]
+
+
+def verify(legacy_renderer, atlas_renderer, lines):
+    for text in lines:
+        expected = pygame.Surface((LINE_WIDTH + 20, 40))
+        actual = pygame.Surface((LINE_WIDTH + 20, 40))
+        expected.fill(main.COLOR_BACKGROUND)
+        actual.fill(main.COLOR_BACKGROUND)
+        if legacy_renderer.draw_string(expected, text, 5, 5, COLOR) != atlas_renderer.draw_string(actual, text, 5, 5, COLOR):
+            raise AssertionError(f"'{text}' 的字串寬度不一致")
+        if pygame.image.tobytes(expected, "RGB") != pygame.image.tobytes(actual, "RGB"):
+            raise AssertionError(f"'{text}' 的繪製結果不一致")
+
+
+def cold_draw(use_atlas, chars):
+    renderer = main.FontRenderer(main.FONT_MAP_PATH, main.FONT_DATA_PATH, atlas=use_atlas)
+    surface = pygame.Surface((main.SCREEN_WIDTH, 40))
+    start = time.perf_counter()
+    for i in range(0, len(chars), 20):
+        renderer.draw_string(surface, chars[i:i + 20], 0, 0, COLOR)
+    elapsed = time.perf_counter() - start
+    surfaces = renderer.atlas.stats()["pages"] if use_atlas else renderer.glyph_cache.stats()["entries"]
+    return renderer, elapsed, surfaces
+
+
+def warm_draw(renderer, lines, rounds):
+    surface = pygame.Surface((main.SCREEN_WIDTH, 40))
+    for text in lines:
+        renderer.draw_string(surface, text, 0, 0, COLOR)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for text in lines:
+            renderer.draw_string(surface, text, 0, 0, COLOR)
+    return time.perf_counter() - start
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chars", type=int, default=3000, help="冷啟動時繪製的不同字數")
+    parser.add_argument("--rounds", type=int, default=2000, help="熱繪製時每行重複的次數")
+    args = parser.parse_args()
+    pygame.init()
+    pygame.display.set_mode((main.SCREEN_WIDTH, main.SCREEN_HEIGHT))
+
+    face = main.FontFace(main.FONT_MAP_PATH, main.FONT_DATA_PATH)
+    charset = "".join(chr(codepoint) for codepoint, _ in face.font_map.records())
+    face.close()
+
+    renderers = {}
+    print(f"{'方式':<14} {'冷啟動 (ms)':>12} {'Surface 數':>10} {'字串/秒':>10} {'每字 (µs)':>10}")
+    for label, use_atlas in (("每字 Surface", False), ("圖集", True)):
+        renderer, cold_time, surfaces = cold_draw(use_atlas, charset[:args.chars])
+        lines = sample_lines(renderer)
+        elapsed = warm_draw(renderer, lines, args.rounds)
+        strings = args.rounds * len(lines)
+        glyphs = args.rounds * sum(len(text) for text in lines)
+        print(f"{label:<14} {cold_time * 1000:>12.1f} {surfaces:>10,} {strings / elapsed:>10,.0f} {elapsed / glyphs * 1e6:>10.2f}")
+        renderers[use_atlas] = renderer
+
+    # 另加缺字 (U+FFFF) 與 ASCII，確認缺字方塊與半形字的字距也一致
+    verify(renderers[False], renderers[True], sample_lines(renderers[True]) + ["\uffffABC中文\uffff"])
+    print("驗證通過: 圖集與每字 Surface 的 draw_string 結果逐像素相同。")
+
+    preload_renderer = main.FontRenderer(main.FONT_MAP_PATH, main.FONT_DATA_PATH, cache_bytes=64 * 1024 * 1024, atlas=True)
+    start = time.perf_counter()
+    preload_renderer.preload(charset, COLOR)
+    elapsed = time.perf_counter() - start
+    stats = preload_renderer.atlas.stats()
+    print(f"預先載入 {len(charset):,} 個字形: {elapsed * 1000:.0f} ms，{stats['pages']} 頁 "
+          f"({main.GLYPH_ATLAS_PAGE_SIZE[0]}x{main.GLYPH_ATLAS_PAGE_SIZE[1]})，空間使用率 {stats['occupancy']:.1%}")
+    for renderer in (*renderers.values(), preload_renderer):
+        renderer.close()
+    pygame.quit()
+
+
+if __name__ == "__main__":
+    run()
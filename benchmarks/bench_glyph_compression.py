@@ -0,0 +1,75 @@
+"""
+點陣圖資料池去重與 RLE 壓縮的基準測試。
+
+把內建字型以不同格式與選項 (無 / 去重 / RLE / 去重 + RLE) 重新打包成暫存的 .fmap/.font，
+報告點陣圖資料池大小與每個字形的平均解碼延遲，並驗證解碼結果等於量化後的原圖。
+
+用法 (於專案根目錄執行):
+    python benchmarks/bench_glyph_compression.py
+"""
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "tools"))
+
+import main
+import full_hardcode_converter as converter
+from bench_bitmap_formats import quantize
+
+FORMATS = ("1-byte-grayscale", "1-bit-mono")
+OPTIONS = (("無", False, None), ("去重", True, None), ("RLE", False, "rle"), ("去重+RLE", True, "rle"))
+
+
+def build(glyphs, bitmap_format, deduplicate, compression, base_path, font_size):
+    records, blob, shared_offsets = [], bytearray(), {}
+    for codepoint, record, bitmap in glyphs:
+        encoded = converter.encode_glyph_bitmap(bitmap, record.width, record.height, bitmap_format, compression)
+        offset = shared_offsets.get(encoded) if deduplicate else None
+        if offset is None:
+            offset = len(blob)
+            blob.extend(encoded)
+            shared_offsets[encoded] = offset
+        records.append({
+            "unicode": codepoint, "offset": offset, "width": record.width, "height": record.height,
+            "x_advance": record.x_advance, "x_offset": record.x_offset, "y_offset": record.y_offset, "padding": 0
+        })
+    converter.write_simulator_font_files(base_path, font_size, converter.pack_font_map_records(records),
+                                         blob, bitmap_format, compression)
+    return len(blob)
+
+
+def run():
+    source = main.FontRenderer(main.FONT_MAP_PATH, main.FONT_DATA_PATH)
+    glyphs = [(codepoint, record, source.read_bitmap(record)) for codepoint, record in source.font_map.records()]
+    font_size = source.metadata.get("font_size", 12)
+    source.close()
+
+    print(f"{'格式':<18} {'選項':<8} {'點陣圖 (bytes)':>14} {'比例':>6} {'解碼 (µs/字)':>12}")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for bitmap_format in FORMATS:
+            baseline = None
+            for label, deduplicate, compression in OPTIONS:
+                base_path = os.path.join(temp_dir, f"{bitmap_format}-{deduplicate}-{compression}")
+                blob_size = build(glyphs, bitmap_format, deduplicate, compression, base_path, font_size)
+                baseline = baseline or blob_size
+                renderer = main.FontRenderer(base_path + ".fmap", base_path + ".font")
+                records = [renderer.font_map.lookup(codepoint) for codepoint, _, _ in glyphs]
+                start = time.perf_counter()
+                decoded = [renderer.read_bitmap(record) for record in records]
+                decode_time = time.perf_counter() - start
+                for (codepoint, _, bitmap), result in zip(glyphs, decoded):
+                    if result != quantize(bitmap, renderer.bits_per_pixel):
+                        raise AssertionError(f"{bitmap_format}/{label}: U+{codepoint:04X} 解碼結果不一致")
+                renderer.close()
+                print(f"{bitmap_format:<18} {label:<8} {blob_size:>14,} {blob_size / baseline:>6.2f} "
+                      f"{decode_time / len(glyphs) * 1e6:>12.2f}")
+    print(f"驗證通過: {len(glyphs)} 個字形在各選項下解碼結果一致。")
+
+
+if __name__ == "__main__":
+    run()
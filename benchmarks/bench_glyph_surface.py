@@ -0,0 +1,76 @@
+"""
+字形 Surface 轉換的微基準測試。
+
+比較舊版逐點 set_at 與 grayscale_to_surface 的批次轉換：
+先逐像素驗證兩者輸出一致，再報告每秒可轉換的字形數。
+
+用法 (於專案根目錄執行):
+    python benchmarks/bench_glyph_surface.py
+"""
+import os
+import sys
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pygame
+import main
+
+COLOR = main.COLOR_TEXT
+
+
+def set_at_surface(pixel_data, width, height, color):
+    """舊版的逐點轉換，作為正確性與效能的基準。"""
+    char_surface = pygame.Surface((width, height), pygame.SRCALPHA)
+    for y in range(height):
+        for x in range(width):
+            alpha = pixel_data[y * width + x]
+            if alpha > 0:
+                char_surface.set_at((x, y), (*color, alpha))
+    return char_surface
+
+
+def load_glyphs(renderer):
+    return [(renderer.read_bitmap(record), record.width, record.height)
+            for _, record in renderer.font_map.records()]
+
+
+def verify(glyphs):
+    for pixel_data, width, height in glyphs:
+        expected = set_at_surface(pixel_data, width, height, COLOR)
+        actual = main.grayscale_to_surface(pixel_data, width, height, COLOR)
+        for y in range(height):
+            for x in range(width):
+                if expected.get_at((x, y)) != actual.get_at((x, y)):
+                    raise AssertionError(f"像素不一致: {width}x{height} 於 ({x}, {y})")
+    print(f"驗證通過: {len(glyphs)} 個字形逐像素一致。")
+
+
+def measure(name, func, glyphs):
+    start = time.perf_counter()
+    for pixel_data, width, height in glyphs:
+        func(pixel_data, width, height, COLOR)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<12} {len(glyphs) / elapsed:>12,.0f} glyphs/s ({elapsed:.3f} s)")
+    return elapsed
+
+
+def run():
+    pygame.init()
+    pygame.display.set_mode((1, 1))
+    renderer = main.FontRenderer(main.FONT_MAP_PATH, main.FONT_DATA_PATH)
+    try:
+        glyphs = load_glyphs(renderer)
+    finally:
+        renderer.close()
+
+    verify(glyphs)
+    before = measure("set_at", set_at_surface, glyphs)
+    after = measure("bulk", main.grayscale_to_surface, glyphs)
+    print(f"加速倍數: {before / after:.1f}x")
+    pygame.quit()
+
+
+if __name__ == "__main__":
+    run()
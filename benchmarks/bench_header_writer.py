@@ -0,0 +1,136 @@
+"""
+C 標頭檔寫出方式的基準測試。
+
+以內建 .fmap/.font 與 zhuyin.imx 的資料組出與轉換工具相同的標頭檔內容，比較：
+舊版 (每個位元組格式化成字串、整個標頭檔 join 後一次寫出)、串流寫出 (inline)、
+以及 embed / incbin 模式 (.bin 檔 + 只有宣告的 .h)。報告寫出時間、tracemalloc 量得的峰值記憶體與輸出大小，
+並驗證串流寫出的內容與舊版相同。系統有 g++ 時另外比較 inline 與 incbin 的編譯時間
+(#embed 需要 GCC 15 / Clang 19 以上，這裡只產生不編譯)。
+
+用法 (於專案根目錄執行):
+    python benchmarks/bench_header_writer.py [--repeat 4]
+"""
+import argparse
+import os
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "tools"))
+
+import main
+import full_hardcode_converter as converter
+
+ARDUINO_STUB = "#include <stdint.h>\n#include <stddef.h>\n#define PROGMEM\n"
+COMPILE_UNIT = '#include "picotype_data_optimized.h"\nint main() { return font_bitmap_data_opt[0] + font_map_count_opt; }\n'
+
+
+def legacy_format(array):
+    """舊版 generate_header_file_optimized 中的陣列格式化方式。"""
+    if array.c_type == "uint16_t":
+        values = struct.unpack(f"<{len(array.data) // 2}H", array.data)
+        digits = 4
+    else:
+        values, digits = array.data, 2
+    c_code = [f"const {array.c_type} {array.name}[{len(values)}] PROGMEM = {{"]
+    for i in range(0, len(values), 16):
+        c_code.append("    " + ", ".join(f"0x{v:0{digits}x}" for v in values[i:i + 16]) + ",")
+    c_code.append("};")
+    return "\n".join(c_code)
+
+
+def legacy_write(path, items):
+    h_content = [legacy_format(item) if isinstance(item, converter.CArray) else item for item in items]
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(h_content))
+
+
+def stream_write(path, items, array_mode):
+    output_dir = os.path.dirname(path)
+    with open(path, "w", encoding="utf-8") as f:
+        converter.CHeaderWriter(f, array_mode, os.path.join(output_dir, "picotype_bin"), output_dir).write_lines(items)
+
+
+def load_items(repeat):
+    """font_bitmap_data_opt 重複 repeat 次以模擬更大的字型 (只影響陣列大小)。"""
+    font_map = main.BinaryFontMap(main.FONT_MAP_PATH)
+    font_map_data = converter.pack_font_map_records([
+        {"unicode": codepoint, "offset": record.offset, "width": record.width, "height": record.height,
+         "x_advance": record.x_advance, "x_offset": record.x_offset, "y_offset": record.y_offset, "padding": 0}
+        for codepoint, record in font_map.records()])
+    font_map.close()
+    with open(main.FONT_DATA_PATH, "rb") as f:
+        font_bitmap_data = f.read() * repeat
+    with open(main.IME_IDX_PATH, "rb") as f:
+        imx = f.read()
+    pool_size = struct.unpack_from(main.IME_INDEX_FILE_HEADER_FORMAT, imx, 0)[3]
+    ime_indexes = {"zhuyin": (imx[main.IME_INDEX_FILE_HEADER_SIZE:len(imx) - pool_size], imx[len(imx) - pool_size:])}
+    return converter.build_header_items(ime_indexes, font_map_data, font_bitmap_data)
+
+
+def measure(write, path, items, *args):
+    start = time.perf_counter()
+    write(path, items, *args)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    write(path, items, *args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def compile_time(directory):
+    with open(os.path.join(directory, "Arduino.h"), "w") as f:
+        f.write(ARDUINO_STUB)
+    with open(os.path.join(directory, "unit.cpp"), "w") as f:
+        f.write(COMPILE_UNIT)
+    start = time.perf_counter()
+    subprocess.run(["g++", "-std=c++17", "-c", "-I", directory, f"-Wa,-I{directory}", "unit.cpp", "-o", "unit.o"],
+                   cwd=directory, check=True)
+    return time.perf_counter() - start
+
+
+def directory_size(directory):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(directory) for name in names
+               if name.endswith((".h", ".bin")))
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=4, help="點陣圖資料重複的次數 (模擬更大的字型)")
+    args = parser.parse_args()
+    items = load_items(args.repeat)
+    array_bytes = sum(len(item.data) for item in items if isinstance(item, converter.CArray))
+    print(f"陣列資料共 {array_bytes:,} bytes")
+
+    compiler = shutil.which("g++")
+    modes = (("舊版 (join)", legacy_write, ()), ("串流 inline", stream_write, ("inline",)),
+             ("串流 embed", stream_write, ("embed",)), ("串流 incbin", stream_write, ("incbin",)))
+    print(f"{'方式':<14} {'寫出 (ms)':>10} {'峰值記憶體 (KB)':>16} {'輸出 (bytes)':>14} {'編譯 (s)':>10}")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        outputs = {}
+        for label, write, write_args in modes:
+            directory = os.path.join(temp_dir, str(len(outputs)))
+            os.makedirs(directory)
+            path = os.path.join(directory, "picotype_data_optimized.h")
+            elapsed, peak = measure(write, path, items, *write_args)
+            with open(path, "r", encoding="utf-8") as f:
+                outputs[label] = f.read()
+            compiled = "-"
+            if compiler and write_args != ("embed",):
+                compiled = f"{compile_time(directory):.2f}"
+            print(f"{label:<14} {elapsed * 1000:>10.1f} {peak / 1024:>16,.0f} {directory_size(directory):>14,} {compiled:>10}")
+    if outputs["串流 inline"] != outputs["舊版 (join)"] + "\n":
+        raise AssertionError("串流寫出的內容與舊版不一致")
+    print("驗證通過: 串流寫出的標頭檔與舊版內容相同。")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,81 @@
+"""
+輸入法索引冷啟動、記憶體與查詢吞吐量的基準測試。
+
+分別在獨立子行程中載入 JSON .idx/.dat 與 mmap 的 .imx，
+報告載入時間、行程的 RSS 增量，以及每秒查詢數。.imx 的查詢結果有快取 (IME_LOOKUP_CACHE_SIZE)，
+因此分開報告第一輪 (每個 key 都是第一次查詢，需在 mmap 上二分搜尋) 與之後重複查詢的速度。
+
+用法 (於專案根目錄執行):
+    python benchmarks/bench_ime_index.py
+"""
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+sys.path.insert(0, ROOT)
+
+JSON_IDX_PATH = os.path.join(ROOT, "output_data", "zhuyin.idx")
+JSON_DAT_PATH = os.path.join(ROOT, "output_data", "zhuyin.dat")
+BINARY_IDX_PATH = os.path.join(ROOT, "output_data", "zhuyin.imx")
+QUERY_ROUNDS = 20
+
+
+def max_rss_kb():
+    # Linux 上 ru_maxrss 的單位是 KB
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def child(mode):
+    import main
+    with open(JSON_IDX_PATH, "r", encoding="utf-8") as f:
+        query_codes = list(json.load(f)) + ["ㄅㄚ9", "ㄪ1"]
+
+    rss_before = max_rss_kb()
+    start = time.perf_counter()
+    if mode == "json":
+        index = main.JsonImeIndex(JSON_IDX_PATH, JSON_DAT_PATH)
+    else:
+        index = main.BinaryImeIndex(BINARY_IDX_PATH)
+    load_time = time.perf_counter() - start
+    rss_after = max_rss_kb()
+
+    start = time.perf_counter()
+    for code in query_codes:
+        index.lookup(code)
+    first_time = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(QUERY_ROUNDS):
+        for code in query_codes:
+            index.lookup(code)
+    query_time = time.perf_counter() - start
+    cache = getattr(index, "_lookup_cache", {})
+    cache_bytes = sys.getsizeof(cache) + sum(sys.getsizeof(key) + sys.getsizeof(value) for key, value in cache.items())
+    index.close()
+    print(json.dumps({
+        "mode": mode, "load_ms": load_time * 1000, "rss_delta_kb": rss_after - rss_before,
+        "cache_kb": cache_bytes / 1024,
+        "first_queries_per_s": len(query_codes) / first_time,
+        "queries_per_s": QUERY_ROUNDS * len(query_codes) / query_time,
+    }))
+
+
+def run():
+    print(f"{'格式':<8} {'冷啟動 (ms)':>12} {'RSS 增量 (KB)':>14} {'查詢快取 (KB)':>12} {'首輪查詢/秒':>12} {'重複查詢/秒':>12}")
+    for mode in ("json", "binary"):
+        output = subprocess.run([sys.executable, __file__, "--child", mode],
+                                capture_output=True, text=True, check=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"{mode:<8} {result['load_ms']:>12.2f} {result['rss_delta_kb']:>14} {result['cache_kb']:>12,.0f} "
+              f"{result['first_queries_per_s']:>12,.0f} {result['queries_per_s']:>12,.0f}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "--child":
+        child(sys.argv[2])
+    else:
+        run()
@@ -0,0 +1,112 @@
+"""
+大型輸入法索引 (區塊索引，.imx 版本 2) 的建置與查詢基準測試。
+
+以內建 zhuyin.imx 的讀音兩兩組合產生 1M 筆以上的合成詞庫 (遠超過 ImeIndexRecord_Opt 的 64 KB 上限)，
+報告打包時間、檔案大小、載入時間，以及命中/未命中查詢與前綴搜尋每次按鍵的延遲 (平均與 p99)。
+
+用法 (於專案根目錄執行):
+    python benchmarks/bench_ime_index_scale.py [--entries 1200000] [--block-size 16]
+"""
+import argparse
+import os
+import random
+import struct
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "tools"))
+
+import main
+import full_hardcode_converter as converter
+
+QUERY_COUNT = 20000
+PREFIX_QUERY_COUNT = 2000
+
+
+def build_synthetic_map(entries, seed=0):
+    """讀音兩兩組合成 "a-b" 形式的 key，資料為 1~8 個兩字詞 (帶 1 byte 詞數，與詞庫格式相同)。"""
+    index = main.BinaryImeIndex(main.IME_IDX_PATH)
+    syllables = [index.key_at(position).decode("utf-8") for position in range(index.count)]
+    chars = "".join(index.candidates_at(position)[:1] for position in range(index.count))
+    index.close()
+    rng = random.Random(seed)
+    pairs = rng.sample(range(len(syllables) ** 2), min(entries, len(syllables) ** 2))
+    synthetic = {}
+    for pair in pairs:
+        first, second = divmod(pair, len(syllables))
+        count = rng.randint(1, 8)
+        phrases = "".join(rng.choice(chars) + rng.choice(chars) for _ in range(count))
+        synthetic[f"{syllables[first]}-{syllables[second]}"] = bytes([count] + [40] * count) + phrases.encode("utf-8")
+    return synthetic
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return sum(samples) / len(samples) * 1e6, samples[int(len(samples) * 0.99)] * 1e6
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, default=1200000, help="合成詞庫的 key 數")
+    parser.add_argument("--block-size", type=int, default=converter.IME_INDEX_BLOCK_SIZE, help="每個區塊的 key 數")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    synthetic = build_synthetic_map(args.entries)
+    print(f"合成詞庫: {len(synthetic):,} 個 key，產生耗時 {time.perf_counter() - start:.1f} 秒")
+
+    try:
+        converter.pack_ime_index(synthetic, layout="flat")
+        print("平坦索引 (版本 1): 打包成功")
+    except struct.error:
+        print("平坦索引 (版本 1): 超過 16-bit 位移上限，無法打包")
+
+    start = time.perf_counter()
+    idx_data, pool_data = converter.pack_ime_index(synthetic, layout="blocked", block_size=args.block_size)
+    pack_time = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, "synthetic.imx")
+        converter.write_ime_index_file(path, idx_data, pool_data)
+        print(f"區塊索引 (版本 2, 每區塊 {args.block_size} 個 key): 打包 {pack_time:.1f} 秒，"
+              f"檔案 {os.path.getsize(path):,} bytes (索引 {len(idx_data):,} + 資料池 {len(pool_data):,})")
+
+        start = time.perf_counter()
+        index = main.BinaryImeIndex(path)
+        print(f"載入: {(time.perf_counter() - start) * 1000:.2f} ms")
+
+        rng = random.Random(1)
+        keys = list(synthetic)
+        hits = [rng.choice(keys) for _ in range(QUERY_COUNT)]
+        misses = [key + "9" for key in hits]
+        print(f"{'查詢':<12} {'平均 (µs)':>10} {'p99 (µs)':>10}")
+        for label, queries in (("命中", hits), ("未命中", misses)):
+            samples = []
+            for code in queries:
+                query_start = time.perf_counter()
+                result = index.lookup(code)
+                samples.append(time.perf_counter() - query_start)
+                if label == "命中" and result.encode("utf-8") != synthetic[code]:
+                    raise AssertionError(f"{code}: 查詢結果不一致")
+            average, p99 = percentiles(samples)
+            print(f"{label:<12} {average:>10.1f} {p99:>10.1f}")
+
+        samples = []
+        for code in hits[:PREFIX_QUERY_COUNT]:
+            prefix_search = main.PrefixSearch(index)
+            for end in range(1, len(code) + 1):
+                query_start = time.perf_counter()
+                prefix_search.update(code[:end])
+                samples.append(time.perf_counter() - query_start)
+        average, p99 = percentiles(samples)
+        print(f"{'前綴搜尋/鍵':<12} {average:>10.1f} {p99:>10.1f}")
+        index.close()
+    print(f"驗證通過: {QUERY_COUNT} 筆命中查詢的結果與原始資料一致。")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,98 @@
+"""
+各輸入法方案 (注音、倉頡、拼音、行列) 的建置與查詢基準測試。
+
+對每個方案：若 ime_data/ 中有它的碼表，以轉換工具重新建置並報告建置時間；否則改用 output_data/ 中既有的 .imx。
+報告檔案大小、第一次切換到該方案的載入時間、完整查詢的吞吐量，以及逐鍵前綴搜尋 (predict) 的延遲 (平均與 p99)。
+碼表與 .imx 都不存在的方案會略過。
+
+用法 (於專案根目錄執行):
+    python benchmarks/bench_ime_schemes.py [--queries 2000]
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "tools"))
+
+import main
+import full_hardcode_converter as converter
+
+LOOKUP_ROUNDS = 3
+
+
+def build_scheme(name, path):
+    """在 tools/ 目錄下執行轉換 (碼表路徑相對於 tools/)，找不到碼表時回傳 None。"""
+    cwd = os.getcwd()
+    os.chdir(os.path.join(ROOT, "tools"))
+    try:
+        if not all(os.path.exists(source) for source in converter.IME_SCHEMES[name]["sources"]):
+            return None
+        start = time.perf_counter()
+        idx_data, pool_data = converter.convert_ime_optimized(name)
+        build_time = time.perf_counter() - start
+    finally:
+        os.chdir(cwd)
+    if idx_data is None:
+        return None
+    converter.write_ime_index_file(path, idx_data, pool_data)
+    return build_time
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return sum(samples) / len(samples) * 1e6, samples[int(len(samples) * 0.99)] * 1e6
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=2000, help="每個方案逐鍵輸入的查詢碼數")
+    args = parser.parse_args()
+
+    print(f"{'方案':<8} {'建置 (ms)':>10} {'檔案 (bytes)':>12} {'key 數':>8} {'載入 (ms)':>10} "
+          f"{'查詢/秒':>10} {'逐鍵平均 (µs)':>14} {'逐鍵 p99 (µs)':>14}")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for config in main.IME_SCHEMES:
+            name = config["name"]
+            path = os.path.join(temp_dir, f"{name}.imx")
+            build_time = build_scheme(name, path)
+            if build_time is None:
+                if not os.path.exists(os.path.join(ROOT, config["idx_path"])) or not config["idx_path"].endswith(".imx"):
+                    print(f"{name:<8} (找不到碼表與 .imx，已略過)")
+                    continue
+                shutil.copyfile(os.path.join(ROOT, config["idx_path"]), path)
+
+            scheme = main.ImeScheme(**dict(config, idx_path=path, phrase_path=None))
+            start = time.perf_counter()
+            scheme.load()
+            load_time = time.perf_counter() - start
+
+            codes = [scheme.index.key_at(position).decode("utf-8") for position in range(scheme.index.count)]
+            start = time.perf_counter()
+            for _ in range(LOOKUP_ROUNDS):
+                for code in codes:
+                    scheme.index.lookup(code)
+            lookups_per_second = LOOKUP_ROUNDS * len(codes) / (time.perf_counter() - start)
+
+            samples = []
+            for code in random.Random(0).choices(codes, k=args.queries):
+                prefix_search = main.PrefixSearch(scheme.index)
+                for end in range(1, len(code) + 1):
+                    query_start = time.perf_counter()
+                    prefix_search.update(code[:end])
+                    samples.append(time.perf_counter() - query_start)
+            average, p99 = percentiles(samples)
+            build_display = f"{build_time * 1000:.1f}" if build_time is not None else "-"
+            print(f"{name:<8} {build_display:>10} {os.path.getsize(path):>12,} {len(codes):>8,} {load_time * 1000:>10.2f} "
+                  f"{lookups_per_second:>10,.0f} {average:>14.1f} {p99:>14.1f}")
+            scheme.close()
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,257 @@
+"""
+模擬器執行期的 headless 重播基準測試。
+
+以 SDL 的 dummy 視訊驅動程式 (不開視窗) 建立與 main.py 相同的畫面，把按鍵序列逐一交給
+ImeSession.handle_key 與 SimulatorScreen.render，走的是與互動模式完全相同的輸入法與上屏邏輯。
+按鍵序列可以是 `python main.py --record trace.jsonl` 錄下的記錄，或由一段文字自動產生
+(每個字以能選到它的注音碼輸入，一聲不打聲調，再以 = 翻頁並按空白鍵或數字鍵選字；
+逐字模式選不到的字改用整句模式打出包含它的詞)。打不出的字超過 MAX_SKIPPED_FRACTION 時視為失敗。報告：
+
+    啟動時間      pygame 初始化、載入字型與輸入法、第一次整屏繪製
+    按鍵延遲      handle_key 的 p50 / p90 / p99 / 最大值
+    影格時間      handle_key + render + display.update 的分佈 (直方圖)
+    統計          FontRenderer、ImeEngine 與 RenderStats 的計數
+
+重播不依照記錄的時間間隔等待，而是一個接一個送出。
+
+用法 (於專案根目錄執行):
+    python benchmarks/bench_runtime_replay.py [--trace trace.jsonl] [--text 檔案.txt] [--repeat 3]
+"""
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.environ["SDL_VIDEODRIVER"] = "dummy"
+sys.path.insert(0, ROOT)
+
+import pygame
+
+import main
+
+# 注音的數字鍵都是字根，逐字模式只能以空白鍵選每頁第一個候選字，範例只用實際打得出的字 (標點也打不出來)
+SAMPLE_TEXT = (
+    "我們今天在學校學打中文大家說只要多練習就會打得很好"
+    "這個小小的畫面可以看到很多東西也可以用一個一個地把要說的話打出來"
+)
+# 由文字產生按鍵序列時，打不出的字超過這個比例就中止，避免量到的只是一小部分的文字
+MAX_SKIPPED_FRACTION = 0.05
+# 影格時間直方圖的區間上限 (毫秒)；16.7 ms 約為 60 FPS，33.3 ms 約為 30 FPS
+HISTOGRAM_BOUNDS_MS = (1, 2, 4, 8, 16.7, 33.3)
+HISTOGRAM_WIDTH = 40
+
+
+def build_reverse_map(index):
+    """字 -> 它所有的按鍵碼，依字在該碼的名次排序 (最前面的通常是最常見的讀音)。"""
+    codes = {}
+    for position in range(index.count):
+        code = index.key_at(position).decode("utf-8")
+        for rank, char in enumerate(index.candidates_at(position)):
+            codes.setdefault(char, []).append((rank, code))
+    return {char: [code for _, code in sorted(ranked)] for char, ranked in codes.items()}
+
+
+def code_to_keys(scheme, code):
+    """
+    把按鍵碼拆回鍵盤上的按鍵 (依字根長度由長到短比對)，拆不出來時回傳 None。
+    結尾的隱含聲調 (注音的一聲 "1") 沒有按鍵，不打即可，前綴搜尋會把「碼 + 一聲」當作完全符合排在最前面。
+    """
+    if scheme.implied_tone and code.endswith(scheme.implied_tone):
+        code = code[:-len(scheme.implied_tone)]
+    key_of = {scheme.to_code([symbol]): key for key, symbol in scheme.key_map.items()}
+    lengths = sorted({len(part) for part in key_of}, reverse=True)
+    keys, position = [], 0
+    while position < len(code):
+        for length in lengths:
+            key = key_of.get(code[position:position + length])
+            if key is not None:
+                keys.append(key)
+                position += length
+                break
+        else:
+            return None
+    return keys
+
+
+def text_to_trace(ime, text):
+    """
+    用一個獨立的 ImeSession 實際打一次 text，記下每個按鍵 (t, 按鍵代碼, 字元)。
+    逐字模式選不到的字 (注音的數字鍵都是字根，只能以空白鍵選每頁第一個)，改以整句模式打出包含它的詞。
+    重播時使用全新的使用者字頻，因此候選字順序與產生時相同。
+    """
+    session = main.ImeSession(ime)
+    reverse_map = build_reverse_map(ime.index)
+    events, skipped = [], 0
+
+    def press(key, unicode=""):
+        events.append((len(events) * 0.1, key, unicode))
+        session.handle_key(key, unicode)
+
+    position = 0
+    while position < len(text):
+        # 選字會調整使用者字頻，候選字順序隨之改變，因此每次都以目前的狀態重新規劃
+        plans = [plan_char(ime, char, reverse_map.get(char, ()))
+                 for char in text[position:position + main.MAX_PHRASE_SYLLABLES]]
+        phrase_keys = None
+        if ime.scheme.tone_map is not None:
+            for length in range(main.MAX_PHRASE_SYLLABLES, 1, -1):
+                if None in plans[:length]:
+                    phrase_keys = plan_phrase(ime, text[position:position + length], reverse_map)
+                    if phrase_keys is not None:
+                        break
+        if phrase_keys is not None:
+            press(pygame.K_TAB)
+            for key in phrase_keys:
+                press(pygame.K_SPACE if key == " " else pygame.key.key_code(key), key)
+            press(pygame.K_SPACE, " ")
+            press(pygame.K_TAB)
+            position += length
+            continue
+        if plans[0] is None:
+            skipped += 1
+        else:
+            keys, rank = plans[0]
+            for key in keys:
+                press(pygame.key.key_code(key), key)
+            for _ in range(rank // main.CANDIDATES_PER_PAGE):
+                press(pygame.K_EQUALS, "=")
+            digit = str(rank % main.CANDIDATES_PER_PAGE + 1)
+            if digit == "1":
+                press(pygame.K_SPACE, " ")
+            else:
+                press(pygame.key.key_code(digit), digit)
+        position += 1
+    return events, skipped
+
+
+def plan_char(ime, char, codes):
+    """
+    依序嘗試 char 的各個按鍵碼，回傳第一個能在逐字模式選到它的 (按鍵, 名次)；都不行時回傳 None。
+    後面的頁以 = 翻到；數字鍵同時是字根鍵時 (例如注音的 ㄅ、ㄉ) 無法用來選字，只能選每頁第一個 (空白鍵)。
+    """
+    for code in codes:
+        keys = code_to_keys(ime.scheme, code)
+        if keys is None:
+            continue
+        # 先打完整的碼，選不到時改打較短的前綴 (候選字的排列不同，字可能剛好落在某頁的第一個)
+        for length in range(len(keys), 0, -1):
+            rank = ime.predict(ime.scheme.to_code([ime.scheme.key_map[key] for key in keys[:length]])).find(char)
+            digit = str(rank % main.CANDIDATES_PER_PAGE + 1)
+            if rank >= 0 and (digit == "1" or digit not in ime.scheme.key_map):
+                return keys[:length], rank
+    return None
+
+
+def plan_phrase(ime, word, reverse_map):
+    """
+    以每個字最常見的讀音在整句模式組字，組出的正好是 word 時回傳各音節的按鍵 (一聲以空白鍵結束)，否則回傳 None。
+    """
+    composer = ime.composer
+    keys = []
+    for char in word:
+        codes = reverse_map.get(char)
+        syllable_keys = code_to_keys(ime.scheme, codes[0]) if codes else None
+        if syllable_keys is None:
+            return None
+        composer.push(codes[0])
+        keys += syllable_keys
+        if ime.scheme.implied_tone and codes[0].endswith(ime.scheme.implied_tone):
+            keys.append(" ")
+    composed_text = composer.text()
+    composer.clear()
+    return keys if composed_text == word else None
+
+
+def percentile(sorted_samples, fraction):
+    return sorted_samples[min(len(sorted_samples) - 1, int(len(sorted_samples) * fraction))]
+
+
+def print_histogram(samples_ms):
+    labels = [f"< {bound} ms" for bound in HISTOGRAM_BOUNDS_MS] + [f">= {HISTOGRAM_BOUNDS_MS[-1]} ms"]
+    counts = [0] * len(labels)
+    for sample in samples_ms:
+        counts[next((i for i, bound in enumerate(HISTOGRAM_BOUNDS_MS) if sample < bound), len(HISTOGRAM_BOUNDS_MS))] += 1
+    peak = max(counts) or 1
+    for label, count in zip(labels, counts):
+        print(f"  {label:>12} {count:>7,} {'#' * round(count / peak * HISTOGRAM_WIDTH)}")
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--trace", help="main.py --record 錄下的按鍵記錄 (JSON Lines)")
+    parser.add_argument("--text", help="用來產生按鍵序列的 UTF-8 文字檔 (預設使用內建範例)")
+    parser.add_argument("--repeat", type=int, default=3, help="重播次數 (每次都從空白的編輯區開始)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    pygame.init()
+    screen = pygame.display.set_mode((main.SCREEN_WIDTH, main.SCREEN_HEIGHT))
+    renderer = main.FontRenderer(main.FONT_MAP_PATH, main.FONT_DATA_PATH, fallback_paths=main.FONT_FALLBACK_PATHS)
+    ime = main.ImeEngine(main.IME_SCHEMES)
+    simulator_screen = main.SimulatorScreen(screen, renderer)
+    simulator_screen.render(main.ImeSession(ime))
+    pygame.display.flip()
+    startup_time = time.perf_counter() - start
+
+    if args.trace:
+        events, skipped = main.load_key_trace(args.trace), 0
+    else:
+        text = SAMPLE_TEXT
+        if args.text:
+            with open(args.text, "r", encoding="utf-8") as f:
+                text = f.read()
+        events, skipped = text_to_trace(ime, text)
+        if skipped > len(text) * MAX_SKIPPED_FRACTION:
+            raise SystemExit(f"錯誤: {len(text)} 個字中有 {skipped} 個無法輸入 (上限 {MAX_SKIPPED_FRACTION:.0%})，"
+                             "按鍵序列不能代表這段文字。")
+    initial_scheme = ime.scheme.name
+
+    render_stats = main.RenderStats((main.SCREEN_WIDTH, main.SCREEN_HEIGHT))
+    key_samples, frame_samples = [], []
+    for _ in range(args.repeat):
+        ime.switch(initial_scheme)
+        ime.composer.clear()
+        ime.user_frequency = main.UserFrequency()
+        session = main.ImeSession(ime)
+        simulator_screen.invalidate()
+        for _, key, unicode in events:
+            frame_start = time.perf_counter()
+            session.handle_key(key, unicode)
+            key_end = time.perf_counter()
+            dirty_rects, full_redraw = simulator_screen.render(session)
+            if full_redraw:
+                pygame.display.flip()
+            elif dirty_rects:
+                pygame.display.update(dirty_rects)
+            frame_end = time.perf_counter()
+            render_stats.record(dirty_rects)
+            key_samples.append((key_end - frame_start) * 1000)
+            frame_samples.append((frame_end - frame_start) * 1000)
+
+    print(f"啟動時間: {startup_time * 1000:.1f} ms")
+    print(f"按鍵數: {len(events):,} x {args.repeat} 次" + (f" ({skipped} 個字無法輸入，已略過)" if skipped else ""))
+    if not key_samples:
+        print("沒有可重播的按鍵。")
+    else:
+        print(f"{'':<10} {'p50 (ms)':>10} {'p90 (ms)':>10} {'p99 (ms)':>10} {'最大 (ms)':>10}")
+        for label, samples in (("按鍵處理", key_samples), ("影格", frame_samples)):
+            samples = sorted(samples)
+            print(f"{label:<10} {percentile(samples, 0.5):>10.3f} {percentile(samples, 0.9):>10.3f} "
+                  f"{percentile(samples, 0.99):>10.3f} {samples[-1]:>10.3f}")
+        print("影格時間分佈:")
+        print_histogram(frame_samples)
+        print(f"最後一次的上屏文字: {session.editor_content[:40]}{'...' if len(session.editor_content) > 40 else ''}")
+
+    print(f"字型渲染器: {renderer.stats()}")
+    print(f"輸入法引擎: {ime.stats()}")
+    stats = render_stats.stats()
+    print(f"畫面推送: {stats['bytes_pushed']:,} bytes，平均每影格 {stats['avg_bytes_per_frame']:,.0f} bytes "
+          f"(整屏 flip 需 {stats['full_flip_bytes']:,} bytes)")
+    renderer.close()
+    ime.close()
+    pygame.quit()
+
+
+if __name__ == "__main__":
+    run()
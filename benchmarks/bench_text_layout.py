@@ -0,0 +1,66 @@
+"""
+編輯區排版的基準測試。
+
+在不同長度的文件末端逐字輸入，比較舊版每個影格從頭以 measure_string
+重新斷行 (O(n²)) 與 TextLayout 增量排版每次按鍵所需的時間。
+
+用法 (於專案根目錄執行):
+    python benchmarks/bench_text_layout.py
+"""
+import os
+import sys
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+
+DOCUMENT_SIZES = (500, 2000, 5000)
+KEYSTROKES = 20
+SAMPLE = "中文輸入法測試，這是一段用來排版的文字。PicoType simulator 12px. "
+MAX_WIDTH = main.EDITOR_AREA_RECT.width - 10
+
+
+def legacy_layout(renderer, text):
+    """舊版 main() 中的斷行方式。"""
+    lines, current_line = [], ""
+    for char in text:
+        test_line = current_line + char
+        if renderer.measure_string(test_line) > MAX_WIDTH:
+            lines.append(current_line)
+            current_line = char
+        else:
+            current_line = test_line
+    lines.append(current_line)
+    return lines
+
+
+def measure(renderer, size):
+    document = (SAMPLE * (size // len(SAMPLE) + 1))[:size]
+    start = time.perf_counter()
+    for i in range(KEYSTROKES):
+        legacy_layout(renderer, document + SAMPLE[:i + 1])
+    legacy = (time.perf_counter() - start) / KEYSTROKES
+
+    layout = main.TextLayout(renderer.char_advance, MAX_WIDTH)
+    layout.update(document)
+    start = time.perf_counter()
+    for i in range(KEYSTROKES):
+        layout.update(document + SAMPLE[:i + 1])
+    incremental = (time.perf_counter() - start) / KEYSTROKES
+    return legacy, incremental
+
+
+def run():
+    renderer = main.FontRenderer(main.FONT_MAP_PATH, main.FONT_DATA_PATH)
+    print(f"{'字數':>6} {'舊版 (ms/鍵)':>14} {'增量 (ms/鍵)':>14}")
+    for size in DOCUMENT_SIZES:
+        legacy, incremental = measure(renderer, size)
+        print(f"{size:>6} {legacy * 1000:>14.2f} {incremental * 1000:>14.3f}")
+    print(f"(一個影格的預算為 {1000 / main.FPS:.1f} ms)")
+    renderer.close()
+
+
+if __name__ == "__main__":
+    run()
@@ -1,8 +1,14 @@
 # (這裡貼上包含所有翻頁功能修改的完整 main.py 程式碼)
 import pygame
+import array
+import bisect
 import json
+import mmap
 import os
 import random
+import struct
+import sys
+from collections import OrderedDict, namedtuple
 
 # --- 配置 ---
 SCREEN_WIDTH = 320
@@ -10,10 +16,17 @@ SCREEN_HEIGHT = 240
 FPS = 30
 
 # 資源檔案路徑
-FONT_MAP_PATH = "output_data/Cubic_11.ttf_12.map"
+FONT_MAP_PATH = "output_data/Cubic_11.ttf_12.fmap" # 舊版 JSON .map 仍可使用
 FONT_DATA_PATH = "output_data/Cubic_11.ttf_12.font"
-IME_IDX_PATH = "output_data/zhuyin.idx"
-IME_DAT_PATH = "output_data/zhuyin.dat"
+# 主要字型缺字時依序嘗試的字型 [(.fmap, .font), ...]，例如轉換工具建置矩陣輸出的其他字型；不存在的會略過
+FONT_FALLBACK_PATHS = []
+IME_IDX_PATH = "output_data/zhuyin.imx" # 舊版 JSON .idx 仍可使用
+IME_DAT_PATH = "output_data/zhuyin.dat" # 只有 JSON .idx 需要
+USER_FREQ_PATH = "output_data/user_freq.json" # 使用者選字次數，跨次執行保存
+PHRASE_IDX_PATH = "output_data/zhuyin_phrase.imx" # 詞庫 (可選)，整句模式使用
+CANGJIE_IDX_PATH = "output_data/cangjie.imx" # 以下方案的碼表需另行放入 ime_data/ 後以轉換工具產生，缺檔時略過
+PINYIN_IDX_PATH = "output_data/pinyin.imx"
+ARRAY_IDX_PATH = "output_data/array.imx"
 
 # UI 顏色和佈局
 COLOR_BACKGROUND = (20, 30, 40)
@@ -25,247 +38,1645 @@ INPUT_AREA_RECT = pygame.Rect(10, 10, SCREEN_WIDTH - 20, 40)
 CANDIDATE_AREA_RECT = pygame.Rect(10, 60, SCREEN_WIDTH - 20, 40)
 EDITOR_AREA_RECT = pygame.Rect(10, 110, SCREEN_WIDTH - 20, SCREEN_HEIGHT - 120)
 
+# 字形快取的記憶體上限 (bytes)，以 RGBA Surface 的像素大小估算；啟用圖集時為圖集頁的上限
+GLYPH_CACHE_BUDGET = 2 * 1024 * 1024
+# 字形圖集: True 時 draw_string 從少數幾張大 Surface (圖集) 以一次 Surface.blits 畫出整個字串；
+# False 時每個字一個 Surface (經過 GlyphCache)。兩者的排版相同，見 FontRenderer.glyph_metrics
+GLYPH_ATLAS_ENABLED = True
+GLYPH_ATLAS_PAGE_SIZE = (512, 512) # 每頁圖集的像素大小，頁數上限由 GLYPH_CACHE_BUDGET 決定
+GLYPH_ATLAS_PADDING = 1 # 字形之間保留的空白像素，避免縮放或取樣時相鄰字形滲色
+
+# --- 核心類別：字形快取 ---
+class GlyphCache:
+    """
+    以 (unicode, color) 為鍵的 LRU 快取，超過位元組上限時淘汰最久未使用的字形。
+    只用於停用圖集 (GLYPH_ATLAS_ENABLED = False) 時的每字 Surface；啟用圖集時由 GlyphAtlas 取代。
+    """
+    def __init__(self, max_bytes=GLYPH_CACHE_BUDGET):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        surface = self._entries.get(key)
+        if surface is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return surface
+
+    def put(self, key, surface):
+        size = self._surface_bytes(surface)
+        if size > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.current_bytes -= self._surface_bytes(old)
+        self._entries[key] = surface
+        self.current_bytes += size
+        while self.current_bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.current_bytes -= self._surface_bytes(evicted)
+            self.evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+        self.current_bytes = 0
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries), "bytes": self.current_bytes, "max_bytes": self.max_bytes,
+            "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    @staticmethod
+    def _surface_bytes(surface):
+        return surface.get_width() * surface.get_height() * surface.get_bytesize()
+
+# --- 核心類別：字形圖集 ---
+class ShelfPacker:
+    """
+    Shelf 裝箱：矩形由上往下排成一層層的 shelf (高度為該層第一個矩形的高度)。
+    新矩形放進高度足夠、浪費不超過一半且還有寬度的第一層，否則在下方開新的一層。
+    中文字形的高度大多相同，幾乎不會浪費空間。
+    """
+    def __init__(self, width, height, padding=GLYPH_ATLAS_PADDING):
+        self.width = width
+        self.height = height
+        self.padding = padding
+        self.shelves = [] # [y, 高度, 下一個 x]
+        self.used_height = 0
+
+    def insert(self, width, height):
+        """回傳放置位置 (x, y)；放不下時回傳 None。"""
+        width, height = width + self.padding, height + self.padding
+        if width > self.width:
+            return None
+        for shelf in self.shelves:
+            shelf_y, shelf_height, next_x = shelf
+            if height <= shelf_height and height * 2 >= shelf_height and next_x + width <= self.width:
+                shelf[2] += width
+                return next_x, shelf_y
+        if self.used_height + height > self.height:
+            return None
+        self.shelves.append([self.used_height, height, width])
+        self.used_height += height
+        return 0, self.used_height - height
+
+    def reset(self):
+        self.shelves = []
+        self.used_height = 0
+
+AtlasGlyph = namedtuple("AtlasGlyph", "page area x_offset y_offset x_advance")
+
+class GlyphAtlas:
+    """
+    以 (unicode, color) 為鍵，把字形打包進幾張大的 SRCALPHA Surface (頁)。字形第一次用到時才放入 (也可用 preload 預先放入)，
+    draw_string 只需收集各字在圖集中的區域，再以一次 Surface.blits 畫出。
+    頁數達到 max_bytes 上限且都放滿時清空整個圖集重新開始 (generation 加 1)。
+    """
+    def __init__(self, render_glyph, page_size=GLYPH_ATLAS_PAGE_SIZE, max_bytes=GLYPH_CACHE_BUDGET):
+        self.render_glyph = render_glyph # (char, color) -> (Surface, x_offset, y_offset, x_advance)
+        self.page_size = page_size
+        self.max_pages = max(1, max_bytes // (page_size[0] * page_size[1] * 4))
+        self.pages = []
+        self.packers = []
+        self.entries = {}
+        self.used_area = 0 # 已放入圖集頁的字形面積 (不含比整頁還大的字形)
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, char, color):
+        key = (ord(char), color)
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.hits += 1
+            return entry
+        self.misses += 1
+        surface, x_offset, y_offset, x_advance = self.render_glyph(char, color)
+        page, position = self._allocate(surface.get_width(), surface.get_height())
+        if page is None:
+            entry = AtlasGlyph(surface, surface.get_rect(), x_offset, y_offset, x_advance) # 比整頁還大的字形不放入圖集
+        else:
+            self.pages[page].blit(surface, position)
+            self.used_area += surface.get_width() * surface.get_height()
+            entry = AtlasGlyph(self.pages[page], pygame.Rect(position, surface.get_size()), x_offset, y_offset, x_advance)
+        self.entries[key] = entry
+        return entry
+
+    def preload(self, chars, color):
+        for char in chars:
+            self.get(char, color)
+
+    def _allocate(self, width, height):
+        # 比整頁還大的字形連空白的新頁也放不下，直接略過，不要為它清空整個圖集
+        if width + GLYPH_ATLAS_PADDING > self.page_size[0] or height + GLYPH_ATLAS_PADDING > self.page_size[1]:
+            return None, None
+        for page, packer in enumerate(self.packers):
+            position = packer.insert(width, height)
+            if position is not None:
+                return page, position
+        if len(self.pages) >= self.max_pages:
+            self.clear()
+        self.pages.append(pygame.Surface(self.page_size, pygame.SRCALPHA))
+        self.packers.append(ShelfPacker(*self.page_size))
+        return len(self.pages) - 1, self.packers[-1].insert(width, height)
+
+    def clear(self):
+        self.pages = []
+        self.packers = []
+        self.entries = {}
+        self.used_area = 0
+        self.generation += 1
+
+    def stats(self):
+        page_area = self.page_size[0] * self.page_size[1]
+        total = self.hits + self.misses
+        return {
+            "entries": len(self.entries), "pages": len(self.pages), "max_pages": self.max_pages,
+            "bytes": len(self.pages) * page_area * 4, "resets": self.generation,
+            "occupancy": self.used_area / (len(self.pages) * page_area) if self.pages else 0.0,
+            "hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0,
+        }
+
+# --- 點陣圖轉換 ---
+def _channel_table(value):
+    """建立 bytes.translate 用的對照表：灰階 0 對應 0，其餘對應指定的通道值。"""
+    return bytes([0]) + bytes([value]) * 255
+
+def grayscale_to_surface(pixel_data, width, height, color):
+    """
+    將 1-byte-grayscale 點陣圖一次轉換為 RGBA Surface。
+    灰階值即為 alpha；alpha 為 0 的像素輸出 (0, 0, 0, 0)，與逐點 set_at 的結果一致。
+    """
+    r, g, b = color[:3]
+    rgba = bytearray(width * height * 4)
+    rgba[0::4] = pixel_data.translate(_channel_table(r))
+    rgba[1::4] = pixel_data.translate(_channel_table(g))
+    rgba[2::4] = pixel_data.translate(_channel_table(b))
+    rgba[3::4] = pixel_data
+    return pygame.image.frombuffer(bytes(rgba), (width, height), 'RGBA')
+
+# --- 核心類別：文字排版 ---
+class TextLayout:
+    """
+    編輯區的增量排版：快取每個字的寬度與每行的起點。
+    文字變更時只從受影響的那一行開始重新斷行，且一旦新的斷行點與舊的斷行點
+    (扣除插入/刪除的字數後) 對齊就停止，之後的行直接沿用。
+    update() 回傳內容有變動的行號，呼叫端只需重繪這些行。
+    """
+    def __init__(self, char_advance, max_width):
+        self.char_advance = char_advance
+        self.max_width = max_width
+        self.reset()
+
+    def reset(self):
+        """清除所有快取，下一次 update 會重新排版全部文字。"""
+        self.text = ""
+        self.advances = []
+        self.line_starts = [0]
+
+    def line_count(self):
+        return len(self.line_starts)
+
+    def line_range(self, line_index):
+        start = self.line_starts[line_index]
+        end = self.line_starts[line_index + 1] if line_index + 1 < len(self.line_starts) else len(self.text)
+        return start, end
+
+    def line_text(self, line_index):
+        start, end = self.line_range(line_index)
+        return self.text[start:end]
+
+    def update(self, new_text):
+        old_text = self.text
+        if new_text == old_text:
+            return []
+        # 找出變動區段：共同前綴 prefix 與共同後綴 suffix 之間
+        limit = min(len(old_text), len(new_text))
+        if new_text.startswith(old_text) or old_text.startswith(new_text):
+            prefix = limit # 最常見的情況：在結尾輸入或刪除
+        else:
+            prefix = 0
+            while prefix < limit and old_text[prefix] == new_text[prefix]:
+                prefix += 1
+        suffix = 0
+        while suffix < limit - prefix and old_text[-1 - suffix] == new_text[-1 - suffix]:
+            suffix += 1
+        delta = len(new_text) - len(old_text)
+        edit_end = len(new_text) - suffix
+
+        self.advances[prefix:len(old_text) - suffix] = [self.char_advance(c) for c in new_text[prefix:edit_end]]
+        self.text = new_text
+
+        old_starts = self.line_starts
+        first_line = bisect.bisect_right(old_starts, prefix) - 1
+        # 變動點剛好在行首時，上一行的結尾可能也會改變 (例如刪字後能塞回上一行)
+        if first_line > 0 and old_starts[first_line] == prefix:
+            first_line -= 1
+        new_starts = old_starts[:first_line + 1]
+        old_start_set = set(old_starts[first_line + 1:])
+
+        position = new_starts[-1]
+        line_width = 0
+        converged_at = None
+        while position < len(new_text):
+            advance = self.advances[position]
+            if line_width + advance > self.max_width and position > new_starts[-1]:
+                if position >= edit_end and (position - delta) in old_start_set:
+                    converged_at = position
+                    break
+                new_starts.append(position)
+                line_width = 0
+            line_width += advance
+            position += 1
+
+        last_dirty = None
+        if converged_at is not None:
+            old_index = old_starts.index(converged_at - delta)
+            # 行數不變時，之後各行的內容與行號都沒變，不必重繪
+            if old_index == len(new_starts):
+                last_dirty = old_index - 1
+            new_starts.extend(start + delta for start in old_starts[old_index:])
+        if last_dirty is None:
+            last_dirty = max(len(new_starts), len(old_starts)) - 1
+        self.line_starts = new_starts
+        return list(range(first_line, last_dirty + 1))
+
+# --- 字型查找表 ---
+# 與 tools/full_hardcode_converter.py 的 FONT_MAP_FORMAT_OPTIMIZED / FONT_MAP_FILE_HEADER_FORMAT 相同
+FONT_MAP_RECORD_FORMAT = "<IIBBBbbB"
+FONT_MAP_RECORD_SIZE = struct.calcsize(FONT_MAP_RECORD_FORMAT)
+FONT_MAP_FILE_MAGIC = b"PTFM"
+FONT_MAP_FILE_HEADER_FORMAT = "<4sBBHI"
+FONT_MAP_FILE_HEADER_SIZE = struct.calcsize(FONT_MAP_FILE_HEADER_FORMAT)
+# 版本 2 的 .fmap 在紀錄後附加兩層分頁表 (與 FONT_PAGE_TABLE_HEADER_FORMAT 等相同)
+FONT_PAGE_TABLE_HEADER_FORMAT = "<HH"
+FONT_PAGE_SIZE = 256
+FONT_PAGE_EMPTY = 0xFFFF
+# 版本 3 的 .fmap 使用 8 bytes 的精簡紀錄，unicode 由區段表推得 (與 FONT_RANGE_FORMAT / FONT_MAP_COMPACT_FORMAT 相同)
+FONT_MAP_FILE_VERSION_COMPACT = 3
+FONT_RANGE_FORMAT = "<IH"
+FONT_RANGE_SIZE = struct.calcsize(FONT_RANGE_FORMAT)
+FONT_MAP_COMPACT_FORMAT = "<IBBbb"
+FONT_MAP_COMPACT_SIZE = struct.calcsize(FONT_MAP_COMPACT_FORMAT)
+BITMAP_FORMAT_NAMES = {0: "1-byte-grayscale", 1: "4-bit-grayscale", 2: "2-bit-grayscale", 3: "1-bit-mono"}
+BITMAP_FORMAT_BPP = {"1-byte-grayscale": 8, "4-bit-grayscale": 4, "2-bit-grayscale": 2, "1-bit-mono": 1}
+# 格式代碼的 bit 4-6 為壓縮方式
+BITMAP_COMPRESSION_NAMES = {0x00: None, 0x10: "rle"}
+# 格式代碼的最高位元: 紀錄有轉換工具算出的 x_advance / x_offset / y_offset (與 FONT_MAP_FLAG_METRICS 相同)
+FONT_MAP_FLAG_METRICS = 0x80
+
+FontMapRecord = namedtuple("FontMapRecord", "offset width height x_advance x_offset y_offset")
+
+class JsonFontMap:
+    """舊版 JSON .map 查找表 (鍵為字串化的 unicode，只有 offset/width/height)。"""
+    def __init__(self, map_path):
+        with open(map_path, 'r', encoding='utf-8') as f:
+            map_data = json.load(f)
+        self.metadata = map_data.get('metadata', {})
+        self.char_map = map_data.get('characters', {})
+
+    def __len__(self):
+        return len(self.char_map)
+
+    def lookup(self, codepoint):
+        entry = self.char_map.get(str(codepoint))
+        if entry is None:
+            return None
+        offset, width, height = entry
+        return FontMapRecord(offset, width, height, width, 0, 0)
+
+    def records(self):
+        for unicode_str in self.char_map:
+            yield int(unicode_str), self.lookup(int(unicode_str))
+
+    def close(self):
+        pass
+
+class _FontMapKeys:
+    """讓 bisect 直接在 mmap 的紀錄陣列 (或區段表) 上比較開頭的 unicode 欄位，不需要建立 list。"""
+    def __init__(self, data, count, offset=FONT_MAP_FILE_HEADER_SIZE, stride=FONT_MAP_RECORD_SIZE):
+        self.data = data
+        self.count = count
+        self.offset = offset
+        self.stride = stride
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        return struct.unpack_from("<I", self.data, self.offset + index * self.stride)[0]
+
+def _uint16_view(data, offset, count):
+    """把 mmap 中 little-endian 的 uint16 陣列當成可索引的序列，不複製資料 (大端平台才複製並轉換)。"""
+    if sys.byteorder == "little":
+        return memoryview(data)[offset:offset + count * 2].cast("H")
+    values = array.array("H", data[offset:offset + count * 2])
+    values.byteswap()
+    return values
+
+class BinaryFontMap:
+    """
+    mmap 的 .fmap 查找表：檔頭後接依 unicode 排序的 FontMapRecord_Opt 紀錄，
+    與韌體端的 font_map_opt 相同，啟動時不需解析。
+    版本 2 的檔案附有兩層分頁表，查詢只需兩次索引 (O(1))；版本 1 則以二分搜尋查詢。
+    版本 3 為精簡紀錄，unicode 由區段表推得；沒有分頁表時在區段表上二分搜尋。
+    """
+    def __init__(self, map_path):
+        self._directory = self._pages = None
+        self.map_file = open(map_path, 'rb')
+        self.data = mmap.mmap(self.map_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, format_code, font_size, count = struct.unpack_from(FONT_MAP_FILE_HEADER_FORMAT, self.data, 0)
+        if magic != FONT_MAP_FILE_MAGIC:
+            self.close()
+            raise ValueError(f"不是有效的 .fmap 檔案 (magic={magic!r})")
+        self.version = version
+        self.count = count
+        self.metadata = {
+            'font_name': os.path.splitext(os.path.basename(map_path))[0],
+            'font_size': font_size,
+            'format': BITMAP_FORMAT_NAMES.get(format_code & 0x0F, str(format_code & 0x0F)),
+            'compression': BITMAP_COMPRESSION_NAMES.get(format_code & 0x70, str(format_code & 0x70)),
+            'metrics': bool(format_code & FONT_MAP_FLAG_METRICS),
+        }
+        self.compact = version >= FONT_MAP_FILE_VERSION_COMPACT
+        if self.compact:
+            range_count = struct.unpack_from("<I", self.data, FONT_MAP_FILE_HEADER_SIZE)[0]
+            range_offset = FONT_MAP_FILE_HEADER_SIZE + 4
+            self._ranges = _FontMapKeys(self.data, range_count, range_offset, FONT_RANGE_SIZE)
+            self._records_offset = range_offset + range_count * FONT_RANGE_SIZE
+            self._record_size = FONT_MAP_COMPACT_SIZE
+        else:
+            self._keys = _FontMapKeys(self.data, count)
+            self._records_offset = FONT_MAP_FILE_HEADER_SIZE
+            self._record_size = FONT_MAP_RECORD_SIZE
+        table_offset = self._records_offset + count * self._record_size
+        if version >= 2 and table_offset < len(self.data):
+            directory_count, page_count = struct.unpack_from(FONT_PAGE_TABLE_HEADER_FORMAT, self.data, table_offset)
+            table_offset += struct.calcsize(FONT_PAGE_TABLE_HEADER_FORMAT)
+            self._directory = _uint16_view(self.data, table_offset, directory_count)
+            self._pages = _uint16_view(self.data, table_offset + directory_count * 2, page_count * FONT_PAGE_SIZE)
+
+    def __len__(self):
+        return self.count
+
+    def _record_at(self, index):
+        if self.compact:
+            offset_width, height, x_advance, x_offset, y_offset = struct.unpack_from(
+                FONT_MAP_COMPACT_FORMAT, self.data, self._records_offset + index * FONT_MAP_COMPACT_SIZE)
+            return FontMapRecord(offset_width & 0xFFFFFF, offset_width >> 24, height, x_advance, x_offset, y_offset)
+        _, offset, width, height, x_advance, x_offset, y_offset, _ = struct.unpack_from(
+            FONT_MAP_RECORD_FORMAT, self.data, self._records_offset + index * FONT_MAP_RECORD_SIZE)
+        return FontMapRecord(offset, width, height, x_advance, x_offset, y_offset)
+
+    def _range_at(self, range_index):
+        """回傳第 range_index 個區段的 (起點 unicode, 第一筆紀錄索引, 結束索引)。"""
+        first_unicode, first_index = struct.unpack_from(
+            FONT_RANGE_FORMAT, self.data, self._ranges.offset + range_index * FONT_RANGE_SIZE)
+        if range_index + 1 < len(self._ranges):
+            end_index = struct.unpack_from(
+                "<H", self.data, self._ranges.offset + (range_index + 1) * FONT_RANGE_SIZE + 4)[0]
+        else:
+            end_index = self.count
+        return first_unicode, first_index, end_index
+
+    def find(self, codepoint):
+        """回傳 codepoint 的紀錄索引，找不到時回傳 None。"""
+        if self._directory is not None:
+            page_number = codepoint >> 8
+            if page_number >= len(self._directory):
+                return None
+            index = self._pages[self._directory[page_number] * FONT_PAGE_SIZE + (codepoint & 0xFF)]
+            return None if index == FONT_PAGE_EMPTY else index
+        if self.compact:
+            range_index = bisect.bisect_right(self._ranges, codepoint) - 1
+            if range_index < 0:
+                return None
+            first_unicode, first_index, end_index = self._range_at(range_index)
+            index = first_index + codepoint - first_unicode
+            return index if index < end_index else None
+        index = bisect.bisect_left(self._keys, codepoint)
+        if index < self.count and self._keys[index] == codepoint:
+            return index
+        return None
+
+    def lookup(self, codepoint):
+        index = self.find(codepoint)
+        return None if index is None else self._record_at(index)
+
+    def records(self):
+        if self.compact:
+            for range_index in range(len(self._ranges)):
+                first_unicode, first_index, end_index = self._range_at(range_index)
+                for index in range(first_index, end_index):
+                    yield first_unicode + index - first_index, self._record_at(index)
+            return
+        for index in range(self.count):
+            yield self._keys[index], self._record_at(index)
+
+    def close(self):
+        # 必須先釋放 memoryview，否則 mmap 無法關閉
+        if isinstance(self._directory, memoryview):
+            self._directory.release()
+            self._pages.release()
+        self._directory = self._pages = None
+        self.data.close()
+        self.map_file.close()
+
+def _unpack_tables(bits_per_pixel):
+    """
+    為每個像素位置建立一張 bytes.translate 對照表：
+    第 i 張表把一個打包位元組對應到其中第 i 個像素還原後的 8-bit 灰階值。
+    """
+    max_level = (1 << bits_per_pixel) - 1
+    tables = []
+    for i in range(8 // bits_per_pixel):
+        shift = 8 - bits_per_pixel * (i + 1)
+        tables.append(bytes(((byte >> shift) & max_level) * 255 // max_level for byte in range(256)))
+    return tables
+
+_UNPACK_TABLES = {bpp: _unpack_tables(bpp) for bpp in (1, 2, 4)}
+
+def unpack_bitmap(packed, width, height, bits_per_pixel):
+    """
+    將每列補齊到整數位元組的 1/2/4 bpp 點陣圖還原為 width * height 的 8-bit 灰階。
+    每個像素位置各做一次 translate 後交錯寫回，全部在 C 層完成，不需逐像素的 Python 迴圈。
+    """
+    if bits_per_pixel == 8:
+        return bytes(packed)
+    tables = _UNPACK_TABLES[bits_per_pixel]
+    pixels_per_byte = len(tables)
+    packed = bytes(packed)
+    unpacked = bytearray(len(packed) * pixels_per_byte)
+    for i, table in enumerate(tables):
+        unpacked[i::pixels_per_byte] = packed.translate(table)
+    padded_width = len(unpacked) // height if height else 0
+    if padded_width == width:
+        return bytes(unpacked)
+    # 去掉每列補齊用的像素
+    return b"".join(unpacked[y * padded_width:y * padded_width + width] for y in range(height))
+
+def packed_bitmap_size(width, height, bits_per_pixel):
+    return (width * bits_per_pixel + 7) // 8 * height
+
+def rle_decode(data, offset, size):
+    """
+    解開轉換工具 rle_encode 產生的 PackBits 式行程編碼，輸出剛好 size 個位元組即停止。
+    控制位元組 c: 0x00-0x7F 複製後面 c + 1 個位元組；0x80-0xFF 將下一個位元組重複 c - 0x7E 次。
+    """
+    output = bytearray()
+    position = offset
+    while len(output) < size:
+        control = data[position]
+        if control < 0x80:
+            output += data[position + 1:position + control + 2]
+            position += control + 2
+        else:
+            output += data[position + 1:position + 2] * (control - 0x7E)
+            position += 2
+    return bytes(output[:size])
+
 # --- 核心類別：字型渲染器 (與上一版相同) ---
-class FontRenderer:
+class FontFace:
+    """一個字型 (.fmap 查找表 + mmap 的 .font 點陣圖資料池)。"""
     def __init__(self, map_path, font_path):
-        self.char_map = {}
+        self.font_map = None
         self.font_file = None
+        self.font_data = None
         self.metadata = {}
+        self.bits_per_pixel = 8
+        self.compression = None
+        self.has_metrics = False
         if not self._load_map(map_path) or not self._open_font_data(font_path):
-            raise RuntimeError("字型渲染器初始化失敗！")
-        print("字型渲染器初始化成功！")
+            self.close()
+            raise RuntimeError(f"無法載入字型 '{map_path}'")
 
     def _load_map(self, map_path):
         try:
-            with open(map_path, 'r', encoding='utf-8') as f:
-                map_data = json.load(f)
-                self.metadata = map_data.get('metadata', {})
-                self.char_map = map_data.get('characters', {})
-                print(f"成功載入 {len(self.char_map)} 個字元的查找表。")
-                return True
+            if map_path.endswith('.fmap'):
+                self.font_map = BinaryFontMap(map_path)
+            else:
+                self.font_map = JsonFontMap(map_path)
+            self.metadata = self.font_map.metadata
+            self.bits_per_pixel = BITMAP_FORMAT_BPP[self.metadata.get('format', '1-byte-grayscale')]
+            self.compression = self.metadata.get('compression')
+            self.has_metrics = bool(self.metadata.get('metrics'))
+            print(f"成功載入 {len(self.font_map)} 個字元的查找表。")
+            return True
         except Exception as e:
-            print(f"錯誤: 無法載入或解析 .map 檔案: {e}")
+            print(f"錯誤: 無法載入或解析字型查找表 '{map_path}': {e}")
             return False
 
     def _open_font_data(self, font_path):
         try:
             self.font_file = open(font_path, 'rb')
+            self.font_data = mmap.mmap(self.font_file.fileno(), 0, access=mmap.ACCESS_READ)
             return True
         except Exception as e:
             print(f"錯誤: 找不到 .font 檔案: {e}")
             return False
 
+    def read_bitmap(self, record):
+        """直接從 mmap 的 .font 資料池切出字元點陣圖 (不需 seek/read)，必要時解壓縮，並還原為 8-bit 灰階。"""
+        size = packed_bitmap_size(record.width, record.height, self.bits_per_pixel)
+        if self.compression == "rle":
+            packed = rle_decode(self.font_data, record.offset, size)
+        else:
+            packed = self.font_data[record.offset:record.offset + size]
+        return unpack_bitmap(packed, record.width, record.height, self.bits_per_pixel)
+
+    def close(self):
+        if self.font_map:
+            self.font_map.close()
+        if self.font_data:
+            self.font_data.close()
+        if self.font_file:
+            self.font_file.close()
+
+class FontRenderer:
+    """
+    以主要字型繪製文字；fallback_paths 為 [(map_path, font_path), ...]，主要字型缺字時依序在這些字型中查詢，
+    每個字型只查一次。font_map、metadata 等屬性與 read_bitmap 都是主要字型的。
+    """
+    def __init__(self, map_path, font_path, cache_bytes=GLYPH_CACHE_BUDGET, fallback_paths=(), atlas=None):
+        if atlas is None: atlas = GLYPH_ATLAS_ENABLED
+        self.atlas = GlyphAtlas(self._render_atlas_glyph, max_bytes=cache_bytes) if atlas else None
+        self.glyph_cache = GlyphCache(cache_bytes) # 只有停用圖集時 draw_string 才會經過此快取
+        self.glyphs_rendered = 0 # 實際從 .font 解出點陣圖的次數 (快取未命中)
+        self.missing_glyphs = set()
+        self.fallback_glyphs = 0 # 由 fallback 字型渲染的字形數
+        try:
+            self.faces = [FontFace(map_path, font_path)]
+        except RuntimeError:
+            raise RuntimeError("字型渲染器初始化失敗！")
+        for fallback_map_path, fallback_font_path in fallback_paths:
+            try:
+                self.faces.append(FontFace(fallback_map_path, fallback_font_path))
+            except RuntimeError as e:
+                print(f"警告: {e}，略過此 fallback 字型。")
+        print("字型渲染器初始化成功！" + (f" (fallback 字型 {len(self.faces) - 1} 個)" if len(self.faces) > 1 else ""))
+
+    @property
+    def font_map(self):
+        return self.faces[0].font_map
+
+    @property
+    def metadata(self):
+        return self.faces[0].metadata
+
+    @property
+    def bits_per_pixel(self):
+        return self.faces[0].bits_per_pixel
+
+    @property
+    def compression(self):
+        return self.faces[0].compression
+
+    def lookup_face(self, char):
+        """依序在主要字型與 fallback 字型中查詢，回傳 (FontFace, FontMapRecord)；都沒有時回傳 (None, None)。"""
+        codepoint = ord(char)
+        for face in self.faces:
+            record = face.font_map.lookup(codepoint)
+            if record is not None:
+                return face, record
+        return None, None
+
+    def lookup(self, char):
+        """回傳字元的 FontMapRecord (可能來自 fallback 字型)，找不到時回傳 None。"""
+        return self.lookup_face(char)[1]
+
+    def read_bitmap(self, record):
+        """從主要字型的資料池讀取點陣圖 (fallback 字型的紀錄請使用 lookup_face 傳回的 FontFace)。"""
+        return self.faces[0].read_bitmap(record)
+
     def get_char_surface(self, char_to_render, color=(255, 255, 255)):
-        unicode_str = str(ord(char_to_render))
+        cache_key = (ord(char_to_render), tuple(color))
+        char_surface = self.glyph_cache.get(cache_key)
+        if char_surface is None:
+            char_surface = self._render_char_surface(char_to_render, color)
+            self.glyph_cache.put(cache_key, char_surface)
+        return char_surface
+
+    def _render_char_surface(self, char_to_render, color):
+        """從 .font 資料池讀取點陣圖並建立新的 Surface (不經過快取)。"""
+        face, record = self.lookup_face(char_to_render)
         font_size = self.metadata.get('font_size', 24)
-        if unicode_str not in self.char_map:
+        self.glyphs_rendered += 1
+        if record is None:
+            self.missing_glyphs.add(char_to_render)
             not_found_surface = pygame.Surface((font_size, font_size), pygame.SRCALPHA)
             pygame.draw.rect(not_found_surface, (255, 0, 255, 200), (0, 0, font_size-2, font_size-2), 1)
             return not_found_surface
-        offset, width, height = self.char_map[unicode_str]
-        self.font_file.seek(offset)
-        pixel_data = self.font_file.read(width * height)
-        char_surface = pygame.Surface((width, height), pygame.SRCALPHA)
-        for y in range(height):
-            for x in range(width):
-                alpha = pixel_data[y * width + x]
-                if alpha > 0:
-                    char_surface.set_at((x, y), (*color, alpha))
-        return char_surface
+        if face is not self.faces[0]:
+            self.fallback_glyphs += 1
+        return grayscale_to_surface(face.read_bitmap(record), record.width, record.height, color)
+
+    def glyph_metrics(self, char):
+        """
+        回傳 (x_offset, y_offset, x_advance)。字型有轉換工具算出的排版數值時直接使用；
+        JSON .map 與遷移而來的 .fmap 沒有這些數值，沿用舊版的排版 (貼齊原點，字距為 width + 1)。
+        缺字方塊的寬度為 font_size，同樣多留 1px。
+        """
+        face, record = self.lookup_face(char)
+        if record is None:
+            return 0, 0, self.metadata.get('font_size', 24) + 1
+        if face.has_metrics:
+            return record.x_offset, record.y_offset, record.x_advance
+        return 0, 0, record.width + 1
+
+    def _render_atlas_glyph(self, char_to_render, color):
+        """圖集用: 回傳 (Surface, x_offset, y_offset, x_advance)。"""
+        return (self._render_char_surface(char_to_render, color), *self.glyph_metrics(char_to_render))
+
+    def preload(self, chars, color=(255, 255, 255)):
+        """預先把 chars 放進圖集 (例如整個字元集或常用字)，之後繪製這些字不需再建立 Surface。"""
+        if self.atlas:
+            self.atlas.preload(chars, tuple(color))
 
     def draw_string(self, target_surface, text, x, y, color=(255, 255, 255)):
+        if self.atlas:
+            return self._draw_string_atlas(target_surface, text, x, y, tuple(color))
         current_x = x
         for char in text:
             char_surf = self.get_char_surface(char, color)
-            if char_surf:
-                target_surface.blit(char_surf, (current_x, y))
-                current_x += char_surf.get_width() + 1
+            x_offset, y_offset, x_advance = self.glyph_metrics(char)
+            target_surface.blit(char_surf, (current_x + x_offset, y + y_offset))
+            current_x += x_advance
         return current_x
+
+    def _draw_string_atlas(self, target_surface, text, x, y, color):
+        atlas = self.atlas
+        generation = atlas.generation
+        blits, pen_x = [], x
+        for char in text:
+            glyph = atlas.get(char, color)
+            blits.append((glyph.page, (pen_x + glyph.x_offset, y + glyph.y_offset), glyph.area))
+            pen_x += glyph.x_advance
+        if atlas.generation == generation:
+            target_surface.blits(blits, doreturn=False)
+            return pen_x
+        # 收集途中圖集被清空 (字串用到的字形比整個圖集還多)，先前取得的區域已失效，改為逐字取得後立即繪製
+        pen_x = x
+        for char in text:
+            glyph = atlas.get(char, color)
+            target_surface.blit(glyph.page, (pen_x + glyph.x_offset, y + glyph.y_offset), glyph.area)
+            pen_x += glyph.x_advance
+        return pen_x
+
+    def char_advance(self, char):
+        """單一字元在 draw_string 中佔用的水平寬度。"""
+        return self.glyph_metrics(char)[2]
+
     def measure_string(self, text):
         """測量一個字串被渲染後的總寬度，但不實際繪製。"""
-        width = 0
-        for char in text:
-            unicode_str = str(ord(char))
-            if unicode_str in self.char_map:
-                # 從 map 中獲取字元寬度
-                _, char_width, _ = self.char_map[unicode_str]
-                width += char_width + 1 # 加上 1px 的字元間距
-            else:
-                # 如果字元不存在，給一個預設寬度
-                width += self.metadata.get('font_size', 24) + 1
-        return width    
+        return sum(self.char_advance(char) for char in text)
+
+    def stats(self):
+        return {"glyphs_rendered": self.glyphs_rendered, "missing_glyphs": len(self.missing_glyphs),
+                "fallback_glyphs": self.fallback_glyphs, "faces": len(self.faces),
+                "cache": self.atlas.stats() if self.atlas else self.glyph_cache.stats()}
+
     def close(self):
-        if self.font_file:
-            self.font_file.close()
+        for face in self.faces:
+            face.close()
 
-# --- 核心類別：輸入法引擎 (與上一版相同) ---
-class ImeEngine:
+# --- 輸入法索引 ---
+# 與 tools/full_hardcode_converter.py 的 IME_INDEX_FORMAT_OPTIMIZED / IME_INDEX_FILE_HEADER_FORMAT 相同
+IME_INDEX_RECORD_FORMAT = "<HBxHH"
+IME_INDEX_RECORD_SIZE = struct.calcsize(IME_INDEX_RECORD_FORMAT)
+IME_INDEX_FILE_MAGIC = b"PTIM"
+IME_INDEX_FILE_HEADER_FORMAT = "<4sBxxxII"
+IME_INDEX_FILE_HEADER_SIZE = struct.calcsize(IME_INDEX_FILE_HEADER_FORMAT)
+# 版本 2 (區塊索引，與 IME_BLOCKED_INDEX_HEADER_FORMAT / IME_BLOCK_FORMAT 相同)：
+# 前綴壓縮的 key 每 block_size 個一組，位移為 32 位元，資料池不受 64 KB 限制
+IME_INDEX_FILE_VERSION_BLOCKED = 2
+IME_BLOCKED_INDEX_HEADER_FORMAT = "<4sIIHxx"
+IME_BLOCKED_INDEX_HEADER_SIZE = struct.calcsize(IME_BLOCKED_INDEX_HEADER_FORMAT)
+IME_BLOCK_FORMAT = "<II"
+IME_BLOCK_SIZE = struct.calcsize(IME_BLOCK_FORMAT)
+
+class JsonImeIndex:
+    """舊版 JSON .idx ({按鍵組合: [offset, length]}) 搭配 .dat 候選字資料。"""
     def __init__(self, idx_path, dat_path):
-        self.idx_data = {}
-        self.dat_file = None
-        if not self._load_idx(idx_path) or not self._open_dat(dat_path):
-            raise RuntimeError("輸入法引擎初始化失敗！")
-        print("輸入法引擎初始化成功！")
+        with open(idx_path, 'r', encoding='utf-8') as f:
+            self.idx_data = json.load(f)
+        self.dat_file = open(dat_path, 'rb')
+        # 與二進位索引相同，依 UTF-8 位元組排序，供前綴範圍掃描使用
+        self.sorted_keys = sorted(key.encode('utf-8') for key in self.idx_data)
+        self.count = len(self.sorted_keys)
+
+    def __len__(self):
+        return len(self.idx_data)
+
+    def key_at(self, position):
+        return self.sorted_keys[position]
+
+    def candidates_at(self, position):
+        return self.lookup(self.sorted_keys[position].decode('utf-8'))
+
+    def lookup(self, input_code):
+        if input_code not in self.idx_data:
+            return ""
+        offset, length = self.idx_data[input_code]
+        self.dat_file.seek(offset)
+        return self.dat_file.read(length).decode('utf-8')
+
+    def close(self):
+        self.dat_file.close()
+
+class _ImeKeys:
+    """讓 bisect 直接比較索引中的 key 位元組 (依 UTF-8 位元組排序)。"""
+    def __init__(self, index):
+        self.index = index
+
+    def __len__(self):
+        return self.index.count
+
+    def __getitem__(self, position):
+        return self.index.key_at(position)
+
+class _BlockFirstKeys:
+    """區塊索引中每個區塊的第一個 key (完整存放，不需解開整個區塊)，供 bisect 使用。"""
+    def __init__(self, index):
+        self.index = index
+
+    def __len__(self):
+        return self.index.block_count
+
+    def __getitem__(self, block):
+        start = self.index.keys_start + self.index._block_at(block)[0]
+        key_len = self.index.data[start + 1]
+        return self.index.data[start + 2:start + 2 + key_len]
 
-    def _load_idx(self, idx_path):
+# BinaryImeIndex.lookup 結果快取的筆數上限。mmap 上的二分搜尋每次都要解開 key，比 JSON 的 dict 慢一個數量級；
+# 組字與選字會反覆查詢相同的按鍵組合，快取後重複的查詢與 dict 一樣快。注音約 1,400 個 key，預設可全部放入
+IME_LOOKUP_CACHE_SIZE = 2048
+
+class BinaryImeIndex:
+    """
+    mmap 的 .imx 輸入法索引：檔頭後接 ImeIndexRecord_Opt 紀錄與資料池，
+    與韌體端的 zhuyin_idx_opt / zhuyin_pool_opt 相同，啟動時不需解析。
+    版本 2 為區塊索引：先在各區塊的第一個 key 上二分搜尋，再解開該區塊 (最近一個區塊會快取)。
+    lookup 的結果另外快取最多 cache_size 筆 (超過時淘汰最早放入的)。
+    """
+    def __init__(self, imx_path, cache_size=IME_LOOKUP_CACHE_SIZE):
+        self.imx_file = open(imx_path, 'rb')
+        self.data = mmap.mmap(self.imx_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, count, pool_size = struct.unpack_from(IME_INDEX_FILE_HEADER_FORMAT, self.data, 0)
+        if magic != IME_INDEX_FILE_MAGIC:
+            self.close()
+            raise ValueError(f"不是有效的 .imx 檔案 (magic={magic!r})")
+        self.version = version
+        self.count = count
+        self.pool_size = pool_size
+        self.blocked = version >= IME_INDEX_FILE_VERSION_BLOCKED
+        if self.blocked:
+            _, _, keys_size, self.block_size = struct.unpack_from(
+                IME_BLOCKED_INDEX_HEADER_FORMAT, self.data, IME_INDEX_FILE_HEADER_SIZE)
+            self.block_count = (count + self.block_size - 1) // self.block_size
+            self.blocks_start = IME_INDEX_FILE_HEADER_SIZE + IME_BLOCKED_INDEX_HEADER_SIZE
+            self.keys_start = self.blocks_start + self.block_count * IME_BLOCK_SIZE
+            self.pool_start = self.keys_start + keys_size
+            self._first_keys = _BlockFirstKeys(self)
+            self._cached_block = (None, None)
+        else:
+            self.pool_start = IME_INDEX_FILE_HEADER_SIZE + count * IME_INDEX_RECORD_SIZE
+        self._keys = _ImeKeys(self)
+        self.cache_size = cache_size
+        self._lookup_cache = {}
+
+    def __len__(self):
+        return self.count
+
+    def _record_at(self, position):
+        return struct.unpack_from(IME_INDEX_RECORD_FORMAT, self.data,
+                                  IME_INDEX_FILE_HEADER_SIZE + position * IME_INDEX_RECORD_SIZE)
+
+    def _block_at(self, block):
+        return struct.unpack_from(IME_BLOCK_FORMAT, self.data, self.blocks_start + block * IME_BLOCK_SIZE)
+
+    def _decode_block(self, block):
+        """解開一個區塊，回傳 [(key, 資料在檔案中的位移, 資料長度)]。"""
+        if self._cached_block[0] == block:
+            return self._cached_block[1]
+        key_offset, data_offset = self._block_at(block)
+        data = self.data
+        position = self.keys_start + key_offset
+        data_position = self.pool_start + data_offset
+        entries, key = [], b""
+        for _ in range(min(self.block_size, self.count - block * self.block_size)):
+            shared, suffix_len = data[position], data[position + 1]
+            key = key[:shared] + data[position + 2:position + 2 + suffix_len]
+            position += 2 + suffix_len
+            data_len, shift = 0, 0
+            while True:
+                byte = data[position]
+                position += 1
+                data_len |= (byte & 0x7F) << shift
+                shift += 7
+                if byte < 0x80:
+                    break
+            entries.append((key, data_position, data_len))
+            data_position += data_len
+        self._cached_block = (block, entries)
+        return entries
+
+    def key_at(self, position):
+        if self.blocked:
+            return self._decode_block(position // self.block_size)[position % self.block_size][0]
+        key_offset, key_len, _, _ = self._record_at(position)
+        start = self.pool_start + key_offset
+        return self.data[start:start + key_len]
+
+    def data_at(self, position):
+        if self.blocked:
+            _, start, data_len = self._decode_block(position // self.block_size)[position % self.block_size]
+            return self.data[start:start + data_len]
+        _, _, data_offset, data_len = self._record_at(position)
+        start = self.pool_start + data_offset
+        return self.data[start:start + data_len]
+
+    def candidates_at(self, position):
+        return self.data_at(position).decode('utf-8')
+
+    def find(self, key_bytes):
+        """回傳 key 在索引中的位置，找不到時回傳 -1。"""
+        if self.blocked:
+            block = bisect.bisect_right(self._first_keys, key_bytes) - 1
+            if block < 0:
+                return -1
+            for i, (key, _, _) in enumerate(self._decode_block(block)):
+                if key == key_bytes:
+                    return block * self.block_size + i
+            return -1
+        position = bisect.bisect_left(self._keys, key_bytes)
+        if position < self.count and self.key_at(position) == key_bytes:
+            return position
+        return -1
+
+    def lookup(self, input_code):
+        candidates = self._lookup_cache.get(input_code)
+        if candidates is None:
+            position = self.find(input_code.encode('utf-8'))
+            candidates = self.candidates_at(position) if position >= 0 else ""
+            if self.cache_size:
+                if len(self._lookup_cache) >= self.cache_size:
+                    del self._lookup_cache[next(iter(self._lookup_cache))]
+                self._lookup_cache[input_code] = candidates
+        return candidates
+
+    def close(self):
+        self._lookup_cache.clear()
+        self.data.close()
+        self.imx_file.close()
+
+# 前綴搜尋每次按鍵最多掃描的 key 數與合併後的候選字上限，用來限制單次按鍵的延遲
+PREFIX_SCAN_LIMIT = 128
+PREDICTIVE_CANDIDATE_LIMIT = 90
+
+class PrefixSearch:
+    """
+    對已排序的 key 做增量前綴搜尋。
+    每輸入一個字元就在上一層的 [lo, hi) 範圍內再做一次二分搜尋縮小範圍；
+    刪除時直接回到上一層，之前合併好的候選字也一併保留，不必重新搜尋。
+    """
+    def __init__(self, index, scan_limit=PREFIX_SCAN_LIMIT, candidate_limit=PREDICTIVE_CANDIDATE_LIMIT, implied_tone=None):
+        self.index = index
+        self.implied_tone = implied_tone
+        self.scan_limit = scan_limit
+        self.candidate_limit = candidate_limit
+        self._keys = _ImeKeys(index)
+        self.code = ""
+        # 每一層: (lo, hi, 合併後的候選字或 None 表示尚未計算)
+        self._frames = [(0, index.count, "")]
+
+    def update(self, code):
+        """將目前的前綴改為 code，只處理與上一次輸入不同的部分，回傳合併後的候選字。"""
+        common = 0
+        while common < min(len(code), len(self.code)) and code[common] == self.code[common]:
+            common += 1
+        del self._frames[common + 1:]
+        for char_index in range(common, len(code)):
+            lo, hi, _ = self._frames[-1]
+            prefix_bytes = code[:char_index + 1].encode('utf-8')
+            # UTF-8 不會出現 0xff，因此 prefix + b'\xff' 是所有以 prefix 開頭的 key 的上界
+            new_lo = bisect.bisect_left(self._keys, prefix_bytes, lo, hi)
+            new_hi = bisect.bisect_left(self._keys, prefix_bytes + b'\xff', new_lo, hi)
+            self._frames.append((new_lo, new_hi, None))
+        self.code = code
+        lo, hi, merged = self._frames[-1]
+        if merged is None:
+            merged = self._merge(code, lo, hi)
+            self._frames[-1] = (lo, hi, merged)
+        return merged
+
+    def key_range(self):
+        lo, hi, _ = self._frames[-1]
+        return lo, hi
+
+    def _merge(self, code, lo, hi):
+        """
+        合併範圍內所有 key 的候選字：完全符合 (含隱含的聲調，例如注音的一聲) 的 key 排最前面，
+        其餘依各 key 內的名次輪流取出，讓每個音節最常用的字先出現。
+        """
+        if not code:
+            return ""
+        exact_keys = {code.encode('utf-8')}
+        if self.implied_tone:
+            exact_keys.add((code + self.implied_tone).encode('utf-8'))
+        exact, others = [], []
+        for position in range(lo, min(hi, lo + self.scan_limit)):
+            candidates = self.index.candidates_at(position)
+            if self.index.key_at(position) in exact_keys:
+                exact.append(candidates)
+            else:
+                others.append(candidates)
+        result, seen = [], set()
+        def take(char):
+            if char not in seen:
+                seen.add(char)
+                result.append(char)
+        for candidates in exact:
+            for char in candidates:
+                take(char)
+        rank = 0
+        while len(result) < self.candidate_limit and others:
+            others = [candidates for candidates in others if rank < len(candidates)]
+            for candidates in others:
+                take(candidates[rank])
+            rank += 1
+        return "".join(result[:self.candidate_limit])
+
+class UserFrequency:
+    """
+    使用者選字次數 (以字為鍵)，跨次執行保存在 JSON 檔。
+    只對查詢回傳的候選字重新排序，不需要重新讀取整個資料池。
+    """
+    def __init__(self, path=None):
+        self.path = path
+        self.counts = {}
+        self.dirty = False
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.counts = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"警告: 無法讀取使用者字頻檔 '{path}': {e}")
+
+    def learn(self, char):
+        self.counts[char] = self.counts.get(char, 0) + 1
+        self.dirty = True
+
+    def rerank(self, candidates):
+        """選過的字依次數由多到少排到前面，其餘維持原本 (字頻表) 的順序。"""
+        if not self.counts or not candidates:
+            return candidates
+        counts = self.counts
+        if not any(char in counts for char in candidates):
+            return candidates
+        order = sorted(range(len(candidates)), key=lambda i: (-counts.get(candidates[i], 0), i))
+        return "".join(candidates[i] for i in order)
+
+    def save(self):
+        if not self.path or not self.dirty:
+            return
         try:
-            with open(idx_path, 'r', encoding='utf-8') as f:
-                self.idx_data = json.load(f)
-                print(f"成功載入 {len(self.idx_data)} 條輸入法索引。")
-                return True
-        except Exception as e:
-            print(f"錯誤: 無法載入或解析 .idx 檔案: {e}")
+            with open(self.path, 'w', encoding='utf-8') as f:
+                json.dump(self.counts, f, ensure_ascii=False)
+            self.dirty = False
+        except OSError as e:
+            print(f"警告: 無法寫入使用者字頻檔 '{self.path}': {e}")
+
+# 詞庫與整句組字
+# SINGLE_CHAR_COST 與轉換工具的詞成本同一尺度 (-10 * log10 機率)；MAX_PHRASE_SYLLABLES 限制動態規劃往回看的音節數
+SINGLE_CHAR_COST = 60
+UNKNOWN_SYLLABLE_COST = 1000
+MAX_PHRASE_SYLLABLES = 4
+MAX_COMPOSE_SYLLABLES = 20
+TONE_DIGITS = {"ˊ": "2", "ˇ": "3", "ˋ": "4", "˙": "5"}
+TONE_IMPLIED = "1" # 注音的一聲沒有符號，不打聲調的音節在碼表中為「字根 + 1」
+
+class PhraseDictionary:
+    """
+    mmap 的詞庫 (.imx 格式)。key 為以 '-' 連接的音節碼，
+    資料為 [詞數 n][n 個成本][n 個詞的 UTF-8]，每個詞的字數等於音節數。
+    """
+    def __init__(self, path):
+        self.index = BinaryImeIndex(path)
+
+    def __len__(self):
+        return len(self.index)
+
+    def lookup(self, codes):
+        """回傳 [(成本, 詞), ...]，依成本由小到大排列。"""
+        position = self.index.find("-".join(codes).encode('utf-8'))
+        if position < 0:
+            return []
+        data = self.index.data_at(position)
+        count = data[0]
+        text = data[1 + count:].decode('utf-8')
+        length = len(codes)
+        return [(data[1 + i], text[i * length:(i + 1) * length]) for i in range(count)]
+
+    def close(self):
+        self.index.close()
+
+class PhraseComposer:
+    """
+    多音節整句組字：對已輸入的音節做 Viterbi 動態規劃，
+    每段可以是詞庫中的詞 (最多 MAX_PHRASE_SYLLABLES 個音節) 或單字，取總成本最小的切分。
+    每加入一個音節只計算新的一欄，刪除時直接丟掉最後一欄，因此每次按鍵的成本是固定的。
+    """
+    def __init__(self, char_index, phrase_dictionary=None,
+                 max_phrase_syllables=MAX_PHRASE_SYLLABLES, max_syllables=MAX_COMPOSE_SYLLABLES):
+        self.char_index = char_index
+        self.phrase_dictionary = phrase_dictionary
+        self.max_phrase_syllables = max_phrase_syllables
+        self.max_syllables = max_syllables
+        self.syllables = []
+        # _best[i] = (前 i 個音節的最小成本, 最後一段的起點, 最後一段的文字)
+        self._best = [(0, 0, "")]
+        self._segment_cache = {}
+
+    def push(self, code):
+        """加入一個完整音節 (如 "ㄅㄚ1")，超過上限時回傳 False。"""
+        if len(self.syllables) >= self.max_syllables:
             return False
+        self.syllables.append(code)
+        end = len(self.syllables)
+        best = None
+        for start in range(max(0, end - self.max_phrase_syllables), end):
+            segment = self._best_segment(tuple(self.syllables[start:end]))
+            if segment is None:
+                continue
+            cost = self._best[start][0] + segment[0]
+            if best is None or cost < best[0]:
+                best = (cost, start, segment[1])
+        self._best.append(best)
+        return True
 
-    def _open_dat(self, dat_path):
-        try:
-            self.dat_file = open(dat_path, 'rb')
+    def pop(self):
+        if self.syllables:
+            self.syllables.pop()
+            self._best.pop()
+
+    def clear(self):
+        self.syllables = []
+        self._best = [(0, 0, "")]
+        self._segment_cache.clear()
+
+    def text(self):
+        """回溯出成本最小的整句。"""
+        parts = []
+        end = len(self.syllables)
+        while end > 0:
+            _, start, segment_text = self._best[end]
+            parts.append(segment_text)
+            end = start
+        return "".join(reversed(parts))
+
+    def _best_segment(self, codes):
+        cached = self._segment_cache.get(codes)
+        if cached is not None or codes in self._segment_cache:
+            return cached
+        if len(codes) == 1:
+            candidates = self.char_index.lookup(codes[0])
+            if candidates:
+                segment = (SINGLE_CHAR_COST, candidates[0])
+            else:
+                # 不存在的音節保留注音本身，讓使用者看得出哪裡打錯
+                segment = (UNKNOWN_SYLLABLE_COST, codes[0].rstrip("12345"))
+        elif self.phrase_dictionary is not None:
+            phrases = self.phrase_dictionary.lookup(codes)
+            segment = phrases[0] if phrases else None
+        else:
+            segment = None
+        self._segment_cache[codes] = segment
+        return segment
+
+# --- 核心類別：輸入法引擎 ---
+# 各輸入法的按鍵對應: 鍵 → 顯示用的字根；code_map 再把字根轉回 .imx 中的查詢碼 (未列出的字根原樣使用)
+ZHUYIN_KEY_MAP = {
+    '1': 'ㄅ', 'q': 'ㄆ', 'a': 'ㄇ', 'z': 'ㄈ', '2': 'ㄉ', 'w': 'ㄊ', 's': 'ㄋ', 'x': 'ㄌ',
+    'e': 'ㄍ', 'd': 'ㄎ', 'c': 'ㄏ', 'r': 'ㄐ', 'f': 'ㄑ', 'v': 'ㄒ', 't': 'ㄓ', 'g': 'ㄔ',
+    'b': 'ㄕ', 'y': 'ㄖ', 'h': 'ㄗ', 'n': 'ㄘ', 'm': 'ㄙ', 'u': 'ㄧ', 'j': 'ㄨ', 'k': 'ㄩ',
+    '8': 'ㄚ', 'i': 'ㄛ', 'l': 'ㄜ', ',': 'ㄝ', '9': 'ㄞ', 'o': 'ㄟ', ';': 'ㄠ', '.': 'ㄡ',
+    '0': 'ㄢ', 'p': 'ㄣ', "'": 'ㄤ', '/': 'ㄥ', '6': 'ㄦ',
+    '3': 'ˇ', '4': 'ˋ', '5': '˙', '7': 'ˊ'
+}
+CANGJIE_KEY_MAP = dict(zip("abcdefghijklmnopqrstuvwxyz", "日月金木水火土竹戈十大中一弓人心手口尸廿山女田難卜重"))
+CANGJIE_CODE_MAP = {radical: key for key, radical in CANGJIE_KEY_MAP.items()}
+# 拼音只對應字母 (ü 打 v)，數字鍵留給選字；未打聲調時以前綴搜尋列出四聲的候選字
+PINYIN_KEY_MAP = {key: key for key in "abcdefghijklmnopqrstuvwxyz"}
+# 行列: 每列鍵位顯示為「欄號 + 列符號」(上列 ^、中列 -、下列 v)
+ARRAY_KEY_MAP = {
+    key: f"{(column + 1) % 10}{row}"
+    for keys, row in (("qwertyuiop", "^"), ("asdfghjkl;", "-"), ("zxcvbnm,./", "v"))
+    for column, key in enumerate(keys)
+}
+ARRAY_CODE_MAP = {symbol: key for key, symbol in ARRAY_KEY_MAP.items()}
+
+# 模擬器可切換的輸入法 (F2 依序切換)，第一個可用的方案為預設。tone_map 不為 None 的方案才有整句模式；
+# implied_tone 為不打聲調時碼表中隱含的聲調碼 (前綴搜尋把「碼 + implied_tone」也當作完全符合)
+IME_SCHEMES = [
+    {"name": "zhuyin", "label": "注音", "idx_path": IME_IDX_PATH, "dat_path": IME_DAT_PATH,
+     "key_map": ZHUYIN_KEY_MAP, "code_map": TONE_DIGITS, "tone_map": TONE_DIGITS, "implied_tone": TONE_IMPLIED,
+     "phrase_path": PHRASE_IDX_PATH},
+    {"name": "cangjie", "label": "倉頡", "idx_path": CANGJIE_IDX_PATH,
+     "key_map": CANGJIE_KEY_MAP, "code_map": CANGJIE_CODE_MAP},
+    {"name": "pinyin", "label": "拼音", "idx_path": PINYIN_IDX_PATH, "key_map": PINYIN_KEY_MAP},
+    {"name": "array", "label": "行列", "idx_path": ARRAY_IDX_PATH,
+     "key_map": ARRAY_KEY_MAP, "code_map": ARRAY_CODE_MAP},
+]
+
+class ImeScheme:
+    """
+    一種查表式輸入法: 按鍵對應、字根到查詢碼的轉換，以及它的索引。
+    索引 (與詞庫) 在第一次切換到此方案時才以 mmap 開啟，未使用的方案不佔記憶體。
+    """
+    def __init__(self, name, label, idx_path, key_map, code_map=None, tone_map=None, implied_tone=None,
+                 dat_path=None, phrase_path=None):
+        self.name = name
+        self.label = label
+        self.idx_path = idx_path
+        self.dat_path = dat_path
+        self.phrase_path = phrase_path
+        self.key_map = key_map
+        self.code_map = code_map or {}
+        self.tone_map = tone_map
+        self.implied_tone = implied_tone
+        self.index = None
+        self.phrase_dictionary = None
+        self.prefix_search = None
+        self.composer = None
+
+    @property
+    def available(self):
+        return os.path.exists(self.idx_path)
+
+    def load(self):
+        """開啟索引；已載入時直接回傳 True，失敗時印出錯誤並回傳 False。"""
+        if self.index is not None:
             return True
+        try:
+            if self.idx_path.endswith('.imx'):
+                self.index = BinaryImeIndex(self.idx_path)
+            else:
+                self.index = JsonImeIndex(self.idx_path, self.dat_path)
+            print(f"成功載入 {len(self.index)} 條{self.label}輸入法索引。")
         except Exception as e:
-            print(f"錯誤: 找不到 .dat 檔案: {e}")
+            print(f"錯誤: 無法載入輸入法索引 '{self.idx_path}': {e}")
             return False
+        self._load_phrases()
+        self.prefix_search = PrefixSearch(self.index, implied_tone=self.implied_tone)
+        self.composer = PhraseComposer(self.index, self.phrase_dictionary)
+        return True
+
+    def _load_phrases(self):
+        """詞庫是可選的：找不到時整句模式只用單字組字。"""
+        if not self.phrase_path or not os.path.exists(self.phrase_path):
+            return
+        try:
+            self.phrase_dictionary = PhraseDictionary(self.phrase_path)
+            print(f"成功載入 {len(self.phrase_dictionary)} 組詞庫讀音。")
+        except Exception as e:
+            print(f"警告: 無法載入詞庫 '{self.phrase_path}': {e}")
+
+    def to_code(self, symbols):
+        """把輸入的字根序列轉成查詢碼 (如 ['ㄅ', 'ㄚ', 'ˇ'] → 'ㄅㄚ3'、['日', '月'] → 'ab')。"""
+        return "".join(self.code_map.get(symbol, symbol) for symbol in symbols)
+
+    def close(self):
+        if self.phrase_dictionary:
+            self.phrase_dictionary.close()
+            self.phrase_dictionary = None
+        if self.index:
+            self.index.close()
+            self.index = None
+
+class ImeEngine:
+    """
+    管理多個輸入法方案，查詢一律交給目前的方案；使用者選字次數由所有方案共用。
+    schemes 為 ImeScheme 或其參數 dict 的清單，索引檔不存在的方案會被略過。
+    """
+    def __init__(self, schemes=IME_SCHEMES, user_freq_path=None):
+        schemes = [scheme if isinstance(scheme, ImeScheme) else ImeScheme(**scheme) for scheme in schemes]
+        self.schemes = [scheme for scheme in schemes if scheme.available]
+        self.scheme = None
+        self.user_frequency = UserFrequency(user_freq_path)
+        self.counts = {"query": 0, "predict": 0, "commit": 0, "switch": 0}
+        if not any(self.switch(scheme.name) for scheme in self.schemes):
+            raise RuntimeError("輸入法引擎初始化失敗！")
+        print("輸入法引擎初始化成功！")
+
+    @property
+    def index(self):
+        return self.scheme.index
+
+    @property
+    def prefix_search(self):
+        return self.scheme.prefix_search
+
+    @property
+    def composer(self):
+        return self.scheme.composer
+
+    @property
+    def phrase_dictionary(self):
+        return self.scheme.phrase_dictionary
+
+    def switch(self, name):
+        """切換到指定名稱的方案 (必要時才載入)，成功時回傳 True。"""
+        for scheme in self.schemes:
+            if scheme.name == name and scheme.load():
+                self.scheme = scheme
+                self.counts["switch"] += 1
+                return True
+        return False
+
+    def next_scheme(self):
+        """依序切換到下一個能載入的方案，回傳目前的方案。"""
+        position = self.schemes.index(self.scheme)
+        for step in range(1, len(self.schemes)):
+            if self.switch(self.schemes[(position + step) % len(self.schemes)].name):
+                break
+        return self.scheme
 
     def query(self, input_code):
-        if input_code not in self.idx_data:
-            return ""
-        offset, length = self.idx_data[input_code]
-        self.dat_file.seek(offset)
-        encoded_bytes = self.dat_file.read(length)
-        return encoded_bytes.decode('utf-8')
+        self.counts["query"] += 1
+        return self.user_frequency.rerank(self.index.lookup(input_code))
+
+    def predict(self, prefix_code):
+        """回傳所有以 prefix_code 開頭的按鍵組合合併後的候選字 (增量更新)。"""
+        self.counts["predict"] += 1
+        return self.user_frequency.rerank(self.prefix_search.update(prefix_code))
+
+    def commit(self, char):
+        """記錄使用者選了哪個字，之後的查詢會把常選的字往前排。"""
+        self.counts["commit"] += 1
+        self.user_frequency.learn(char)
+
+    def stats(self):
+        return dict(self.counts, scheme=self.scheme.name, learned_chars=len(self.user_frequency.counts),
+                    loaded_schemes=[scheme.name for scheme in self.schemes if scheme.index is not None])
+
+    def close(self):
+        self.user_frequency.save()
+        for scheme in self.schemes:
+            scheme.close()
+
+# --- 畫面區域與局部更新 ---
+# 模擬 SPI 小螢幕常見的 RGB565：每個像素推送 2 bytes
+DISPLAY_BYTES_PER_PIXEL = 2
+# 沒有任何事件時，主迴圈最多睡這麼久 (毫秒) 才醒來一次
+IDLE_WAIT_MS = 500
+
+class AreaView:
+    """
+    畫面中的一個區域 (輸入區、候選字區)，內容快取在自己的 Surface。
+    只有狀態改變時才重繪，並回傳需要推送到螢幕的矩形。
+    """
+    def __init__(self, rect):
+        self.rect = rect
+        self.surface = pygame.Surface(rect.size)
+        self.state = None
+
+    def update(self, state, draw):
+        if state == self.state:
+            return []
+        self.state = state
+        self.surface.fill(COLOR_BACKGROUND)
+        draw(self.surface)
+        pygame.draw.rect(self.surface, COLOR_BORDER, self.surface.get_rect(), 1)
+        return [self.rect]
+
+    def blit_to(self, screen, rects):
+        for rect in rects:
+            screen.blit(self.surface, rect, area=rect.move(-self.rect.x, -self.rect.y))
+
+class EditorView(AreaView):
+    """編輯區：依 TextLayout 回傳的變動行只重繪並推送那幾行。"""
+    def __init__(self, rect, renderer, layout):
+        super().__init__(rect)
+        self.renderer = renderer
+        self.layout = layout
+        self.line_height = renderer.metadata.get('font_size', 24) + 4
+        self.surface.fill(COLOR_BACKGROUND)
+        pygame.draw.rect(self.surface, COLOR_BORDER, self.surface.get_rect(), 1)
+
+    def update(self, text, draw=None):
+        inner = self.surface.get_rect().inflate(-2, -2)
+        rects = []
+        for line_index in self.layout.update(text):
+            line_rect = pygame.Rect(inner.x, 5 + line_index * self.line_height, inner.width, self.line_height).clip(inner)
+            if not line_rect.height:
+                continue
+            self.surface.fill(COLOR_BACKGROUND, line_rect)
+            if line_index < self.layout.line_count():
+                self.renderer.draw_string(self.surface, self.layout.line_text(line_index), 5, line_rect.y, COLOR_TEXT)
+            rects.append(line_rect.move(self.rect.x, self.rect.y))
+        return rects
+
+    def invalidate(self):
+        """下一次 update 時整區重繪 (例如視窗被覆蓋後重新顯示)。"""
+        self.layout.reset()
+        self.surface.fill(COLOR_BACKGROUND)
+        pygame.draw.rect(self.surface, COLOR_BORDER, self.surface.get_rect(), 1)
+
+class RenderStats:
+    """統計每個影格實際推送到螢幕的位元組數，並與每次整屏 flip 比較。"""
+    def __init__(self, screen_size, bytes_per_pixel=DISPLAY_BYTES_PER_PIXEL):
+        self.bytes_per_pixel = bytes_per_pixel
+        self.full_frame_bytes = screen_size[0] * screen_size[1] * bytes_per_pixel
+        self.frames = 0
+        self.pushed_frames = 0
+        self.bytes_pushed = 0
+        self.max_frame_bytes = 0
+
+    def record(self, rects):
+        frame_bytes = sum(rect.width * rect.height for rect in rects) * self.bytes_per_pixel
+        self.frames += 1
+        if frame_bytes:
+            self.pushed_frames += 1
+        self.bytes_pushed += frame_bytes
+        self.max_frame_bytes = max(self.max_frame_bytes, frame_bytes)
+        return frame_bytes
+
+    def stats(self):
+        return {
+            "frames": self.frames, "pushed_frames": self.pushed_frames,
+            "bytes_pushed": self.bytes_pushed, "max_frame_bytes": self.max_frame_bytes,
+            "avg_bytes_per_frame": self.bytes_pushed / self.frames if self.frames else 0.0,
+            "full_frame_bytes": self.full_frame_bytes,
+            "full_flip_bytes": self.full_frame_bytes * self.frames,
+        }
+
+# --- 輸入狀態與按鍵處理 (與視窗無關，main() 與 headless 重播共用) ---
+CANDIDATES_PER_PAGE = 9
+
+class ImeSession:
+    """
+    模擬器的編輯狀態 (輸入的字根、候選字、翻頁、編輯區文字) 與按鍵處理。
+    handle_key 只接受 pygame 的按鍵代碼與對應的字元，不需要視窗，可由腳本直接驅動。
+    """
+    def __init__(self, ime):
+        self.ime = ime
+        self.input_buffer = [] # 已輸入的字根 (行列的字根是兩個字元，因此以清單保存)
+        self.candidate_string = ""
+        self.editor_content = ""
+        self.candidate_page = 0
+        self.phrase_mode = False # Tab 切換：逐字選字 / 整句組字 (只有注音支援)；F2 切換輸入法
+
+    def handle_key(self, key, unicode=""):
+        """處理一次按鍵，按下 Escape 時回傳 False。"""
+        ime = self.ime
+        if key == pygame.K_ESCAPE:
+            return False
+
+        elif key in (pygame.K_TAB, pygame.K_F2):
+            if key == pygame.K_F2:
+                ime.composer.clear()
+                ime.next_scheme()
+                self.phrase_mode = False
+            elif ime.scheme.tone_map is not None:
+                self.phrase_mode = not self.phrase_mode
+            self._reset_input()
+            ime.composer.clear()
+
+        elif self.phrase_mode and (unicode in ime.scheme.key_map or key in (pygame.K_SPACE, pygame.K_BACKSPACE)):
+            self._handle_phrase_key(key, unicode)
+
+        elif unicode in ime.scheme.key_map:
+            self.input_buffer.append(ime.scheme.key_map[unicode])
+            self.candidate_string = ime.predict(ime.scheme.to_code(self.input_buffer))
+            self.candidate_page = 0
+
+        elif key == pygame.K_BACKSPACE:
+            if self.input_buffer:
+                self.input_buffer.pop()
+                self.candidate_string = ime.predict(ime.scheme.to_code(self.input_buffer))
+                self.candidate_page = 0
+            elif self.editor_content:
+                self.editor_content = self.editor_content[:-1]
+
+        elif key == pygame.K_SPACE:
+            if self.candidate_string:
+                self._select(self.candidate_page * CANDIDATES_PER_PAGE)
+
+        elif pygame.K_1 <= key <= pygame.K_9:
+            self._select(self.candidate_page * CANDIDATES_PER_PAGE + key - pygame.K_1)
+
+        elif key == pygame.K_RIGHT or key == pygame.K_EQUALS:
+            if len(self.candidate_string) > (self.candidate_page + 1) * CANDIDATES_PER_PAGE:
+                self.candidate_page += 1
+
+        elif key == pygame.K_LEFT or key == pygame.K_MINUS:
+            if self.candidate_page > 0:
+                self.candidate_page -= 1
+        return True
+
+    def _handle_phrase_key(self, key, unicode):
+        # 整句模式：聲調鍵 (或空白鍵代表一聲) 結束一個音節並重新組句，音節都打完後按空白鍵上屏
+        ime = self.ime
+        composer = ime.composer
+        symbol = ime.scheme.key_map.get(unicode)
+        if symbol in ime.scheme.tone_map:
+            if self.input_buffer:
+                self._push_syllable(ime.scheme.to_code(self.input_buffer + [symbol]))
+        elif symbol:
+            self.input_buffer.append(symbol)
+        elif key == pygame.K_SPACE:
+            if self.input_buffer:
+                self._push_syllable(ime.scheme.to_code(self.input_buffer) + (ime.scheme.implied_tone or ""))
+            elif composer.syllables:
+                composed_text = composer.text()
+                self.editor_content += composed_text
+                for char in composed_text:
+                    ime.commit(char)
+                composer.clear()
+        elif key == pygame.K_BACKSPACE:
+            if self.input_buffer:
+                self.input_buffer.pop()
+            elif composer.syllables:
+                composer.pop()
+            elif self.editor_content:
+                self.editor_content = self.editor_content[:-1]
+
+    def _push_syllable(self, code):
+        """把輸入中的音節交給組字器；句子已達 MAX_COMPOSE_SYLLABLES 時保留輸入區的字根，先上屏或刪除後才能繼續。"""
+        if self.ime.composer.push(code):
+            self.input_buffer = []
+            return True
+        print(f"警告: 整句已達 {MAX_COMPOSE_SYLLABLES} 個音節，此音節保留在輸入區；以退格鍵刪除後按空白鍵即可上屏。")
+        return False
+
+    def _select(self, index):
+        if index < len(self.candidate_string):
+            self.editor_content += self.candidate_string[index]
+            self.ime.commit(self.candidate_string[index])
+            self._reset_input()
+
+    def _reset_input(self):
+        self.input_buffer = []
+        self.candidate_string = ""
+        self.candidate_page = 0
+
+class SimulatorScreen:
+    """
+    模擬器畫面：輸入區、候選字區、編輯區各自快取，render 只重繪狀態有變的區域。
+    回傳 (需要推送的矩形, 是否為整屏重繪)，呼叫端決定用 flip 或 update 推送。
+    """
+    def __init__(self, screen, renderer):
+        self.screen = screen
+        self.renderer = renderer
+        self.input_view = AreaView(INPUT_AREA_RECT)
+        self.candidate_view = AreaView(CANDIDATE_AREA_RECT)
+        self.editor_layout = TextLayout(renderer.char_advance, EDITOR_AREA_RECT.width - 10) # 減去左右邊距
+        self.editor_view = EditorView(EDITOR_AREA_RECT, renderer, self.editor_layout)
+        self.full_redraw = True
+        screen.fill(COLOR_BACKGROUND)
+
+    def invalidate(self):
+        """下一次 render 時整屏重繪 (例如視窗被覆蓋後重新顯示)。"""
+        self.full_redraw = True
+
+    def render(self, session):
+        renderer = self.renderer
+        ime = session.ime
+        if self.full_redraw:
+            self.input_view.state = self.candidate_view.state = None
+            self.editor_view.invalidate()
+
+        def draw_input(surface):
+            if session.phrase_mode:
+                syllables_display = " ".join(ime.composer.syllables)
+                renderer.draw_string(surface, f"整句: {syllables_display} {''.join(session.input_buffer)}", 5, 5, COLOR_INPUT)
+            else:
+                renderer.draw_string(surface, f"{ime.scheme.label}: {''.join(session.input_buffer)}", 5, 5, COLOR_INPUT)
+
+        def draw_candidates(surface):
+            candidate_string, candidate_page = session.candidate_string, session.candidate_page
+            start_index = candidate_page * CANDIDATES_PER_PAGE
+            end_index = start_index + CANDIDATES_PER_PAGE
+            page_candidates = candidate_string[start_index:end_index]
+            candidate_display = " ".join([f"{i+1}{c}" for i, c in enumerate(page_candidates)])
+            if len(candidate_string) > CANDIDATES_PER_PAGE:
+                page_info = f"[{candidate_page + 1}/{ (len(candidate_string) - 1) // CANDIDATES_PER_PAGE + 1}]"
+                candidate_display += f"  {page_info} (-/=)"
+            if session.phrase_mode:
+                candidate_display = f"{ime.composer.text()}  (Space)"
+            renderer.draw_string(surface, f"{candidate_display}", 5, 5, COLOR_CANDIDATE)
+
+        input_rects = self.input_view.update(
+            (ime.scheme.name, session.phrase_mode, tuple(ime.composer.syllables), tuple(session.input_buffer)), draw_input)
+        candidate_rects = self.candidate_view.update(
+            (session.phrase_mode, session.candidate_string, session.candidate_page, tuple(ime.composer.syllables)),
+            draw_candidates)
+        # 編輯區：只重繪排版結果有變動的行
+        editor_rects = self.editor_view.update(session.editor_content)
+        views = (self.input_view, self.candidate_view, self.editor_view)
+        for view, rects in zip(views, (input_rects, candidate_rects, editor_rects)):
+            view.blit_to(self.screen, rects)
+
+        if self.full_redraw:
+            for view in views:
+                self.screen.blit(view.surface, view.rect)
+            self.full_redraw = False
+            return [self.screen.get_rect()], True
+        return input_rects + candidate_rects + editor_rects, False
+
+class KeyTraceRecorder:
+    """把按鍵事件記錄成 JSON Lines (每行 {"t": 秒, "key": 按鍵名稱, "unicode": 字元})，供 headless 重播。"""
+    def __init__(self, path):
+        self.file = open(path, "w", encoding="utf-8")
+        self.start = None
+
+    def record(self, event):
+        now = pygame.time.get_ticks() / 1000
+        if self.start is None:
+            self.start = now
+        entry = {"t": round(now - self.start, 3), "key": pygame.key.name(event.key), "unicode": event.unicode}
+        self.file.write(json.dumps(entry, ensure_ascii=False) + "\n")
 
     def close(self):
-        if self.dat_file:
-            self.dat_file.close()
+        self.file.close()
+
+def load_key_trace(path):
+    """讀取 KeyTraceRecorder 的記錄，回傳 [(秒, 按鍵代碼, 字元), ...]。"""
+    events = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                events.append((entry.get("t", 0.0), pygame.key.key_code(entry["key"]), entry.get("unicode", "")))
+    return events
 
 # --- 主應用程式 ---
-def main():
+def main(record_path=None):
     pygame.init()
     screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
     pygame.display.set_caption("PicoType Simulator - Full Demo with Paging")
     clock = pygame.time.Clock()
 
     try:
-        renderer = FontRenderer(FONT_MAP_PATH, FONT_DATA_PATH)
-        ime = ImeEngine(IME_IDX_PATH, IME_DAT_PATH)
+        renderer = FontRenderer(FONT_MAP_PATH, FONT_DATA_PATH, fallback_paths=FONT_FALLBACK_PATHS)
+        ime = ImeEngine(IME_SCHEMES, USER_FREQ_PATH)
     except RuntimeError as e:
         print(e)
         return
 
-    # 狀態變數
-    input_buffer = "" 
-    candidate_string = ""
-    editor_content = ""
-    candidate_page = 0
-    CANDIDATES_PER_PAGE = 9
-
-    key_map = {
-        '1': 'ㄅ', 'q': 'ㄆ', 'a': 'ㄇ', 'z': 'ㄈ', '2': 'ㄉ', 'w': 'ㄊ', 's': 'ㄋ', 'x': 'ㄌ',
-        'e': 'ㄍ', 'd': 'ㄎ', 'c': 'ㄏ', 'r': 'ㄐ', 'f': 'ㄑ', 'v': 'ㄒ', 't': 'ㄓ', 'g': 'ㄔ',
-        'b': 'ㄕ', 'y': 'ㄖ', 'h': 'ㄗ', 'n': 'ㄘ', 'm': 'ㄙ', 'u': 'ㄧ', 'j': 'ㄨ', 'k': 'ㄩ',
-        '8': 'ㄚ', 'i': 'ㄛ', 'l': 'ㄜ', ',': 'ㄝ', '9': 'ㄞ', 'o': 'ㄟ', ';': 'ㄠ', '.': 'ㄡ',
-        '0': 'ㄢ', 'p': 'ㄣ', "'": 'ㄤ', '/': 'ㄥ', '6': 'ㄦ',
-        '3': 'ˇ', '4': 'ˋ', '5': '˙', '7': 'ˊ'
-    }
+    session = ImeSession(ime)
+    # 各區域的快取畫面：只重繪狀態有變的區域，並只推送這些矩形
+    simulator_screen = SimulatorScreen(screen, renderer)
+    render_stats = RenderStats((SCREEN_WIDTH, SCREEN_HEIGHT))
+    recorder = KeyTraceRecorder(record_path) if record_path else None
 
     running = True
     while running:
-        for event in pygame.event.get():
+        events = pygame.event.get()
+        if not events:
+            # 閒置時睡到下一個事件 (或逾時) 為止，不必每秒重繪 30 次
+            event = pygame.event.wait(IDLE_WAIT_MS)
+            events = [event] if event.type != pygame.NOEVENT else []
+        for event in events:
             if event.type == pygame.QUIT:
                 running = False
+            if event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+                simulator_screen.invalidate()
             if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_ESCAPE:
+                if recorder:
+                    recorder.record(event)
+                if not session.handle_key(event.key, event.unicode):
                     running = False
-                
-                elif event.unicode in key_map:
-                    input_buffer += key_map[event.unicode]
-                    query_code = input_buffer.replace("ˊ", "2").replace("ˇ", "3").replace("ˋ", "4").replace("˙", "5")
-                    if not any(c in "2345" for c in query_code):
-                        query_code += "1"
-                    candidate_string = ime.query(query_code)
-                    candidate_page = 0
-
-                elif event.key == pygame.K_BACKSPACE:
-                    if input_buffer:
-                        input_buffer = input_buffer[:-1]
-                        if input_buffer:
-                            query_code = input_buffer.replace("ˊ", "2").replace("ˇ", "3").replace("ˋ", "4").replace("˙", "5")
-                            if not any(c in "2345" for c in query_code):
-                                query_code += "1"
-                            candidate_string = ime.query(query_code)
-                        else:
-                            candidate_string = ""
-                        candidate_page = 0
-                    elif editor_content:
-                        editor_content = editor_content[:-1]
-                
-                elif event.key == pygame.K_SPACE:
-                    if candidate_string:
-                        actual_choice_index = candidate_page * CANDIDATES_PER_PAGE
-                        if actual_choice_index < len(candidate_string):
-                            editor_content += candidate_string[actual_choice_index]
-                            input_buffer = ""
-                            candidate_string = ""
-                            candidate_page = 0
-
-                elif pygame.K_1 <= event.key <= pygame.K_9:
-                    choice_on_page = event.key - pygame.K_1
-                    actual_choice_index = candidate_page * CANDIDATES_PER_PAGE + choice_on_page
-                    if actual_choice_index < len(candidate_string):
-                        editor_content += candidate_string[actual_choice_index]
-                        input_buffer = ""
-                        candidate_string = ""
-                        candidate_page = 0
-                
-                elif event.key == pygame.K_RIGHT or event.key == pygame.K_EQUALS:
-                    if len(candidate_string) > (candidate_page + 1) * CANDIDATES_PER_PAGE:
-                        candidate_page += 1
-                
-                elif event.key == pygame.K_LEFT or event.key == pygame.K_MINUS:
-                    if candidate_page > 0:
-                        candidate_page -= 1
-
-        screen.fill(COLOR_BACKGROUND)
-        
-        pygame.draw.rect(screen, COLOR_BORDER, INPUT_AREA_RECT, 1)
-        renderer.draw_string(screen, f"輸入: {input_buffer}", INPUT_AREA_RECT.x + 5, INPUT_AREA_RECT.y + 5, COLOR_INPUT)
-
-        pygame.draw.rect(screen, COLOR_BORDER, CANDIDATE_AREA_RECT, 1)
-        start_index = candidate_page * CANDIDATES_PER_PAGE
-        end_index = start_index + CANDIDATES_PER_PAGE
-        page_candidates = candidate_string[start_index:end_index]
-        candidate_display = " ".join([f"{i+1}{c}" for i, c in enumerate(page_candidates)])
-        if len(candidate_string) > CANDIDATES_PER_PAGE:
-            page_info = f"[{candidate_page + 1}/{ (len(candidate_string) - 1) // CANDIDATES_PER_PAGE + 1}]"
-            candidate_display += f"  {page_info} (-/=)"
-        renderer.draw_string(screen, f"{candidate_display}", CANDIDATE_AREA_RECT.x + 5, CANDIDATE_AREA_RECT.y + 5, COLOR_CANDIDATE)
-
-        # 繪製編輯區
-        pygame.draw.rect(screen, COLOR_BORDER, EDITOR_AREA_RECT, 1)
-        line_y = EDITOR_AREA_RECT.y + 5
-        current_line = ""
-        for char in editor_content:
-            # 測試如果加上新字元是否會超出一行
-            test_line = current_line + char
-            line_width = renderer.measure_string(test_line)
-            
-            if line_width > EDITOR_AREA_RECT.width - 10: # 減去左右邊距
-                # 當前行已滿，繪製它並開始新行
-                renderer.draw_string(screen, current_line, EDITOR_AREA_RECT.x + 5, line_y, COLOR_TEXT)
-                line_y += renderer.metadata.get('font_size', 24) + 4 # 換行
-                current_line = char # 新行以當前字元開始
-            else:
-                # 尚未滿行，繼續添加字元
-                current_line = test_line
 
-        # 繪製剩餘的最後一行
-        renderer.draw_string(screen, current_line, EDITOR_AREA_RECT.x + 5, line_y, COLOR_TEXT)
-        
-        pygame.display.flip()
+        dirty_rects, full_redraw = simulator_screen.render(session)
+        if full_redraw:
+            pygame.display.flip()
+        elif dirty_rects:
+            pygame.display.update(dirty_rects)
+        render_stats.record(dirty_rects)
         clock.tick(FPS)
 
+    stats = render_stats.stats()
+    print(f"影格數: {stats['frames']}，有推送的影格: {stats['pushed_frames']}，"
+          f"推送 {stats['bytes_pushed']:,} bytes (整屏 flip 需 {stats['full_flip_bytes']:,} bytes)")
+    if recorder:
+        recorder.close()
+        print(f"按鍵記錄已儲存至: {record_path}")
     renderer.close()
     ime.close()
     pygame.quit()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    import argparse
+    parser = argparse.ArgumentParser(description="PicoType 模擬器")
+    parser.add_argument("--record", metavar="TRACE", help="把按鍵記錄成 JSON Lines，可用 benchmarks/bench_runtime_replay.py 重播")
+    main(parser.parse_args().record)
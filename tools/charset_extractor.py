@@ -1,8 +1,15 @@
 import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 
 # --- 配置 (採用資料驅動設計) ---
 # 我們將設定資訊全部整合到這個列表中
-# 每個字典代表一個來源檔案的處理規則
+# 每個字典代表一個來源檔案的處理規則:
+#   "method": "first_char" (每行第一個字元)、"split" (以 delimiter 分割後取 column_index 欄)、
+#             "cin" (.cin 碼表 %chardef 區段中的字，即每行第 2 欄)、"text" (純文字語料，每個可見字元都計入)
+#   "count_column": (可選，split 用) 該欄為次數 (如字頻表)，排名時以此加權；否則每出現一次計 1
+#   "always_include": (可選) 此來源的字元不受 TOP_N_CHARS 限制，一律保留 (如標點符號)
 SOURCE_FILES_CONFIG = [
 #     {
 #         "path": "../ime_data/BPMFBase.txt",
@@ -12,7 +19,8 @@ SOURCE_FILES_CONFIG = [
         "path": "../ime_data/BPMFPunctuations.txt",
         "method": "split",      # 通用規則：分割字串
         "delimiter": " ",       # 分隔符號是「空格」
-        "column_index": 0       # 取第 0 個欄位 (第一個)
+        "column_index": 0,      # 取第 0 個欄位 (第一個)
+        "always_include": True
     },
     {
         "path": "../ime_data/通用规范汉字表(2013)全部(8105字).txt",
@@ -26,73 +34,178 @@ SOURCE_FILES_CONFIG = [
         "delimiter": " ",      # 分隔符號是「Tab」
         "column_index": 0       # 取第 1 個欄位 (第二個)
     },
+#     {
+#         "path": "../ime_data/chat_logs.txt",
+#         "method": "text"        # 純文字語料 (可達 GB 等級，逐塊讀取)
+#     },
 ]
 
 # 輸出的字元集檔案
 OUTPUT_CHARSET_PATH = "../charsets/chars_from_tcfreq_sc.txt"
 
-# --- 主程式 ---
-def extract_chars_from_tables():
+# 只保留出現次數最多的前 N 個字元 (always_include 的來源除外)；None 表示全部保留
+TOP_N_CHARS = None
+# 解析來源檔案的行程數：1 = 單一行程，0 = 使用全部 CPU 核心；結果與行程數無關
+EXTRACT_WORKERS = 0
+# 超過此大小的來源 (cin 除外) 會切成多段交給不同行程處理，切點對齊行首
+EXTRACT_SPLIT_BYTES = 64 * 1024 * 1024
+# 每次讀取的位元組數，記憶體用量只與此值有關，與檔案大小無關
+EXTRACT_BLOCK_BYTES = 1024 * 1024
+
+def iter_line_blocks(path, start, end, block_size=None):
     """
-    從多個輸入法碼表中提取所有字元和符號，去重後儲存為一個字元集檔案。
-    (此版本採用資料驅動設計，更具擴充性)
+    逐塊讀取檔案中「起點落在 [start, end) 內」的各行，每塊都在行尾結束，因此可直接以 UTF-8 解碼。
+    相鄰兩段的邊界上的行只會被其中一段讀到。
     """
-    print("開始從多個來源提取字元集...")
-
-    char_set = set()
+    if block_size is None: block_size = EXTRACT_BLOCK_BYTES
+    with open(path, "rb") as f:
+        if start > 0:
+            # 從前一個位元組所在的行尾開始，剛好落在行首時不會跳過該行
+            f.seek(start - 1)
+            f.readline()
+        position = f.tell()
+        while position < end:
+            block = f.read(min(block_size, end - position))
+            if not block:
+                break
+            if not block.endswith(b"\n"):
+                block += f.readline()
+            encoding = "utf-8-sig" if position == 0 else "utf-8"
+            position += len(block)
+            yield block.decode(encoding, errors="replace")
 
-    # 直接遍歷設定列表，不再需要判斷檔名
-    for config in SOURCE_FILES_CONFIG:
-        filepath = config["path"]
-        print(f"正在處理檔案: {filepath} (使用方法: {config['method']})")
-        
-        try:
-            with open(filepath, "r", encoding="utf-8") as f:
-                lines = f.readlines()
-        except FileNotFoundError:
-            print(f"警告: 找不到檔案 '{filepath}'，將跳過。")
+def count_chars(task):
+    """
+    處理一段來源 (config, start, end, need_counts)，回傳 Counter {字元: 次數}。在工作行程中執行。
+    不需要頻率截斷時 (need_counts 為 False)，純文字語料只以 set 收集字元，次數一律記為 1，速度快得多。
+    """
+    config, start, end, need_counts = task
+    method = config["method"]
+    counts, seen = Counter(), set()
+    in_chardef = False
+    for block in iter_line_blocks(config["path"], start, end):
+        if method == "text":
+            if need_counts:
+                counts.update(block)
+            else:
+                seen.update(block)
             continue
-
-        for line in lines:
+        for line in block.splitlines():
             line = line.strip()
             if not line:
                 continue
 
-            char_to_add = None
-            
+            char_to_add, weight = None, 1
+
             # 根據設定中的 method 決定解析方式
-            if config["method"] == "first_char":
+            if method == "first_char":
                 char_to_add = line[0]
-            
-            elif config["method"] == "split":
+
+            elif method == "split":
                 delimiter = config["delimiter"]
                 col_index = config["column_index"]
-                
+
                 parts = line.split(delimiter)
                 if len(parts) > col_index and parts[col_index]:
                     char_to_add = parts[col_index]
+                count_column = config.get("count_column")
+                if count_column is not None and len(parts) > count_column and parts[count_column].strip().isdigit():
+                    weight = int(parts[count_column])
+
+            elif method == "cin":
+                if line.startswith("%chardef"):
+                    in_chardef = line.endswith("begin")
+                    continue
+                parts = line.split()
+                if in_chardef and len(parts) >= 2 and not line.startswith(("%", "#")):
+                    char_to_add = parts[1]
 
             if char_to_add:
                 # 確保只添加一個字元，避免 "的" 和 "的 " 被視為不同
-                char_set.add(char_to_add.strip())
+                counts[char_to_add.strip()] += weight
+    if method == "text":
+        counts.update(dict.fromkeys(seen, 1))
+        # 純文字語料只保留可見字元 (去掉空白、換行、控制字元與解碼失敗的替代字元)
+        for char in [char for char in counts if char.isspace() or not char.isprintable() or char == "\ufffd"]:
+            del counts[char]
+    return counts
+
+def split_tasks(config, need_counts, split_bytes=None):
+    """把一個來源切成數段 (config, start, end, need_counts)。cin 需要保留 %chardef 狀態，不切割。"""
+    if split_bytes is None: split_bytes = EXTRACT_SPLIT_BYTES
+    size = os.path.getsize(config["path"])
+    if config["method"] == "cin" or size <= split_bytes:
+        return [(config, 0, size, need_counts)]
+    return [(config, start, min(start + split_bytes, size), need_counts) for start in range(0, size, split_bytes)]
+
+# --- 主程式 ---
+def extract_chars_from_tables(source_configs=None, output_path=None, top_n=None, workers=None):
+    """
+    從多個輸入法碼表、字頻表與文字語料中提取所有字元和符號，去重後儲存為一個字元集檔案。
+    各來源以串流方式逐塊讀取並分段平行處理，最後合併各行程的計數；
+    設定 top_n 時只保留出現次數最多的前 N 個字元。回傳排序後的字元清單。
+    """
+    if source_configs is None: source_configs = SOURCE_FILES_CONFIG
+    if output_path is None: output_path = OUTPUT_CHARSET_PATH
+    if top_n is None: top_n = TOP_N_CHARS
+    if workers is None: workers = EXTRACT_WORKERS
+    if workers <= 0: workers = os.cpu_count() or 1
+    print("開始從多個來源提取字元集...")
+    start_time = time.perf_counter()
 
-    if not char_set:
+    tasks, total_bytes = [], 0
+    for config in source_configs:
+        filepath = config["path"]
+        if not os.path.exists(filepath):
+            print(f"警告: 找不到檔案 '{filepath}'，將跳過。")
+            continue
+        source_tasks = split_tasks(config, top_n is not None)
+        total_bytes += source_tasks[-1][2]
+        print(f"正在處理檔案: {filepath} (使用方法: {config['method']}，{len(source_tasks)} 段)")
+        tasks += source_tasks
+
+    if workers == 1 or len(tasks) <= 1:
+        results = [count_chars(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as executor:
+            results = list(executor.map(count_chars, tasks))
+
+    counts, always_included = Counter(), set()
+    for (config, _, _, _), task_counts in zip(tasks, results):
+        counts.update(task_counts)
+        if config.get("always_include"):
+            always_included.update(task_counts)
+
+    if not counts:
         print("錯誤: 未能從任何來源檔案中提取到字元。")
-        return
+        return None
+
+    char_set = set(counts)
+    if top_n is not None and len(char_set) > top_n:
+        # 依次數由多到少排名，次數相同時依 codepoint，確保結果固定
+        ranked = sorted(counts, key=lambda char: (-counts[char], char))[:top_n]
+        char_set = set(ranked) | always_included
+        covered = sum(counts[char] for char in char_set)
+        print(f"頻率截斷: 保留前 {top_n} 個字元 (另有 {len(char_set) - top_n} 個固定保留)，"
+              f"涵蓋 {covered / sum(counts.values()):.2%} 的出現次數。")
 
-    output_dir = os.path.dirname(OUTPUT_CHARSET_PATH)
-    if not os.path.exists(output_dir):
+    output_dir = os.path.dirname(output_path)
+    if output_dir and not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
-    sorted_chars = sorted(list(char_set))
-    with open(OUTPUT_CHARSET_PATH, "w", encoding="utf-8") as f:
+    sorted_chars = sorted(char_set)
+    with open(output_path, "w", encoding="utf-8") as f:
         f.write("".join(sorted_chars))
 
+    elapsed = time.perf_counter() - start_time
     print("-" * 30)
     print("字元集提取完成！")
     print(f"總共提取了 {len(sorted_chars)} 個獨立字元(包括符號)。")
-    print(f"字元集已儲存至: {OUTPUT_CHARSET_PATH}")
+    print(f"讀取 {total_bytes / 1024 / 1024:.1f} MB，行程數 {min(workers, max(len(tasks), 1))}，"
+          f"耗時 {elapsed:.2f} 秒 ({total_bytes / 1024 / 1024 / max(elapsed, 1e-9):.1f} MB/秒)。")
+    print(f"字元集已儲存至: {output_path}")
+    return sorted_chars
 
 
 if __name__ == "__main__":
-    extract_chars_from_tables()
\ No newline at end of file
+    extract_chars_from_tables()
@@ -1,23 +1,112 @@
+import cProfile
+import hashlib
+import io
+import json
+import math
 import os
+import pickle
+import pstats
 import struct
-from collections import defaultdict
+import sys
+import time
+import tracemalloc
+import unicodedata
+from collections import defaultdict, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import PIL
 from PIL import Image, ImageDraw, ImageFont
 
 # ==============================================================================
 # --- 全局配置 ---
 # ==============================================================================
 # --- 輸入檔案 ---
-IME_SOURCE_FILES = [
-    "../ime_data/BPMFBase.txt",
-    "../ime_data/BPMFPunctuations.txt"
-]
+# 查表式輸入法方案。每個方案: 碼表來源 (可多個)、來源格式、key 編碼方式、模擬器用的 .imx 輸出路徑。
+# 來源格式: "char-code" 每行「字 碼」(如 BPMFBase.txt)；"cin" 為 gcin/OpenVanilla 的 .cin，%chardef 區段內每行「碼 字」
+# key 編碼: "bopomofo" 聲調符號轉數字並補一聲；"pinyin" 聲調符號轉數字 (ü 寫作 v，輕聲補 5)；"lower" 轉小寫
+# 所有方案都輸出相同的「索引 + 資料池」格式 (.h 中的 <方案名>_idx_raw_opt / <方案名>_pool_opt)
+IME_SCHEMES = {
+    "zhuyin": {"sources": ["../ime_data/BPMFBase.txt"], "format": "char-code", "key": "bopomofo",
+               "output": "../output_data/zhuyin.imx"},
+    "cangjie": {"sources": ["../ime_data/cj5-tc.cin"], "format": "cin", "key": "lower",
+                "output": "../output_data/cangjie.imx"},
+    "pinyin": {"sources": ["../ime_data/pinyin.txt"], "format": "char-code", "key": "pinyin",
+               "output": "../output_data/pinyin.imx"},
+    "array": {"sources": ["../ime_data/array30.cin"], "format": "cin", "key": "lower",
+              "output": "../output_data/array.imx"},
+}
+# 要建置的方案，第一個為預設方案 (轉換失敗時中止)；其他碼表放進 ime_data/ 後加入此清單即可
+IME_ENABLED_SCHEMES = ["zhuyin"]
+# CHARSET_MODE = 'AUTO' 時，除了各方案的碼表外也從這些檔案 (每行第一欄) 提取字元
+IME_EXTRA_CHARSET_FILES = ["../ime_data/BPMFPunctuations.txt"]
+# 詞庫 (可選)：每行為「詞 注音-注音-... [頻率]」，例如「巴巴 ㄅㄚ-ㄅㄚ 120」。設為 None 則不產生詞庫
+PHRASE_SOURCE_FILE = "../ime_data/BPMFMappings.txt"
+# 字頻表：每行第一欄為一個字，依使用頻率由高到低排列 (與 charset_extractor.py 使用同一份檔案)
+# 設為 None 則保留候選字在碼表中的原始順序
+FREQUENCY_TABLE_PATH = "../ime_data/字頻表.txt"
+# 輸入法索引格式: "auto" (資料池不超過 64 KB 時用 16-bit 的 ImeIndexRecord_Opt，否則改用區塊索引)、
+# "flat" 或 "blocked"。區塊索引以 IME_INDEX_BLOCK_SIZE 個 key 為一組做前綴壓縮，位移為 32 位元
+IME_INDEX_LAYOUT = "auto"
+IME_INDEX_BLOCK_SIZE = 16
 # FONT_SOURCE_PATH = "../fonts/BoutiqueBitmap9x9_1.92.ttf"
 FONT_SOURCE_PATH = "../fonts/Cubic_11.ttf"
 FONT_INDEX = 0
 FONT_SIZE = 12
+# 渲染字形使用的行程數：1 = 單一行程，0 = 使用全部 CPU 核心；輸出結果與行程數無關
+FONT_RASTER_WORKERS = 1
+FONT_RASTER_CHUNK_SIZE = 512
+# 點陣圖格式: "1-byte-grayscale" (每像素 8 bit)、"4-bit-grayscale"、"2-bit-grayscale"、"1-bit-mono"
+# 低位元格式以列為單位打包 (每列補齊到整數位元組，高位元在前)，像素字型使用 "1-bit-mono" 即可
+GLYPH_BITMAP_FORMAT = "1-byte-grayscale"
+# 相同的點陣圖只存一份，多個字元共用同一個 offset (對解碼端透明)
+GLYPH_DEDUPLICATE = True
+# 每個字形的壓縮方式: None 或 "rle" (PackBits 式行程編碼，解碼時間與字形大小成正比)
+GLYPH_COMPRESSION = None
+# 另外輸出兩層 codepoint 分頁表 (高位元組 -> 分頁, 低位元組 -> 紀錄索引)，查詢為 O(1)；False 則只能二分搜尋
+FONT_PAGE_TABLE = True
+# 字型對應表紀錄: "full" (含 unicode 的完整紀錄)、"compact" (8 bytes，unicode 由區段表推得) 或
+# "auto" (字型符合 compact 的限制時使用 compact，否則 full)
+FONT_MAP_RECORD_MODE = "auto"
+# 建置矩陣 (可選): 一次建置多個字型與大小，設為 None 則只建置上面的 FONT_SOURCE_PATH / FONT_INDEX / FONT_SIZE。
+# 每項為一個字型: name (C 識別字，用於陣列名稱)、path、index (.ttc 用，可省略)、sizes。清單順序即 fallback 順序:
+# 後面的字型只收錄前面的字型都沒有的字。每個字型檔只讀取一次，同一字型的各大小共用字元集與 codepoint 區段表
+# (.h 中只輸出一份)，每個大小只輸出自己的精簡紀錄與點陣圖。第一個字型的第一個大小同時輸出為原本的 font_*_opt 陣列
+FONT_BUILD_MATRIX = None
+# FONT_BUILD_MATRIX = [
+#     {"name": "cubic", "path": "../fonts/Cubic_11.ttf", "sizes": [12, 16]},
+#     {"name": "fallback", "path": "../fonts/NotoSansTC-Regular.otf", "sizes": [12, 16]},
+# ]
 
 # --- 輸出檔案 ---
 OUTPUT_H_FILE_PATH = "../output_data/picotype_data_optimized.h"
+# .h 中大型陣列的輸出方式: "inline" (以十六進位文字寫在 .h 中)、"embed" (C23 #embed，需 GCC 15 / Clang 19 以上)
+# 或 "incbin" (GNU as 的 .incbin，需以 -Wa,-I<.h 所在目錄> 編譯)。後兩者把陣列內容寫成 HEADER_BIN_DIR 中的
+# <陣列名>.bin，.h 只剩宣告，編譯器不必解析數 MB 的數字文字，大型字型的編譯時間大幅縮短
+HEADER_ARRAY_MODE = "inline"
+HEADER_BIN_DIR = "../output_data/picotype_bin"
+# 串流寫出 .h 時每次格式化的位元組數，記憶體用量只與此值有關，與陣列大小無關
+HEADER_CHUNK_SIZE = 64 * 1024
+# 模擬器 (main.py) 使用的二進位字型檔會輸出到此目錄: <字型檔名>_<大小>.fmap / .font
+OUTPUT_SIM_DIR = "../output_data"
+OUTPUT_SIM_PHRASE_PATH = "../output_data/zhuyin_phrase.imx"
+
+# --- 增量建置快取 ---
+# 以內容雜湊為鍵快取已渲染的字形與各步驟的結果；設為 None 則每次都完整重建
+BUILD_CACHE_DIR = "../build_cache"
+BUILD_CACHE_MAX_BYTES = 256 * 1024 * 1024 # 超過時刪除最久未使用的快取檔
+BUILD_CACHE_VERSION = 4 # 輸出格式改變時遞增，使舊快取失效
+
+# --- 建置報告與效能分析 ---
+# 每次建置後寫出 JSON 報告: 各步驟耗時 (與峰值記憶體，見 BUILD_TRACE_MEMORY)、渲染速度、各輸出陣列與檔案大小、相關設定；設為 None 則不輸出
+BUILD_REPORT_PATH = "../output_data/build_report.json"
+# 每次建置的報告另外附加一行到此 JSON Lines 檔，可比較不同字型、字元集或設定的建置；設為 None 則不保留歷史
+BUILD_REPORT_HISTORY_PATH = "../output_data/build_history.jsonl"
+# 設為 True 時以 tracemalloc 量測每個步驟的 Python 峰值記憶體 (只含主行程)。tracemalloc 會追蹤每次配置，
+# 建置明顯變慢，因此預設關閉，需要調查記憶體時再開啟；關閉時報告中沒有 peak_bytes
+BUILD_TRACE_MEMORY = False
+# 設定路徑時以 cProfile 分析整個建置 (只含主行程)，輸出 .prof 檔 (可用 snakeviz 等工具檢視)，並印出累計耗時最多的函式
+BUILD_PROFILE_PATH = None
+BUILD_PROFILE_TOP = 20
 
 # --- 字元集生成模式 ---
 # 'AUTO': 自動從輸入法碼表提取 (預設)
@@ -29,18 +118,94 @@ CHARSET_MODE = 'FILE'  # <<< 修改這裡來切換模式
 # CHARSET_FILE_PATH = "../charsets/chars_from_ime_tcsc.txt" # <<< 您可以指向任何字元集檔案
 CHARSET_FILE_PATH = "../charsets/chars_from_tcfreq_sc.txt" # 繁體來自字頻表另加上簡體字
 
+# --- 字元覆蓋分析 ---
+# 直接讀取字型的 cmap (不需渲染)，比對字型、輸入法候選字 (含詞庫) 與字元集:
+# "off" 不分析；"report" 只報告覆蓋率與可省下的空間；"subset" 字元集改為「輸入法打得出的字 + 固定字元」中字型有字形的部分，
+# 刪除輸入法打不出的字形與字型沒有的字 (只會渲染成缺字方塊)。固定字元為 ASCII、IME_EXTRA_CHARSET_FILES 與 COVERAGE_KEEP_CHARS
+COVERAGE_MODE = "report"
+# True 時同時從輸入法與詞庫中移除沒有字形的候選字 (否則這些字在螢幕上會是空白)
+COVERAGE_DROP_UNRENDERABLE_CANDIDATES = False
+# 子集化時一律保留的字元 (介面文字等)，預設為模擬器畫面上的標籤
+COVERAGE_KEEP_CHARS = "輸入整句注音倉頡拼音行列"
+
 # --- 二進位格式定義 ---
 IME_INDEX_FORMAT_OPTIMIZED = "<HBxHH"
-FONT_MAP_FORMAT_OPTIMIZED = "<IIBBbbbB"
+# 與 .h 的 FontMapRecord_Opt 相同: unicode, offset, width, height, x_advance (uint8), x_offset, y_offset (int8), padding
+FONT_MAP_FORMAT_OPTIMIZED = "<IIBBBbbB"
+# 模擬器 .fmap 檔頭: magic, 版本, 點陣圖格式代碼, 字體大小, 紀錄數；其後緊接 FONT_MAP_FORMAT_OPTIMIZED 紀錄
+FONT_MAP_FILE_MAGIC = b"PTFM"
+FONT_MAP_FILE_VERSION = 2
+FONT_MAP_FILE_HEADER_FORMAT = "<4sBBHI"
+# 版本 2 在紀錄之後附加分頁表: FONT_PAGE_TABLE_HEADER_FORMAT (目錄項數, 分頁數)，
+# 再接 uint16 目錄 (codepoint >> 8 -> 分頁編號) 與 uint16 分頁 (每頁 256 項，codepoint & 0xFF -> 紀錄索引)。
+# 分頁 0 固定為共用的空分頁；FONT_PAGE_EMPTY 表示沒有此字元。版本 1 檔案沒有分頁表。
+FONT_PAGE_TABLE_HEADER_FORMAT = "<HH"
+# 版本 3 為精簡紀錄: 檔頭後接 "<I" 區段數、FONT_RANGE_FORMAT 區段表、FONT_MAP_COMPACT_FORMAT 紀錄，其後可附加分頁表。
+# 區段表記錄每段連續 codepoint 的起點與第一筆紀錄的索引，段長由下一段的索引推得。
+# 精簡紀錄: uint32 (低 24 位元為 offset，高 8 位元為 width), height, x_advance, x_offset, y_offset
+FONT_MAP_FILE_VERSION_COMPACT = 3
+FONT_RANGE_FORMAT = "<IH"
+FONT_MAP_COMPACT_FORMAT = "<IBBbb"
+FONT_MAP_COMPACT_MAX_OFFSET = (1 << 24) - 1
+# 精簡紀錄各 1 byte 欄位的範圍 (width 佔 uint32 的高 8 位元)，與 FontMapRecord_Compact 相同
+FONT_MAP_COMPACT_FIELD_RANGES = (("width", 0, 0xFF), ("height", 0, 0xFF), ("x_advance", 0, 0xFF),
+                                 ("x_offset", -0x80, 0x7F), ("y_offset", -0x80, 0x7F))
+FONT_PAGE_SIZE = 256
+FONT_PAGE_EMPTY = 0xFFFF
+BITMAP_FORMAT_CODES = {"1-byte-grayscale": 0, "4-bit-grayscale": 1, "2-bit-grayscale": 2, "1-bit-mono": 3}
+BITMAP_FORMAT_BPP = {"1-byte-grayscale": 8, "4-bit-grayscale": 4, "2-bit-grayscale": 2, "1-bit-mono": 1}
+# 壓縮方式記錄在格式代碼的高 4 位元 (低 4 位元為 BITMAP_FORMAT_CODES)
+BITMAP_COMPRESSION_FLAGS = {None: 0x00, "rle": 0x10}
+# 格式代碼的最高位元: 紀錄的 x_advance / x_offset / y_offset 是依字型實際的字形外框算出的 (本工具輸出的 .fmap 都有)；
+# 由舊版 .map 遷移而來的檔案沒有這些資訊，不設此旗標，模擬器會改用舊版的 width + 1 排版
+FONT_MAP_FLAG_METRICS = 0x80
+# 模擬器 .imx 檔頭: magic, 版本, 索引紀錄數, 資料池大小；其後為 IME_INDEX_FORMAT_OPTIMIZED 索引與資料池
+IME_INDEX_FILE_MAGIC = b"PTIM"
+IME_INDEX_FILE_VERSION = 1
+IME_INDEX_FILE_HEADER_FORMAT = "<4sBxxxII"
+# 版本 2 (區塊索引) 沒有 16-bit 位移的限制: 索引部分以 IME_BLOCKED_INDEX_HEADER_FORMAT
+# (magic, 紀錄數, key 區大小, 每區塊紀錄數) 開頭，接著每個區塊一筆 IME_BLOCK_FORMAT (key 區位移, 資料池位移)，
+# 再接 key 區。key 區中每筆紀錄為 [與前一個 key 相同的前綴長度][後綴長度][後綴][資料長度 (LEB128)]，
+# 每個區塊的第一個 key 完整存放，資料依序存放，位移由區塊起點累加。資料池只放候選字資料。
+IME_INDEX_FILE_VERSION_BLOCKED = 2
+IME_BLOCKED_INDEX_MAGIC = b"PTIB"
+IME_BLOCKED_INDEX_HEADER_FORMAT = "<4sIIHxx"
+IME_BLOCK_FORMAT = "<II"
+# 詞庫沿用 IME 的「索引 + 資料池」格式，key 為以 '-' 連接的多個音節 (如 "ㄅㄚ1-ㄅㄚ1")。
+# 每個 key 的資料: [詞數 n (1 byte)][n 個成本 (各 1 byte)][n 個詞的 UTF-8，每個詞的字數等於音節數]
+# 成本 = round(-10 * log10(詞頻 / 總詞頻))，越小越常用；沒有詞頻時使用 PHRASE_DEFAULT_COST
+PHRASE_DEFAULT_COST = 40
+PHRASES_PER_KEY_LIMIT = 255
 
 # ==============================================================================
 # --- 主函式 ---
 # ==============================================================================
 def main():
+    """執行建置；依設定以 cProfile 分析，並在結束時 (包括中途失敗) 寫出建置報告。"""
+    report = BuildReport(BUILD_TRACE_MEMORY)
+    profiler = cProfile.Profile() if BUILD_PROFILE_PATH else None
+    if profiler: profiler.enable()
+    try:
+        report.status = "ok" if build(report) is not False else "failed"
+    finally:
+        if profiler:
+            profiler.disable()
+            output_dir = os.path.dirname(BUILD_PROFILE_PATH)
+            if output_dir and not os.path.exists(output_dir): os.makedirs(output_dir)
+            profiler.dump_stats(BUILD_PROFILE_PATH)
+            print(f"\ncProfile 結果已儲存至: {BUILD_PROFILE_PATH} (累計耗時前 {BUILD_PROFILE_TOP} 名):")
+            pstats.Stats(profiler).sort_stats("cumulative").print_stats(BUILD_PROFILE_TOP)
+        report.finish()
+        report.print_summary()
+        if BUILD_REPORT_PATH: report.write(BUILD_REPORT_PATH, BUILD_REPORT_HISTORY_PATH)
+
+def build(report):
+    """完整建置流程，失敗時回傳 False。各步驟的耗時、記憶體與輸出大小記錄在 report (BuildReport)。"""
     print("--- PicoType 全功能硬編碼轉換工具 (可選字元集版) ---")
 
     # --- 1. 根據模式獲取字元集 ---
-    print(f"\n[步驟 1/4] 獲取字元集 (模式: {CHARSET_MODE})...")
+    print(f"\n[步驟 1/5] 獲取字元集 (模式: {CHARSET_MODE})...")
+    report.begin_stage("charset")
     
     base_charset = set()
     if CHARSET_MODE == 'AUTO':
@@ -51,30 +216,115 @@ def main():
         base_charset = extract_charset_from_file()
     else:
         print(f"錯誤: 無效的 CHARSET_MODE '{CHARSET_MODE}'。")
-        return
+        return False
 
     if not base_charset:
         print("錯誤: 未能獲取到任何字元。")
-        return
+        return False
 
     # 加入 ASCII 基礎字元
     ascii_chars = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789 ,.?!:;()[]{}<>@#$%^&*-=_+`~'“\"\\|/"
     final_charset = "".join(sorted(list(base_charset | set(ascii_chars))))
     print(f"獲取完成，共計 {len(final_charset)} 個獨立字元將被包含。")
+    report.stats["charset_chars"] = len(final_charset)
+
+    print(f"\n[步驟 2/5] 分析字元覆蓋 (模式: {COVERAGE_MODE})...")
+    report.begin_stage("coverage")
+    renderable, unreachable_count = None, 0
+    if COVERAGE_MODE != "off":
+        fixed_chars = set(ascii_chars) | extract_extra_charset() | set(COVERAGE_KEEP_CHARS)
+        final_charset, renderable, unreachable_count = analyze_coverage(final_charset, fixed_chars)
+        if not final_charset: return False
+        report.stats["coverage_chars"] = len(final_charset)
+    if not COVERAGE_DROP_UNRENDERABLE_CANDIDATES: renderable = None
+    renderable_key = BuildCache.hash_bytes("".join(sorted(renderable)).encode('utf-8')) if renderable is not None else None
 
-    # ... (後續步驟 main, convert_font, convert_ime, generate_header 都保持不變) ...
-    print("\n[步驟 2/4] 轉換字型為優化的二進位格式...")
-    font_map_data, font_bitmap_data = convert_font_optimized(final_charset)
-    if font_map_data is None: return
+    build_cache = BuildCache(BUILD_CACHE_DIR, BUILD_CACHE_MAX_BYTES) if BUILD_CACHE_DIR else None
+
+    print("\n[步驟 3/5] 轉換字型為優化的二進位格式...")
+    report.begin_stage("font")
+    if FONT_BUILD_MATRIX:
+        font_variants = convert_font_matrix(final_charset, cache=build_cache, report=report)
+        if not font_variants: return False
+        # 第一個字型的第一個大小也輸出為原本的 font_*_opt 陣列與預設的模擬器字型；
+        # 這些陣列沿用單一字型時的語意 (缺字時 font_lookup_opt 回傳 nullptr)，因此去掉佔位紀錄
+        font_map_data = strip_missing_records(font_variants[0].font_map_data)
+        font_bitmap_data = font_variants[0].font_bitmap_data
+        for variant in font_variants:
+            report.sizes[f"font_{variant.name}_{variant.size}_map"] = len(variant.font_map_data)
+            report.sizes[f"font_{variant.name}_{variant.size}_bitmap"] = len(variant.font_bitmap_data)
+    else:
+        font_map_data, font_bitmap_data = convert_font_optimized(final_charset, cache=build_cache, report=report)
+        if font_map_data is None: return False
+        font_variants = [FontVariant(None, FONT_SOURCE_PATH, FONT_SIZE, font_map_data, font_bitmap_data)]
+        report.sizes["font_map"] = len(font_map_data)
+        report.sizes["font_bitmap"] = len(font_bitmap_data)
     print("字型轉換完成。")
-    print("\n[步驟 3/4] 轉換輸入法碼表為優化的二進位格式...")
-    ime_idx_data, ime_pool_data = convert_ime_optimized()
-    if ime_idx_data is None: return
+    if unreachable_count:
+        glyph_count = len(font_map_data) // struct.calcsize(FONT_MAP_FORMAT_OPTIMIZED)
+        glyph_bytes = (len(font_map_data) + len(font_bitmap_data)) / max(glyph_count, 1)
+        action = "已刪除" if COVERAGE_MODE == "subset" else "子集化可刪除"
+        print(f"{action} {unreachable_count} 個有字形但打不出的字，估計節省 {unreachable_count * glyph_bytes:,.0f} bytes "
+              f"(以目前平均每字 {glyph_bytes:.1f} bytes 計)。")
+    print("\n[步驟 4/5] 轉換輸入法碼表為優化的二進位格式...")
+    report.begin_stage("ime")
+    ime_indexes = {}
+    for scheme_name in IME_ENABLED_SCHEMES:
+        scheme = IME_SCHEMES[scheme_name]
+        ime_idx_data, ime_pool_data = run_cached_stage(
+            build_cache, f"ime-{scheme_name}", scheme["sources"] + [FREQUENCY_TABLE_PATH],
+            (scheme, IME_INDEX_FORMAT_OPTIMIZED, IME_INDEX_LAYOUT, IME_INDEX_BLOCK_SIZE, renderable_key),
+            partial(convert_ime_optimized, scheme_name, renderable))
+        if ime_idx_data is None:
+            if scheme_name == IME_ENABLED_SCHEMES[0]: return False
+            print(f"警告: 輸入法方案 '{scheme_name}' 轉換失敗，已跳過。")
+            continue
+        ime_indexes[scheme_name] = (ime_idx_data, ime_pool_data)
+        report.sizes[f"{scheme_name}_idx"] = len(ime_idx_data)
+        report.sizes[f"{scheme_name}_pool"] = len(ime_pool_data)
+    phrase_idx_data, phrase_pool_data = run_cached_stage(
+        build_cache, "phrase", [PHRASE_SOURCE_FILE],
+        (IME_INDEX_FORMAT_OPTIMIZED, IME_INDEX_LAYOUT, IME_INDEX_BLOCK_SIZE, PHRASE_DEFAULT_COST, PHRASES_PER_KEY_LIMIT,
+         renderable_key),
+        partial(convert_phrases_optimized, renderable))
+    if phrase_idx_data is not None:
+        report.sizes["phrase_idx"] = len(phrase_idx_data)
+        report.sizes["phrase_pool"] = len(phrase_pool_data)
     print("輸入法碼表轉換完成。")
-    print("\n[步驟 4/4] 生成 C++ 硬編碼標頭檔...")
-    generate_header_file_optimized(ime_idx_data, ime_pool_data, font_map_data, font_bitmap_data)
+    print("\n[步驟 5/5] 生成 C++ 硬編碼標頭檔...")
+    report.begin_stage("output")
+    sim_base_paths = [os.path.join(OUTPUT_SIM_DIR, f"{os.path.basename(variant.path)}_{variant.size}")
+                      for variant in font_variants]
+    output_paths = [OUTPUT_H_FILE_PATH] + [base_path + extension for base_path in sim_base_paths for extension in (".fmap", ".font")]
+    if HEADER_ARRAY_MODE != "inline": output_paths.append(HEADER_BIN_DIR)
+    output_paths += [IME_SCHEMES[scheme_name]["output"] for scheme_name in ime_indexes]
+    if phrase_idx_data is not None: output_paths.append(OUTPUT_SIM_PHRASE_PATH)
+    output_key = BuildCache.hash_bytes(
+        *(data for variant in font_variants for data in (variant.font_map_data, variant.font_bitmap_data)),
+        *(data for pair in ime_indexes.values() for data in pair),
+        phrase_idx_data or b"", phrase_pool_data or b"",
+        repr((output_paths, FONT_PAGE_TABLE, FONT_MAP_RECORD_MODE, HEADER_ARRAY_MODE, FONT_BUILD_MATRIX)).encode('utf-8'))
+    if build_cache and build_cache.outputs_fresh("outputs", output_key, output_paths):
+        print("輸入資料未變更，沿用既有的輸出檔。")
+    else:
+        writer = generate_header_file_optimized(ime_indexes, font_map_data, font_bitmap_data,
+                                                phrase_idx_data, phrase_pool_data,
+                                                font_variants if FONT_BUILD_MATRIX else None)
+        report.stats["header_text_chars"] = writer.text_size
+        report.stats["header_bin_bytes"] = writer.bin_size
+        for base_path, variant in zip(sim_base_paths, font_variants):
+            write_simulator_font_files(base_path, variant.size, strip_missing_records(variant.font_map_data),
+                                       variant.font_bitmap_data, GLYPH_BITMAP_FORMAT, GLYPH_COMPRESSION)
+        for scheme_name, (ime_idx_data, ime_pool_data) in ime_indexes.items():
+            write_ime_index_file(IME_SCHEMES[scheme_name]["output"], ime_idx_data, ime_pool_data)
+        if phrase_idx_data is not None:
+            write_ime_index_file(OUTPUT_SIM_PHRASE_PATH, phrase_idx_data, phrase_pool_data)
+        if build_cache: build_cache.mark_outputs("outputs", output_key)
+    report.record_files([path for path in output_paths if os.path.isfile(path)])
     print("\n--- 所有任務完成！ ---")
     print(f"輸出檔案: {OUTPUT_H_FILE_PATH}")
+    print("模擬器字型: " + ", ".join(f"{base_path}.fmap / .font" for base_path in sim_base_paths))
+    print(f"模擬器輸入法: {', '.join(IME_SCHEMES[scheme_name]['output'] for scheme_name in ime_indexes)}")
 
 # ==============================================================================
 # --- 輔助函式 ---
@@ -82,26 +332,152 @@ def main():
 
 # --- 新增和修改的字元集提取函式 ---
 def extract_charset_from_ime():
-    """從輸入法碼表檔案中提取字元集。"""
+    """從各輸入法方案的碼表 (以及 IME_EXTRA_CHARSET_FILES) 中提取字元集。"""
+    char_set = set()
+    for scheme_name in IME_ENABLED_SCHEMES:
+        scheme = IME_SCHEMES[scheme_name]
+        for filepath in scheme["sources"]:
+            try:
+                char_set.update(char for char, _ in read_ime_source(filepath, scheme["format"]))
+            except FileNotFoundError:
+                print(f"警告: 找不到檔案 '{filepath}'，已跳過。")
+    return char_set | extract_extra_charset()
+
+def extract_extra_charset():
+    """IME_EXTRA_CHARSET_FILES 中每行的第一欄 (標點符號等)。"""
     char_set = set()
-    for filepath in IME_SOURCE_FILES:
+    for filepath in IME_EXTRA_CHARSET_FILES:
         try:
             with open(filepath, "r", encoding="utf-8") as f:
-                lines = f.readlines()
-            if "BPMFBase.txt" in filepath:
-                for line in lines:
-                    parts = line.strip().split()
-                    if len(parts) >= 1 and len(parts[0]) == 1:
-                        char_set.add(parts[0])
-            elif "BPMFPunctuations.txt" in filepath:
-                for line in lines:
+                for line in f:
                     parts = line.strip().split(" ", 1)
-                    if parts:
+                    if parts and parts[0]:
                         char_set.add(parts[0])
         except FileNotFoundError:
             print(f"警告: 找不到檔案 '{filepath}'，已跳過。")
     return char_set
 
+def read_font_cmap(path, font_index=0, data=None):
+    """
+    直接解析 TrueType/OpenType (含 .ttc) 的 cmap 表，回傳字型有字形的 codepoint 集合。
+    支援 Unicode 子表的格式 4 (BMP) 與格式 12 (完整 Unicode)；只讀表格不渲染，完整 CJK 字型也只需數十毫秒。
+    已讀入字型檔內容時可由 data 傳入，不再開檔。
+    """
+    if data is None:
+        with open(path, "rb") as f:
+            data = f.read()
+    font_offset = 0
+    if data[:4] == b"ttcf":
+        font_offset = struct.unpack_from(">I", data, 12 + 4 * font_index)[0]
+    table_count = struct.unpack_from(">H", data, font_offset + 4)[0]
+    for i in range(table_count):
+        tag, _, cmap_offset, _ = struct.unpack_from(">4sIII", data, font_offset + 12 + 16 * i)
+        if tag == b"cmap": break
+    else:
+        raise ValueError("字型中沒有 cmap 表")
+    subtable_count = struct.unpack_from(">H", data, cmap_offset + 2)[0]
+    codepoints = set()
+    for i in range(subtable_count):
+        platform_id, encoding_id, subtable_offset = struct.unpack_from(">HHI", data, cmap_offset + 4 + 8 * i)
+        if not (platform_id == 0 or (platform_id == 3 and encoding_id in (1, 10))): continue
+        start = cmap_offset + subtable_offset
+        subtable_format = struct.unpack_from(">H", data, start)[0]
+        if subtable_format == 4:
+            segment_count = struct.unpack_from(">H", data, start + 6)[0] // 2
+            ends_offset = start + 14
+            starts_offset = ends_offset + 2 * segment_count + 2
+            deltas_offset = starts_offset + 2 * segment_count
+            range_offsets_offset = deltas_offset + 2 * segment_count
+            ends = struct.unpack_from(f">{segment_count}H", data, ends_offset)
+            starts = struct.unpack_from(f">{segment_count}H", data, starts_offset)
+            deltas = struct.unpack_from(f">{segment_count}H", data, deltas_offset)
+            range_offsets = struct.unpack_from(f">{segment_count}H", data, range_offsets_offset)
+            for segment, (first, last, delta, range_offset) in enumerate(zip(starts, ends, deltas, range_offsets)):
+                for codepoint in range(first, min(last, 0xFFFE) + 1):
+                    if range_offset == 0:
+                        glyph = (codepoint + delta) & 0xFFFF
+                    else:
+                        glyph_offset = range_offsets_offset + 2 * segment + range_offset + 2 * (codepoint - first)
+                        glyph = struct.unpack_from(">H", data, glyph_offset)[0]
+                        if glyph: glyph = (glyph + delta) & 0xFFFF
+                    if glyph: codepoints.add(codepoint)
+        elif subtable_format == 12:
+            group_count = struct.unpack_from(">I", data, start + 12)[0]
+            for first, last, first_glyph in struct.iter_unpack(">III", data[start + 16:start + 16 + 12 * group_count]):
+                codepoints.update(range(first + (first_glyph == 0), last + 1))
+    return codepoints
+
+def collect_ime_candidates():
+    """各輸入法方案 (與詞庫) 能打出的字: {名稱: 字元集合}。"""
+    candidates = {}
+    for scheme_name in IME_ENABLED_SCHEMES:
+        scheme = IME_SCHEMES[scheme_name]
+        chars = set()
+        for filepath in scheme["sources"]:
+            try:
+                chars.update(char for char, _ in read_ime_source(filepath, scheme["format"]))
+            except FileNotFoundError:
+                pass
+        candidates[scheme_name] = chars
+    if PHRASE_SOURCE_FILE and os.path.exists(PHRASE_SOURCE_FILE):
+        with open(PHRASE_SOURCE_FILE, "r", encoding="utf-8") as f:
+            candidates["phrase"] = {char for line in f for char in (line.split() or [""])[0]}
+    return candidates
+
+def analyze_coverage(charset, fixed_chars):
+    """
+    比對字型 cmap、輸入法候選字與字元集，印出覆蓋報告。
+    回傳 (字元集, 會被渲染且有字形的字元集合, 有字形但打不出的字數)；COVERAGE_MODE 為 "subset" 時字元集會被縮減。
+    讀不到 cmap 或找不到任何輸入法候選字 (碼表檔案不存在) 時，無從判斷哪些字打不出，不縮減字元集也不估計節省。使用建置矩陣時，字型 cmap 為矩陣中所有字型的聯集 (fallback 鏈能顯示的字)。
+    """
+    start_time = time.perf_counter()
+    fonts = [(build["path"], build.get("index", 0)) for build in FONT_BUILD_MATRIX] if FONT_BUILD_MATRIX \
+        else [(FONT_SOURCE_PATH, FONT_INDEX)]
+    font_chars = set()
+    for font_path, font_index in fonts:
+        try:
+            font_chars.update(chr(codepoint) for codepoint in read_font_cmap(font_path, font_index))
+        except (OSError, ValueError, struct.error) as e:
+            print(f"警告: 無法讀取字型 '{font_path}' 的 cmap ({e})，略過覆蓋分析。")
+            return charset, None, 0
+    candidates_by_source = collect_ime_candidates()
+    candidates = set().union(*candidates_by_source.values())
+    charset_chars = set(charset)
+    reachable = candidates | fixed_chars
+
+    def sample(chars, limit=20):
+        return "".join(sorted(chars)[:limit]) + (" ..." if len(chars) > limit else "")
+
+    print(f"字型 cmap: {len(font_chars):,} 個字元。")
+    print("輸入法候選字: " + "、".join(f"{name} {len(chars):,}" for name, chars in candidates_by_source.items())
+          + f"，合計 {len(candidates):,} 個獨立字元。")
+    if candidates:
+        missing_glyphs = candidates - font_chars
+        print(f"  字型有字形: {len(candidates) - len(missing_glyphs):,} ({1 - len(missing_glyphs) / len(candidates):.2%})"
+              + (f"；沒有字形 {len(missing_glyphs):,}: {sample(missing_glyphs)}" if missing_glyphs else ""))
+        not_in_charset = (candidates & font_chars) - charset_chars
+        if not_in_charset:
+            print(f"  字型有字形但不在字元集中 {len(not_in_charset):,} 個 (打得出但會顯示成空白): {sample(not_in_charset)}")
+    no_glyph = charset_chars - font_chars
+    if not candidates:
+        print(f"警告: 找不到任何輸入法候選字 (碼表檔案不存在?)，無法判斷哪些字打不出，略過子集化。"
+              f"字元集 {len(charset_chars):,} 個字元中字型沒有字形 {len(no_glyph):,} 個。")
+        print(f"覆蓋分析耗時 {time.perf_counter() - start_time:.2f} 秒。")
+        return charset, charset_chars & font_chars, 0
+    unreachable = charset_chars - reachable
+    print(f"字元集 {len(charset_chars):,} 個字元: 輸入法打不出 {len(unreachable):,} 個，字型沒有字形 {len(no_glyph):,} 個。")
+
+    # 沒有字形的字本來就不會輸出紀錄與點陣圖，只有「有字形但打不出」的字刪除後才真的節省空間
+    dropped = unreachable & font_chars
+    if COVERAGE_MODE == "subset":
+        subset = reachable & font_chars
+        print(f"子集化後共 {len(subset):,} 個字元 (刪除 {len(charset_chars - subset):,} 個，"
+              f"加入 {len(subset - charset_chars):,} 個輸入法打得出的字)。")
+        charset_chars = subset
+        charset = "".join(sorted(subset))
+    print(f"覆蓋分析耗時 {time.perf_counter() - start_time:.2f} 秒。")
+    return charset, charset_chars & font_chars, len(dropped)
+
 def extract_charset_from_file():
     """從指定的文字檔中讀取字元集。"""
     char_set = set()
@@ -116,31 +492,241 @@ def extract_charset_from_file():
         print(f"錯誤: 找不到字元集檔案 '{CHARSET_FILE_PATH}'。")
     return char_set
 
-def convert_font_optimized(charset):
+def convert_font_optimized(charset, workers=None, cache=None, report=None):
+    """
+    渲染字元集中的每個字元並打包。workers 大於 1 時以多個行程分段渲染，
+    結果依字元集原本的順序合併，輸出與單一行程完全相同。
+    提供 cache 時，只渲染快取中沒有的字元；提供 report (BuildReport) 時記錄渲染字數與速度。
+    """
     try:
-        font = ImageFont.truetype(FONT_SOURCE_PATH, FONT_SIZE, index=FONT_INDEX)
+        source = FontSource(FONT_SOURCE_PATH, FONT_INDEX)
+        source.font(FONT_SIZE)
     except IOError: return None, None
-    font_map_records, font_bitmap_data = [], bytearray()
-    for char in charset:
-        try:
-            bbox, x_advance = font.getbbox(char), font.getlength(char)
-            left, top, right, bottom = bbox
-            glyph_width, glyph_height = right - left, bottom - top
-        except AttributeError:
-             (glyph_width, glyph_height) = font.getsize(char)
-             left, top, x_advance = 0, 0, glyph_width
-        if glyph_width == 0 or glyph_height == 0:
-            if char == ' ':
-                glyph_width, glyph_height, left, top = int(x_advance) if x_advance > 0 else FONT_SIZE // 3, FONT_SIZE, 0, 0
-            else: continue
-        char_image = Image.new("L", (glyph_width, glyph_height), 0)
-        ImageDraw.Draw(char_image).text((-left, -top), char, font=font, fill=255)
-        offset = len(font_bitmap_data)
-        font_bitmap_data.extend(char_image.tobytes())
+    glyphs = rasterize_charset(source, FONT_SIZE, charset, workers, cache, report)
+    return pack_glyphs(charset, glyphs, report=report)
+
+class FontSource:
+    """一個字型檔 (與 .ttc 中的 index)。檔案只讀取一次，各大小的 ImageFont、cmap 與快取雜湊都由這份內容產生。"""
+    def __init__(self, path, index=0):
+        self.path = path
+        self.index = index
+        with open(path, "rb") as f:
+            self.data = f.read()
+        self.content_hash = BuildCache.hash_bytes(self.data) # 與 BuildCache.hash_files(path) 相同
+        self._fonts = {}
+        self._cmap = None
+
+    def font(self, size):
+        if size not in self._fonts:
+            self._fonts[size] = ImageFont.truetype(io.BytesIO(self.data), size, index=self.index)
+        return self._fonts[size]
+
+    def cmap(self):
+        """字型有字形的 codepoint 集合 (見 read_font_cmap)。"""
+        if self._cmap is None:
+            self._cmap = read_font_cmap(self.path, self.index, data=self.data)
+        return self._cmap
+
+def rasterize_charset(source, font_size, charset, workers=None, cache=None, report=None):
+    """以 source (FontSource) 的 font_size 渲染 charset 中的每個字，回傳與 charset 同順序的 rasterize_glyph 結果。"""
+    if workers is None: workers = FONT_RASTER_WORKERS
+    if workers <= 0: workers = os.cpu_count() or 1
+    start_time = time.perf_counter()
+    cached_glyphs, glyph_key = {}, None
+    if cache:
+        # 不同版本的 Pillow 渲染結果可能不同，一併納入鍵值
+        glyph_key = BuildCache.hash_bytes(
+            source.content_hash.encode('utf-8'),
+            f"{font_size}-{source.index}-{PIL.__version__}".encode('utf-8'))
+        cached_glyphs = cache.load_glyphs(glyph_key)
+    missing_chars = "".join(char for char in charset if char not in cached_glyphs)
+    if workers == 1 or not missing_chars:
+        font = source.font(font_size)
+        new_glyphs = [rasterize_glyph(font, char, font_size) for char in missing_chars]
+    else:
+        chunks = [missing_chars[i:i + FONT_RASTER_CHUNK_SIZE] for i in range(0, len(missing_chars), FONT_RASTER_CHUNK_SIZE)]
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_raster_worker,
+                                 initargs=(source.path, font_size, source.index)) as executor:
+            new_glyphs = [glyph for chunk_glyphs in executor.map(_rasterize_chunk, chunks) for glyph in chunk_glyphs]
+    cached_glyphs.update(zip(missing_chars, new_glyphs))
+    if cache and missing_chars:
+        cache.save_glyphs(glyph_key, cached_glyphs)
+    glyphs = [cached_glyphs[char] for char in charset]
+    if cache:
+        print(f"字形快取: 沿用 {len(charset) - len(missing_chars)} 個，新渲染 {len(missing_chars)} 個。")
+    elapsed = time.perf_counter() - start_time
+    print(f"渲染 {len(missing_chars)} 個字元 (行程數: {workers})，耗時 {elapsed:.2f} 秒，"
+          f"約 {len(missing_chars) / elapsed if elapsed else 0:.0f} 字/秒。")
+    if report:
+        # 建置矩陣會渲染多次，數字逐次累加
+        report.add_stats(glyphs_rasterized=len(missing_chars), glyphs_from_cache=len(charset) - len(missing_chars),
+                         raster_seconds=elapsed)
+        report.stats["raster_workers"] = workers
+        raster_seconds = report.stats["raster_seconds"]
+        report.stats["glyphs_per_second"] = round(report.stats["glyphs_rasterized"] / raster_seconds, 1) if raster_seconds else None
+    return glyphs
+
+def pack_glyphs(charset, glyphs, keep_missing=False, report=None):
+    """
+    把渲染結果編碼並打包成 (FONT_MAP_FORMAT_OPTIMIZED 紀錄陣列, 點陣圖資料池)。
+    沒有字形的字通常直接略過；keep_missing 為 True 時改以全 0 的紀錄佔位，讓同一字型的各大小擁有相同的 codepoint 欄。
+    """
+    font_map_records, font_bitmap_data, shared_offsets = [], bytearray(), {}
+    for char, glyph in zip(charset, glyphs):
+        if glyph is None:
+            if keep_missing:
+                font_map_records.append({"unicode": ord(char), "offset": 0, "width": 0, "height": 0,
+                                         "x_advance": 0, "x_offset": 0, "y_offset": 0, "padding": 0})
+            continue
+        glyph_width, glyph_height, x_advance, left, top, bitmap = glyph
+        encoded = encode_glyph_bitmap(bitmap, glyph_width, glyph_height, GLYPH_BITMAP_FORMAT, GLYPH_COMPRESSION)
+        offset = shared_offsets.get(encoded) if GLYPH_DEDUPLICATE else None
+        if offset is None:
+            offset = len(font_bitmap_data)
+            font_bitmap_data.extend(encoded)
+            shared_offsets[encoded] = offset
         font_map_records.append({
             "unicode": ord(char), "offset": offset, "width": glyph_width, "height": glyph_height,
             "x_advance": int(x_advance), "x_offset": left, "y_offset": top, "padding": 0
         })
+    if report:
+        report.add_stats(glyphs=len(font_map_records), unique_bitmaps=len(shared_offsets))
+    return pack_font_map_records(font_map_records), font_bitmap_data
+
+def convert_font_matrix(charset, builds=None, workers=None, cache=None, report=None):
+    """
+    依 FONT_BUILD_MATRIX 一次建置多個字型與大小，回傳依 fallback 順序排列的 FontVariant 清單。
+    每個字型檔只讀取一次；後面的字型只渲染前面的字型都沒有的字 (fallback 只會在前面的字型缺字時用到)。
+    同一字型的各大小使用相同的 codepoint 清單，某個大小渲染不出的字以全 0 的紀錄佔位，
+    因此各大小的 unicode 欄完全相同，標頭檔中的區段表只需輸出一份。
+    """
+    if builds is None: builds = FONT_BUILD_MATRIX
+    variants, covered = [], set()
+    for build in builds:
+        name, sizes = build["name"], build["sizes"]
+        if not name.isidentifier():
+            print(f"錯誤: 字型名稱 '{name}' 必須是合法的 C 識別字，已跳過。")
+            continue
+        try:
+            source = FontSource(build["path"], build.get("index", 0))
+        except IOError as e:
+            print(f"警告: 無法開啟字型 '{build['path']}' ({e})，已跳過。")
+            continue
+        try:
+            font_chars = {chr(codepoint) for codepoint in source.cmap()}
+        except (ValueError, struct.error) as e:
+            print(f"警告: 無法讀取字型 '{build['path']}' 的 cmap ({e})，將渲染整個字元集。")
+            font_chars = None
+        font_charset = "".join(char for char in charset
+                               if char not in covered and (font_chars is None or char in font_chars))
+        print(f"字型 '{name}' ({build['path']}): {len(font_charset)} 個字元，大小 {', '.join(map(str, sizes))}")
+        glyphs_by_size = [rasterize_charset(source, size, font_charset, workers, cache, report) for size in sizes]
+        # 只保留至少在一個大小有字形的字，各大小共用這份 codepoint 清單
+        kept = [i for i in range(len(font_charset)) if any(glyphs[i] is not None for glyphs in glyphs_by_size)]
+        font_charset = "".join(font_charset[i] for i in kept)
+        if not font_charset:
+            print(f"警告: 字型 '{name}' 沒有任何需要的字形 (都已由前面的字型提供或字型缺字)，已跳過。")
+            continue
+        for size, glyphs in zip(sizes, glyphs_by_size):
+            font_map_data, font_bitmap_data = pack_glyphs(font_charset, [glyphs[i] for i in kept], keep_missing=True, report=report)
+            try:
+                pack_compact_font_map(font_map_data)
+            except ValueError as e:
+                print(f"錯誤: 字型 '{name}' 大小 {size} 不符合精簡紀錄格式 ({e})，建置矩陣需要精簡紀錄，已跳過。")
+                continue
+            variants.append(FontVariant(name, source.path, size, font_map_data, font_bitmap_data))
+        covered.update(font_charset)
+    return variants
+
+def strip_missing_records(font_map_data):
+    """移除 keep_missing 產生的全 0 佔位紀錄 (模擬器的 .fmap 不需要共用 codepoint 欄)。"""
+    record_size = struct.calcsize(FONT_MAP_FORMAT_OPTIMIZED)
+    return b"".join(font_map_data[i:i + record_size] for i in range(0, len(font_map_data), record_size)
+                    if any(font_map_data[i + 4:i + record_size]))
+
+def encode_glyph_bitmap(bitmap, width, height, bitmap_format, compression=None):
+    """依設定的點陣圖格式打包，必要時再壓縮，回傳存入點陣圖資料池的 bytes。"""
+    packed = pack_glyph_bitmap(bitmap, width, height, BITMAP_FORMAT_BPP[bitmap_format])
+    if compression == "rle": return rle_encode(packed)
+    return packed
+
+def rle_encode(data):
+    """
+    PackBits 式行程編碼。控制位元組 c:
+    0x00-0x7F: 後面接 c + 1 個原樣複製的位元組；0x80-0xFF: 下一個位元組重複 c - 0x7E 次 (2~129)。
+    解碼端已知解壓後的長度 (由寬、高與格式算出)，因此不需要結束標記。
+    """
+    encoded, literal, i = bytearray(), bytearray(), 0
+    def flush_literal():
+        for start in range(0, len(literal), 128):
+            chunk = literal[start:start + 128]
+            encoded.append(len(chunk) - 1)
+            encoded.extend(chunk)
+        literal.clear()
+    while i < len(data):
+        run = 1
+        while i + run < len(data) and run < 129 and data[i + run] == data[i]:
+            run += 1
+        if run >= 2:
+            flush_literal()
+            encoded.append(run + 0x7E)
+            encoded.append(data[i])
+        else:
+            literal.append(data[i])
+        i += run
+    flush_literal()
+    return bytes(encoded)
+
+def pack_glyph_bitmap(bitmap, width, height, bits_per_pixel):
+    """
+    將 8-bit 灰階點陣圖量化並打包成每像素 bits_per_pixel 位元。
+    每列補齊到整數位元組，位元組內高位元在前 (最左邊的像素)。
+    """
+    if bits_per_pixel == 8: return bytes(bitmap)
+    max_level = (1 << bits_per_pixel) - 1
+    pixels_per_byte = 8 // bits_per_pixel
+    packed = bytearray()
+    for y in range(height):
+        row = bitmap[y * width:(y + 1) * width]
+        for x in range(0, width, pixels_per_byte):
+            byte = 0
+            for i in range(pixels_per_byte):
+                level = (row[x + i] * max_level + 127) // 255 if x + i < width else 0
+                byte |= level << (8 - bits_per_pixel * (i + 1))
+            packed.append(byte)
+    return bytes(packed)
+
+def rasterize_glyph(font, char, font_size):
+    """渲染單一字元，回傳 (寬, 高, x_advance, x_offset, y_offset, 點陣圖 bytes)；沒有字形時回傳 None。"""
+    try:
+        bbox, x_advance = font.getbbox(char), font.getlength(char)
+        left, top, right, bottom = bbox
+        glyph_width, glyph_height = right - left, bottom - top
+    except AttributeError:
+         (glyph_width, glyph_height) = font.getsize(char)
+         left, top, x_advance = 0, 0, glyph_width
+    if glyph_width == 0 or glyph_height == 0:
+        if char == ' ':
+            glyph_width, glyph_height, left, top = int(x_advance) if x_advance > 0 else font_size // 3, font_size, 0, 0
+        else: return None
+    char_image = Image.new("L", (glyph_width, glyph_height), 0)
+    ImageDraw.Draw(char_image).text((-left, -top), char, font=font, fill=255)
+    return glyph_width, glyph_height, x_advance, left, top, char_image.tobytes()
+
+# 每個渲染行程只載入一次字型
+_worker_font = None
+_worker_font_size = None
+
+def _init_raster_worker(font_path, font_size, font_index):
+    global _worker_font, _worker_font_size
+    _worker_font = ImageFont.truetype(font_path, font_size, index=font_index)
+    _worker_font_size = font_size
+
+def _rasterize_chunk(chars):
+    return [rasterize_glyph(_worker_font, char, _worker_font_size) for char in chars]
+
+def pack_font_map_records(font_map_records):
+    """依 unicode 排序並打包成 FONT_MAP_FORMAT_OPTIMIZED 紀錄陣列。"""
     font_map_records.sort(key=lambda r: r["unicode"])
     packed_font_map_data = bytearray()
     for record in font_map_records:
@@ -148,29 +734,268 @@ def convert_font_optimized(charset):
             FONT_MAP_FORMAT_OPTIMIZED, record["unicode"], record["offset"], record["width"],
             record["height"], record["x_advance"], record["x_offset"], record["y_offset"], record["padding"]
         ))
-    return packed_font_map_data, font_bitmap_data
+    return packed_font_map_data
+
+def build_font_page_table(font_map_data):
+    """
+    由已排序的紀錄陣列建立兩層分頁表，回傳 (目錄, 分頁) 兩個 uint16 (little-endian) 陣列。
+    查詢: index = pages[directory[cp >> 8] * FONT_PAGE_SIZE + (cp & 0xFF)]。
+    沒有任何字元的分頁都指向分頁 0 (共用的空分頁)，因此只有用到的分頁會佔空間。
+    紀錄數超過 uint16 可表示的範圍時回傳 (None, None)。
+    """
+    record_size = struct.calcsize(FONT_MAP_FORMAT_OPTIMIZED)
+    record_count = len(font_map_data) // record_size
+    if record_count >= FONT_PAGE_EMPTY:
+        print(f"警告: 字元數 {record_count} 超過分頁表上限，不輸出分頁表。")
+        return None, None
+    codepoints = [struct.unpack_from("<I", font_map_data, i * record_size)[0] for i in range(record_count)]
+    directory = [0] * ((codepoints[-1] // FONT_PAGE_SIZE + 1) if codepoints else 0)
+    pages = [[FONT_PAGE_EMPTY] * FONT_PAGE_SIZE]
+    for index, codepoint in enumerate(codepoints):
+        page_number = codepoint // FONT_PAGE_SIZE
+        if directory[page_number] == 0:
+            directory[page_number] = len(pages)
+            pages.append([FONT_PAGE_EMPTY] * FONT_PAGE_SIZE)
+        pages[directory[page_number]][codepoint % FONT_PAGE_SIZE] = index
+    flat_pages = [index for page in pages for index in page]
+    return struct.pack(f"<{len(directory)}H", *directory), struct.pack(f"<{len(flat_pages)}H", *flat_pages)
+
+def pack_compact_font_map(font_map_data):
+    """
+    把 FONT_MAP_FORMAT_OPTIMIZED 紀錄陣列轉成 (區段表, 精簡紀錄)。
+    字型不符合精簡格式的限制 (offset 超過 24 位元、欄位超出 1 byte、紀錄數超過 uint16) 時
+    拋出 ValueError 並說明原因。
+    """
+    ranges, records, previous = bytearray(), bytearray(), None
+    record_size = struct.calcsize(FONT_MAP_FORMAT_OPTIMIZED)
+    record_count = len(font_map_data) // record_size
+    if record_count > 0xFFFF:
+        raise ValueError(f"紀錄數 {record_count} 超過 65535")
+    for index in range(record_count):
+        unicode, offset, width, height, x_advance, x_offset, y_offset, _ = struct.unpack_from(
+            FONT_MAP_FORMAT_OPTIMIZED, font_map_data, index * record_size)
+        if offset > FONT_MAP_COMPACT_MAX_OFFSET:
+            raise ValueError(f"U+{unicode:04X} 的點陣圖 offset {offset} 超過 24 位元")
+        for (name, low, high), value in zip(FONT_MAP_COMPACT_FIELD_RANGES, (width, height, x_advance, x_offset, y_offset)):
+            if not low <= value <= high:
+                raise ValueError(f"U+{unicode:04X} 的 {name} {value} 超出 1 byte 範圍 ({low}~{high})")
+        if unicode != previous:
+            ranges.extend(struct.pack(FONT_RANGE_FORMAT, unicode, index))
+        previous = unicode + 1
+        records.extend(struct.pack(FONT_MAP_COMPACT_FORMAT, offset | width << 24, height, x_advance, x_offset, y_offset))
+    return bytes(ranges), bytes(records)
+
+def select_font_map_layout(font_map_data, record_mode=None):
+    """依 FONT_MAP_RECORD_MODE 決定紀錄格式；回傳 (區段表, 精簡紀錄)，使用完整紀錄時回傳 (None, None)。"""
+    if record_mode is None: record_mode = FONT_MAP_RECORD_MODE
+    if record_mode == "full":
+        return None, None
+    try:
+        return pack_compact_font_map(font_map_data)
+    except ValueError as e:
+        if record_mode == "compact":
+            print(f"警告: 字型不符合精簡紀錄格式 ({e})，改用完整紀錄。")
+        return None, None
+
+def write_simulator_font_files(base_path, font_size, font_map_data, font_bitmap_data,
+                               bitmap_format="1-byte-grayscale", compression=None, page_table=None):
+    """輸出模擬器用的 <base_path>.fmap 與 <base_path>.font (點陣圖資料池)。"""
+    output_dir = os.path.dirname(base_path)
+    if output_dir and not os.path.exists(output_dir): os.makedirs(output_dir)
+    write_font_map_file(base_path + ".fmap", font_size, font_map_data, bitmap_format, compression, page_table)
+    with open(base_path + ".font", "wb") as f:
+        f.write(font_bitmap_data)
+
+def write_font_map_file(path, font_size, font_map_data, bitmap_format="1-byte-grayscale", compression=None,
+                        page_table=None, record_mode=None, metrics=True):
+    """
+    寫出 .fmap 檔：FONT_MAP_FILE_HEADER_FORMAT 檔頭後接已排序的紀錄。
+    紀錄與 .h 中的 font_map_raw_opt 完全相同，main.py 可直接 mmap 後查詢。
+    page_table 為 None 時依 FONT_PAGE_TABLE 決定是否附加分頁表，record_mode 為 None 時依 FONT_MAP_RECORD_MODE
+    決定紀錄格式。版本: 1 = 完整紀錄, 2 = 完整紀錄 + 分頁表, 3 = 區段表 + 精簡紀錄 (+ 分頁表)。
+    metrics 為 False 表示紀錄中沒有實際的排版數值 (例如由舊版 .map 遷移)，不設 FONT_MAP_FLAG_METRICS。
+    """
+    if page_table is None: page_table = FONT_PAGE_TABLE
+    record_count = len(font_map_data) // struct.calcsize(FONT_MAP_FORMAT_OPTIMIZED)
+    directory, pages = build_font_page_table(font_map_data) if page_table else (None, None)
+    ranges, compact_records = select_font_map_layout(font_map_data, record_mode)
+    if compact_records is not None:
+        version = FONT_MAP_FILE_VERSION_COMPACT
+    else:
+        version = FONT_MAP_FILE_VERSION if directory is not None else 1
+    header = struct.pack(
+        FONT_MAP_FILE_HEADER_FORMAT, FONT_MAP_FILE_MAGIC, version,
+        BITMAP_FORMAT_CODES[bitmap_format] | BITMAP_COMPRESSION_FLAGS[compression] | (FONT_MAP_FLAG_METRICS if metrics else 0),
+        font_size, record_count
+    )
+    with open(path, "wb") as f:
+        f.write(header)
+        if compact_records is not None:
+            f.write(struct.pack("<I", len(ranges) // struct.calcsize(FONT_RANGE_FORMAT)))
+            f.write(ranges)
+            f.write(compact_records)
+        else:
+            f.write(font_map_data)
+        if directory is not None:
+            f.write(struct.pack(FONT_PAGE_TABLE_HEADER_FORMAT, len(directory) // 2, len(pages) // (2 * FONT_PAGE_SIZE)))
+            f.write(directory)
+            f.write(pages)
 
-def convert_ime_optimized():
+def convert_ime_optimized(scheme_name="zhuyin", renderable=None):
+    """
+    把 IME_SCHEMES[scheme_name] 的碼表轉成「索引 + 資料池」。找不到碼表時回傳 (None, None)。
+    提供 renderable (有字形的字元集合) 時，略過沒有字形的候選字。
+    """
+    scheme = IME_SCHEMES[scheme_name]
+    encode_key = IME_KEY_ENCODERS[scheme["key"]]
     ime_map = defaultdict(list)
+    for filepath in scheme["sources"]:
+        try:
+            entries = list(read_ime_source(filepath, scheme["format"]))
+        except FileNotFoundError:
+            print(f"錯誤: 找不到輸入法 '{scheme_name}' 的碼表 '{filepath}'。")
+            return None, None
+        for char, code in entries:
+            if renderable is not None and char not in renderable: continue
+            key = encode_key(code)
+            if char not in ime_map[key]: ime_map[key].append(char)
+
+    frequency_ranks = load_frequency_ranks()
+    if frequency_ranks:
+        sort_candidates_by_frequency(ime_map, frequency_ranks)
+    return pack_ime_index(ime_map)
+
+def read_ime_source(filepath, source_format):
+    """逐行讀取碼表，產生 (字, 原始輸入碼)；只保留單一字元的項目。"""
+    with open(filepath, "r", encoding="utf-8") as f:
+        lines = f.readlines()
+    in_chardef = source_format != "cin"
+    for line in lines:
+        line = line.strip()
+        if source_format == "cin":
+            if line.startswith("%chardef"):
+                in_chardef = line.endswith("begin")
+                continue
+            if not in_chardef or line.startswith(("%", "#")): continue
+            parts = line.split()
+            if len(parts) >= 2 and len(parts[1]) == 1:
+                yield parts[1], parts[0]
+        else:
+            parts = line.split()
+            if len(parts) >= 2 and len(parts[0]) == 1:
+                yield parts[0], parts[1]
+
+def bopomofo_to_key(bopomofo):
+    """把聲調符號換成數字 (ˊ→2, ˇ→3, ˋ→4, ˙→5)，沒有聲調時補上一聲 '1'。"""
+    bopomofo_key = bopomofo.replace("ˊ", "2").replace("ˇ", "3").replace("ˋ", "4").replace("˙", "5")
+    if not any(c.isdigit() for c in bopomofo_key): bopomofo_key += "1"
+    return bopomofo_key
+
+PINYIN_TONE_MARKS = {"\u0304": "1", "\u0301": "2", "\u030c": "3", "\u0300": "4"}
+
+def pinyin_to_key(pinyin):
+    """把帶聲調符號的拼音轉成「字母 + 聲調數字」(zhōng → zhong1)，ü 寫作 v；已用數字標調的原樣保留，輕聲補 '5'。"""
+    letters, tone = [], ""
+    for c in unicodedata.normalize("NFD", pinyin.lower()):
+        if c in PINYIN_TONE_MARKS: tone = PINYIN_TONE_MARKS[c]
+        elif c == "\u0308" and letters: letters[-1] = "v"
+        else: letters.append(c)
+    pinyin_key = "".join(letters).replace("u:", "v")
+    if not any(c.isdigit() for c in pinyin_key): pinyin_key += tone or "5"
+    return pinyin_key
+
+IME_KEY_ENCODERS = {"bopomofo": bopomofo_to_key, "pinyin": pinyin_to_key, "lower": str.lower}
+
+def convert_phrases_optimized(renderable=None):
+    """
+    將詞庫轉換為與 IME 相同的「索引 + 資料池」格式 (資料內容見 PHRASE_DEFAULT_COST 上方說明)。
+    找不到詞庫時回傳 (None, None)，其餘步驟照常進行。提供 renderable 時略過含有沒有字形的字的詞。
+    """
+    if not PHRASE_SOURCE_FILE: return None, None
+    phrase_map = defaultdict(list)
     try:
-        with open(IME_SOURCE_FILES[0], "r", encoding="utf-8") as f:
+        with open(PHRASE_SOURCE_FILE, "r", encoding="utf-8") as f:
             lines = f.readlines()
-    except FileNotFoundError: return None, None
+    except FileNotFoundError:
+        print(f"警告: 找不到詞庫 '{PHRASE_SOURCE_FILE}'，將不產生詞庫。")
+        return None, None
     for line in lines:
         parts = line.strip().split()
-        if len(parts) >= 2 and len(parts[0]) == 1:
-            char, bopomofo = parts[0], parts[1]
-            bopomofo_key = bopomofo.replace("ˊ", "2").replace("ˇ", "3").replace("ˋ", "4").replace("˙", "5")
-            if not any(c.isdigit() for c in bopomofo_key): bopomofo_key += "1"
-            if char not in ime_map[bopomofo_key]: ime_map[bopomofo_key].append(char)
-    
-    ime_pool_data, idx_records, temp_list = bytearray(), [], []
+        if len(parts) < 2: continue
+        phrase, syllables = parts[0], parts[1].split("-")
+        if len(phrase) < 2 or len(phrase) != len(syllables): continue
+        if renderable is not None and not renderable.issuperset(phrase): continue
+        try:
+            frequency = float(parts[2]) if len(parts) >= 3 else None
+        except ValueError:
+            frequency = None
+        key = "-".join(bopomofo_to_key(syllable) for syllable in syllables)
+        if all(existing != phrase for existing, _ in phrase_map[key]):
+            phrase_map[key].append((phrase, frequency))
+
+    total_frequency = sum(freq for entries in phrase_map.values() for _, freq in entries if freq)
+    packed_map = {}
+    for key, entries in phrase_map.items():
+        costs_and_phrases = []
+        for phrase, frequency in entries:
+            if frequency and total_frequency:
+                cost = min(255, max(0, round(-10 * math.log10(frequency / total_frequency))))
+            else:
+                cost = PHRASE_DEFAULT_COST
+            costs_and_phrases.append((cost, phrase))
+        # 依成本排序 (sorted 為穩定排序，同成本時保留詞庫順序)
+        costs_and_phrases = sorted(costs_and_phrases, key=lambda item: item[0])[:PHRASES_PER_KEY_LIMIT]
+        packed_map[key] = (
+            bytes([len(costs_and_phrases)]) + bytes(cost for cost, _ in costs_and_phrases)
+            + "".join(phrase for _, phrase in costs_and_phrases).encode('utf-8')
+        )
+    print(f"詞庫轉換完成，共 {sum(len(e) for e in phrase_map.values())} 個詞、{len(packed_map)} 組讀音。")
+    try:
+        return pack_ime_index(packed_map)
+    except (struct.error, ValueError) as e:
+        print(f"警告: 無法打包詞庫 ({e})，將不產生詞庫。")
+        return None, None
+
+def load_frequency_ranks():
+    """讀取字頻表，回傳 {字: 名次} (0 為最常用)。找不到檔案時回傳空 dict。"""
+    if not FREQUENCY_TABLE_PATH: return {}
+    ranks = {}
+    try:
+        with open(FREQUENCY_TABLE_PATH, "r", encoding="utf-8") as f:
+            for line in f:
+                parts = line.strip().split()
+                if parts and parts[0] not in ranks:
+                    ranks[parts[0]] = len(ranks)
+    except FileNotFoundError:
+        print(f"警告: 找不到字頻表 '{FREQUENCY_TABLE_PATH}'，候選字維持碼表順序。")
+    return ranks
+
+def sort_candidates_by_frequency(ime_map, frequency_ranks):
+    """依字頻名次重新排列每個 key 的候選字；不在字頻表中的字排在後面並保留原順序。"""
+    unranked = len(frequency_ranks)
     for key, candidates in ime_map.items():
-        temp_list.append({"key_bytes": key.encode('utf-8'), "candidates": candidates})
+        ime_map[key] = sorted(candidates, key=lambda char: frequency_ranks.get(char, unranked))
+
+def pack_ime_index(ime_map, layout=None, block_size=None):
+    """
+    將 {按鍵組合: 候選字} 依 key 的 UTF-8 位元組排序，打包成索引與資料池。
+    候選字可以是字元列表 (以 UTF-8 串接) 或已編碼好的 bytes (例如詞庫資料)。
+    layout 為 None 時依 IME_INDEX_LAYOUT 決定格式；"auto" 在 16-bit 位移放不下時改用區塊索引。
+    """
+    if layout is None: layout = IME_INDEX_LAYOUT
+    temp_list = []
+    for key, candidates in ime_map.items():
+        data_bytes = candidates if isinstance(candidates, bytes) else "".join(candidates).encode('utf-8')
+        temp_list.append({"key_bytes": key.encode('utf-8'), "candidates": data_bytes})
     temp_list.sort(key=lambda item: item["key_bytes"])
 
+    pool_size = sum(len(item["key_bytes"]) + len(item["candidates"]) for item in temp_list)
+    if layout == "blocked" or (layout == "auto" and pool_size > 0xFFFF):
+        return pack_blocked_ime_index(temp_list, block_size or IME_INDEX_BLOCK_SIZE)
+
+    ime_pool_data, idx_records = bytearray(), []
     for item in temp_list:
-        key_bytes, data_bytes = item["key_bytes"], "".join(item["candidates"]).encode('utf-8')
+        key_bytes, data_bytes = item["key_bytes"], item["candidates"]
         key_offset, key_len = len(ime_pool_data), len(key_bytes)
         ime_pool_data.extend(key_bytes)
         data_offset, data_len = len(ime_pool_data), len(data_bytes)
@@ -186,48 +1011,616 @@ def convert_ime_optimized():
         ))
     return packed_ime_idx_data, ime_pool_data
 
-def generate_header_file_optimized(ime_idx_data, ime_pool_data, font_map_data, font_bitmap_data):
-    
-    # --- 這是修正後的內部函式 ---
+def encode_varint(value):
+    """LEB128: 每個位元組存 7 位元，最高位元為 1 表示後面還有。"""
+    encoded = bytearray()
+    while value >= 0x80:
+        encoded.append((value & 0x7F) | 0x80)
+        value >>= 7
+    encoded.append(value)
+    return bytes(encoded)
+
+def pack_blocked_ime_index(sorted_items, block_size):
+    """
+    以區塊索引 (版本 2) 打包已排序的 [{"key_bytes", "candidates"}]。
+    回傳的索引部分以 IME_BLOCKED_INDEX_MAGIC 開頭，可用 ime_index_version() 辨識。
+    """
+    blocks, keys, pool = bytearray(), bytearray(), bytearray()
+    previous_key = b""
+    for position, item in enumerate(sorted_items):
+        key_bytes, data_bytes = item["key_bytes"], item["candidates"]
+        if len(key_bytes) > 0xFF:
+            raise ValueError(f"key 長度 {len(key_bytes)} 超過 255 bytes")
+        if position % block_size == 0:
+            blocks.extend(struct.pack(IME_BLOCK_FORMAT, len(keys), len(pool)))
+            shared = 0
+        else:
+            shared = 0
+            limit = min(len(key_bytes), len(previous_key))
+            while shared < limit and key_bytes[shared] == previous_key[shared]:
+                shared += 1
+        keys.append(shared)
+        keys.append(len(key_bytes) - shared)
+        keys.extend(key_bytes[shared:])
+        keys.extend(encode_varint(len(data_bytes)))
+        pool.extend(data_bytes)
+        previous_key = key_bytes
+    header = struct.pack(IME_BLOCKED_INDEX_HEADER_FORMAT, IME_BLOCKED_INDEX_MAGIC, len(sorted_items), len(keys), block_size)
+    return header + bytes(blocks) + bytes(keys), pool
+
+def ime_index_version(ime_idx_data):
+    """區塊索引以 IME_BLOCKED_INDEX_MAGIC 開頭；平坦紀錄的第一筆 key_offset 必為 0，不會與之混淆。"""
+    if ime_idx_data[:len(IME_BLOCKED_INDEX_MAGIC)] == IME_BLOCKED_INDEX_MAGIC:
+        return IME_INDEX_FILE_VERSION_BLOCKED
+    return IME_INDEX_FILE_VERSION
+
+def ime_index_count(ime_idx_data):
+    if ime_index_version(ime_idx_data) == IME_INDEX_FILE_VERSION_BLOCKED:
+        return struct.unpack_from(IME_BLOCKED_INDEX_HEADER_FORMAT, ime_idx_data, 0)[1]
+    return len(ime_idx_data) // struct.calcsize(IME_INDEX_FORMAT_OPTIMIZED)
+
+def write_ime_index_file(path, ime_idx_data, ime_pool_data):
+    """
+    寫出 .imx 檔：IME_INDEX_FILE_HEADER_FORMAT 檔頭、索引、資料池依序相接。
+    內容與 .h 中的索引與資料池陣列相同，main.py 可直接 mmap 後二分搜尋。
+    """
+    output_dir = os.path.dirname(path)
+    if output_dir and not os.path.exists(output_dir): os.makedirs(output_dir)
+    header = struct.pack(
+        IME_INDEX_FILE_HEADER_FORMAT, IME_INDEX_FILE_MAGIC, ime_index_version(ime_idx_data),
+        ime_index_count(ime_idx_data), len(ime_pool_data)
+    )
+    with open(path, "wb") as f:
+        f.write(header)
+        f.write(ime_idx_data)
+        f.write(ime_pool_data)
+
+# 建置矩陣中的一個字型大小: name 為 FONT_BUILD_MATRIX 中的名稱 (單一字型建置時為 None)
+FontVariant = namedtuple("FontVariant", ["name", "path", "size", "font_map_data", "font_bitmap_data"])
+
+# 標頭檔中的陣列: c_type 為 "uint8_t" 或 "uint16_t" (data 為小端序的原始位元組)，由 CHeaderWriter 串流寫出
+CArray = namedtuple("CArray", ["c_type", "name", "data"])
+C_ARRAY_VALUES_PER_ROW = 16
+
+class CHeaderWriter:
+    """
+    串流寫出 C 標頭檔。文字行直接寫入；CArray 以 chunk_size 為單位格式化成十六進位後寫入，
+    不在記憶體中組出整個標頭檔。array_mode 為 "embed" / "incbin" 時陣列內容改寫成 bin_dir 中的 .bin 檔，
+    標頭檔只輸出宣告 (路徑相對於 header_dir)。
+    """
+    def __init__(self, f, array_mode="inline", bin_dir=None, header_dir="", chunk_size=HEADER_CHUNK_SIZE):
+        if array_mode not in ("inline", "embed", "incbin"):
+            raise ValueError(f"不支援的陣列輸出方式: {array_mode}")
+        self.f = f
+        self.array_mode = array_mode
+        self.bin_dir = bin_dir
+        self.bin_include_dir = os.path.relpath(bin_dir, header_dir or ".").replace(os.sep, "/") if bin_dir else ""
+        # 每個 chunk 為整數列 (uint16 一列 32 bytes)
+        row_bytes = C_ARRAY_VALUES_PER_ROW * 2
+        self.chunk_size = max(row_bytes, chunk_size // row_bytes * row_bytes)
+        self.text_size = 0
+        self.bin_size = 0
+
+    def write_lines(self, items):
+        for item in items:
+            if isinstance(item, CArray):
+                self.write_array(item)
+            else:
+                self._write(item + "\n")
+
+    def write_array(self, array):
+        if self.array_mode != "inline":
+            self._write_bin_array(array)
+            return
+        width = 2 if array.c_type == "uint16_t" else 1
+        self._write(f"const {array.c_type} {array.name}[{len(array.data) // width}] PROGMEM = {{\n")
+        # 每個值固定為 "0x.., " 的寬度，整個 chunk 以 bytes.hex 一次轉換後再切成列
+        row_chars = C_ARRAY_VALUES_PER_ROW * (2 * width + 4)
+        view = memoryview(array.data)
+        for start in range(0, len(view), self.chunk_size):
+            chunk = view[start:start + self.chunk_size]
+            if width == 2:
+                swapped = bytearray(len(chunk))
+                swapped[0::2], swapped[1::2] = chunk[1::2], chunk[0::2]
+                chunk = swapped
+            text = "0x" + chunk.hex(" ", width).replace(" ", ", 0x") + ", "
+            self._write("".join(f"    {text[i:i + row_chars].rstrip()}\n" for i in range(0, len(text), row_chars)))
+        self._write("};\n")
+
+    def _write_bin_array(self, array):
+        if not os.path.exists(self.bin_dir): os.makedirs(self.bin_dir)
+        with open(os.path.join(self.bin_dir, f"{array.name}.bin"), "wb") as f:
+            f.write(array.data)
+        self.bin_size += len(array.data)
+        include_path = f"{self.bin_include_dir}/{array.name}.bin"
+        # uint16 陣列以位元組存放後轉型 (與 font_map_opt 等相同，假設小端序)
+        storage = array.name if array.c_type == "uint8_t" else f"{array.name}_bin"
+        if self.array_mode == "embed":
+            lines = [f"alignas(4) const uint8_t {storage}[{len(array.data)}] PROGMEM = {{",
+                     f'#embed "{include_path}"', "};"]
+        else:
+            # .weak: 多個編譯單元引入此標頭檔時由連結器只保留一份，不會重複定義
+            lines = [f'extern "C" const uint8_t {storage}[{len(array.data)}];',
+                     f'__asm__(".pushsection .rodata\\n.balign 4\\n.weak {storage}\\n{storage}:\\n'
+                     f'.incbin \\"{include_path}\\"\\n.popsection\\n");']
+        if storage != array.name:
+            lines.append(f"const uint16_t* const {array.name} = reinterpret_cast<const uint16_t*>({storage});")
+        self._write("\n".join(lines) + "\n")
+
+    def _write(self, text):
+        self.f.write(text)
+        self.text_size += len(text)
+
+def generate_header_file_optimized(ime_indexes, font_map_data, font_bitmap_data,
+                                   phrase_idx_data=None, phrase_pool_data=None, font_variants=None):
+    """ime_indexes: {方案名: (索引, 資料池)}。以 CHeaderWriter 串流寫出 OUTPUT_H_FILE_PATH，回傳 writer (含輸出大小)。"""
+    h_content = build_header_items(ime_indexes, font_map_data, font_bitmap_data, phrase_idx_data, phrase_pool_data,
+                                   font_variants)
+    output_dir = os.path.dirname(OUTPUT_H_FILE_PATH)
+    if not os.path.exists(output_dir): os.makedirs(output_dir)
+    start_time = time.perf_counter()
+    with open(OUTPUT_H_FILE_PATH, "w", encoding="utf-8") as f:
+        writer = CHeaderWriter(f, HEADER_ARRAY_MODE, HEADER_BIN_DIR, output_dir)
+        writer.write_lines(h_content)
+    bin_info = f" + {writer.bin_size:,} bytes .bin ({HEADER_BIN_DIR})" if HEADER_ARRAY_MODE != "inline" else ""
+    print(f"標頭檔寫出完成 ({HEADER_ARRAY_MODE}): {writer.text_size:,} 字元{bin_info}，"
+          f"耗時 {time.perf_counter() - start_time:.2f} 秒。")
+    return writer
+
+def build_header_items(ime_indexes, font_map_data, font_bitmap_data, phrase_idx_data=None, phrase_pool_data=None,
+                       font_variants=None):
+    """
+    回傳標頭檔內容: 文字行與 CArray 組成的清單，陣列在寫出時才格式化。
+    每個輸入法方案輸出 <方案名>_idx_raw_opt / <方案名>_pool_opt 等陣列。
+    提供 font_variants (建置矩陣，第一項即 font_map_data / font_bitmap_data) 時另外輸出 font_variants_opt 表。
+    """
     def format_byte_array_to_c(name, data):
-        c_code = [f"const uint8_t {name}[{len(data)}] PROGMEM = {{"]
-        for i in range(0, len(data), 16):
-            chunk = data[i:i+16]
-            c_code.append("    " + ", ".join(f"0x{b:02x}" for b in chunk) + ",")
-        c_code.append("};")
-        return "\n".join(c_code)
+        return CArray("uint8_t", name, data)
 
+    def format_uint16_array_to_c(name, data):
+        return CArray("uint16_t", name, data)
+
+    font_ranges, compact_font_map = select_font_map_layout(font_map_data)
     h_content = [
         "// Auto-generated by full_hardcode_converter.py (Optimized v4). DO NOT EDIT.\n",
         "#pragma once", "#include <Arduino.h>",
         "\n// FONT DATA (Optimized v2)\n",
-        "struct __attribute__((packed)) FontMapRecord_Opt {",
-        "    uint32_t unicode;   // 4 bytes", "    uint32_t offset;    // 4 bytes",
-        "    uint8_t  width;     // 1 byte", "    uint8_t  height;    // 1 byte",
-        "    uint8_t  x_advance; // 1 byte", "    int8_t   x_offset;  // 1 byte",
-        "    int8_t   y_offset;  // 1 byte", "    uint8_t  padding;   // 1 byte to make it 16 bytes",
-        "};", "",
-        format_byte_array_to_c("font_map_raw_opt", font_map_data), "",
+    ]
+    if compact_font_map is None:
+        h_content += [
+            "struct __attribute__((packed)) FontMapRecord_Opt {",
+            "    uint32_t unicode;   // 4 bytes", "    uint32_t offset;    // 4 bytes",
+            "    uint8_t  width;     // 1 byte", "    uint8_t  height;    // 1 byte",
+            "    uint8_t  x_advance; // 1 byte", "    int8_t   x_offset;  // 1 byte",
+            "    int8_t   y_offset;  // 1 byte", "    uint8_t  padding;   // 1 byte to make it 16 bytes",
+            "};", "typedef FontMapRecord_Opt FontMapEntry_Opt;", "#define FONT_MAP_COMPACT_OPT 0", "",
+            format_byte_array_to_c("font_map_raw_opt", font_map_data), "",
+        ]
+    else:
+        h_content += [
+            "// 精簡紀錄 (8 bytes)：不含 unicode，由 font_ranges_opt 或分頁表推得",
+            "struct __attribute__((packed)) FontMapRecord_Compact {",
+            "    uint32_t offset : 24; // 點陣圖位移", "    uint32_t width  : 8;",
+            "    uint8_t  height;", "    uint8_t  x_advance;",
+            "    int8_t   x_offset;", "    int8_t   y_offset;",
+            "};",
+            "// 每段連續 unicode 的起點與第一筆紀錄的索引，段長 = 下一段的 first_index - first_index",
+            "struct __attribute__((packed)) FontRange_Opt {",
+            "    uint32_t first_unicode;", "    uint16_t first_index;",
+            "};", "typedef FontMapRecord_Compact FontMapEntry_Opt;", "#define FONT_MAP_COMPACT_OPT 1", "",
+            format_byte_array_to_c("font_ranges_raw_opt", font_ranges), "",
+            format_byte_array_to_c("font_map_raw_opt", compact_font_map), "",
+            "const FontRange_Opt* const font_ranges_opt = reinterpret_cast<const FontRange_Opt*>(font_ranges_raw_opt);",
+            f"const size_t font_ranges_count_opt = {len(font_ranges) // struct.calcsize(FONT_RANGE_FORMAT)};",
+        ]
+    h_content += [
         format_byte_array_to_c("font_bitmap_data_opt", font_bitmap_data), "",
-        "const FontMapRecord_Opt* const font_map_opt = reinterpret_cast<const FontMapRecord_Opt*>(font_map_raw_opt);",
+        "const FontMapEntry_Opt* const font_map_opt = reinterpret_cast<const FontMapEntry_Opt*>(font_map_raw_opt);",
         f"const size_t font_map_count_opt = {len(font_map_data) // struct.calcsize(FONT_MAP_FORMAT_OPTIMIZED)};",
-        
+        f"// 點陣圖格式: {GLYPH_BITMAP_FORMAT} (每列補齊到整數位元組，高位元為最左邊的像素)",
+        f"const uint8_t font_bitmap_bpp_opt = {BITMAP_FORMAT_BPP[GLYPH_BITMAP_FORMAT]};",
+        "// 點陣圖壓縮: 0 = 無, 1 = PackBits 式 RLE (0x00-0x7F: 複製 n+1 個位元組; 0x80-0xFF: 下一位元組重複 n-0x7E 次)",
+        f"const uint8_t font_bitmap_compression_opt = {1 if GLYPH_COMPRESSION == 'rle' else 0};",
+    ]
+    font_page_directory, font_pages = build_font_page_table(font_map_data) if FONT_PAGE_TABLE else (None, None)
+    if font_page_directory is not None:
+        h_content += [
+            "\n// 兩層 codepoint 分頁表 (取代二分搜尋，O(1) 查詢)：",
+            "// index = font_pages_opt[font_page_directory_opt[cp >> 8] * 256 + (cp & 0xFF)]，0xFFFF 表示沒有此字元",
+            format_uint16_array_to_c("font_page_directory_opt", font_page_directory), "",
+            format_uint16_array_to_c("font_pages_opt", font_pages), "",
+            f"const size_t font_page_directory_count_opt = {len(font_page_directory) // 2};",
+            f"const uint16_t font_page_empty_opt = 0x{FONT_PAGE_EMPTY:04x};",
+            "",
+            "inline const FontMapEntry_Opt* font_lookup_opt(uint32_t unicode) {",
+            "    if ((unicode >> 8) >= font_page_directory_count_opt) return nullptr;",
+            "    uint16_t index = font_pages_opt[font_page_directory_opt[unicode >> 8] * 256 + (unicode & 0xFF)];",
+            "    return index == font_page_empty_opt ? nullptr : &font_map_opt[index];",
+            "}",
+        ]
+    elif compact_font_map is not None:
+        h_content += [
+            "",
+            "// 在區段表上二分搜尋 (區段數遠少於字元數)",
+            "inline const FontMapEntry_Opt* font_lookup_opt(uint32_t unicode) {",
+            "    size_t low = 0, high = font_ranges_count_opt;",
+            "    while (low < high) {",
+            "        size_t mid = (low + high) / 2;",
+            "        if (font_ranges_opt[mid].first_unicode <= unicode) low = mid + 1; else high = mid;",
+            "    }",
+            "    if (low == 0) return nullptr;",
+            "    const FontRange_Opt& range = font_ranges_opt[low - 1];",
+            "    size_t end = low < font_ranges_count_opt ? font_ranges_opt[low].first_index : font_map_count_opt;",
+            "    uint32_t delta = unicode - range.first_unicode;",
+            "    return delta < end - range.first_index ? &font_map_opt[range.first_index + delta] : nullptr;",
+            "}",
+        ]
+    def format_font_matrix_to_c(variants, legacy_compact):
+        lines = [
+            "\n// FONT MATRIX: 多個字型與大小，font_variants_opt 依 fallback 順序排列。",
+            "// 同一字型的各大小共用區段表 (codepoint 只存一份)，各自有精簡紀錄與點陣圖；",
+            "// width 與 x_advance 皆為 0 的紀錄表示該大小沒有此字的字形。第一項與 font_bitmap_data_opt 共用點陣圖；",
+            "// 區段表與紀錄則另外輸出 (font_map_opt 已去掉佔位紀錄，不能共用)。",
+        ]
+        if not legacy_compact:
+            lines += [
+                "struct __attribute__((packed)) FontMapRecord_Compact {",
+                "    uint32_t offset : 24;", "    uint32_t width  : 8;",
+                "    uint8_t  height;", "    uint8_t  x_advance;",
+                "    int8_t   x_offset;", "    int8_t   y_offset;",
+                "};",
+                "struct __attribute__((packed)) FontRange_Opt {",
+                "    uint32_t first_unicode;", "    uint16_t first_index;",
+                "};",
+            ]
+        lines += [
+            "struct FontVariant_Opt {",
+            "    const FontRange_Opt* ranges;", "    size_t ranges_count;",
+            "    const FontMapRecord_Compact* records;", "    size_t count;",
+            "    const uint8_t* bitmap;", "    uint8_t font_id;", "    uint8_t size;",
+            "};", "",
+        ]
+        entries, font_ids, font_ranges_names = [], {}, {}
+        emitted = {} # 已輸出的陣列名稱 -> 內容，用來確認描述子的筆數與它指向的陣列一致
+        range_size, record_size = struct.calcsize(FONT_RANGE_FORMAT), struct.calcsize(FONT_MAP_COMPACT_FORMAT)
+        for position, variant in enumerate(variants):
+            ranges, records = pack_compact_font_map(variant.font_map_data)
+            font_id = font_ids.setdefault(variant.name, len(font_ids))
+            prefix = f"font_{variant.name}_{variant.size}"
+            if variant.name not in font_ranges_names:
+                font_ranges_names[variant.name] = f"font_{variant.name}_ranges_raw_opt"
+                lines += [format_byte_array_to_c(font_ranges_names[variant.name], ranges), ""]
+                emitted[font_ranges_names[variant.name]] = ranges
+            records_name = f"{prefix}_map_raw_opt"
+            lines += [format_byte_array_to_c(records_name, records), ""]
+            emitted[records_name] = records
+            if position == 0:
+                bitmap_name = "font_bitmap_data_opt"
+            else:
+                bitmap_name = f"{prefix}_bitmap_opt"
+                lines += [format_byte_array_to_c(bitmap_name, variant.font_bitmap_data), ""]
+            ranges_name = font_ranges_names[variant.name]
+            # 同一字型的各大小共用第一個大小的區段表，codepoint 欄必須完全相同
+            assert emitted[ranges_name] == ranges, f"{prefix} 的區段表與 {ranges_name} 不一致"
+            assert emitted[records_name] == records
+            entries.append(
+                f"    {{reinterpret_cast<const FontRange_Opt*>({ranges_name}), {len(ranges) // range_size}, "
+                f"reinterpret_cast<const FontMapRecord_Compact*>({records_name}), "
+                f"{len(records) // record_size}, {bitmap_name}, {font_id}, {variant.size}}}, "
+                f"// {variant.name} {variant.size}px")
+        lines += ["const FontVariant_Opt font_variants_opt[] = {"] + entries + ["};",
+            f"const size_t font_variants_count_opt = {len(variants)};",
+            "",
+            "inline const FontMapRecord_Compact* font_variant_lookup_opt(const FontVariant_Opt& variant, uint32_t unicode) {",
+            "    size_t low = 0, high = variant.ranges_count;",
+            "    while (low < high) {",
+            "        size_t mid = (low + high) / 2;",
+            "        if (variant.ranges[mid].first_unicode <= unicode) low = mid + 1; else high = mid;",
+            "    }",
+            "    if (low == 0) return nullptr;",
+            "    const FontRange_Opt& range = variant.ranges[low - 1];",
+            "    size_t end = low < variant.ranges_count ? variant.ranges[low].first_index : variant.count;",
+            "    uint32_t delta = unicode - range.first_unicode;",
+            "    if (delta >= end - range.first_index) return nullptr;",
+            "    const FontMapRecord_Compact* record = &variant.records[range.first_index + delta];",
+            "    return (record->width == 0 && record->x_advance == 0) ? nullptr : record;",
+            "}",
+            "",
+            "// 依 fallback 順序在指定大小的各字型中查詢 (每個字型查一次)，找到時以 *variant 傳回所屬的字型大小",
+            "inline const FontMapRecord_Compact* font_matrix_lookup_opt(uint8_t size, uint32_t unicode, const FontVariant_Opt** variant) {",
+            "    for (size_t i = 0; i < font_variants_count_opt; i++) {",
+            "        if (font_variants_opt[i].size != size) continue;",
+            "        const FontMapRecord_Compact* record = font_variant_lookup_opt(font_variants_opt[i], unicode);",
+            "        if (record != nullptr) {",
+            "            if (variant != nullptr) *variant = &font_variants_opt[i];",
+            "            return record;",
+            "        }",
+            "    }",
+            "    return nullptr;",
+            "}",
+        ]
+        return lines
+    if font_variants:
+        h_content += format_font_matrix_to_c(font_variants, compact_font_map is not None)
+
+    def format_ime_index_to_c(name, idx_data, pool_data):
+        if ime_index_version(idx_data) != IME_INDEX_FILE_VERSION_BLOCKED:
+            return [
+                format_byte_array_to_c(f"{name}_idx_raw_opt", idx_data), "",
+                format_byte_array_to_c(f"{name}_pool_opt", pool_data), "",
+                f"const ImeIndexRecord_Opt* const {name}_idx_opt = reinterpret_cast<const ImeIndexRecord_Opt*>({name}_idx_raw_opt);",
+                f"const size_t {name}_idx_count_opt = {ime_index_count(idx_data)};",
+            ]
+        _, count, keys_size, block_size = struct.unpack_from(IME_BLOCKED_INDEX_HEADER_FORMAT, idx_data, 0)
+        blocks_start = struct.calcsize(IME_BLOCKED_INDEX_HEADER_FORMAT)
+        keys_start = len(idx_data) - keys_size
+        return [
+            f"// 區塊索引 (每 {block_size} 個 key 一個區塊，以 ime_block_lookup 查詢)",
+            format_byte_array_to_c(f"{name}_blocks_raw_opt", idx_data[blocks_start:keys_start]), "",
+            format_byte_array_to_c(f"{name}_keys_opt", idx_data[keys_start:]), "",
+            format_byte_array_to_c(f"{name}_pool_opt", pool_data), "",
+            f"const size_t {name}_idx_count_opt = {count};",
+            f"const ImeBlockIndex_Opt {name}_index_opt = {{",
+            f"    reinterpret_cast<const ImeBlock_Opt*>({name}_blocks_raw_opt), {(keys_start - blocks_start) // struct.calcsize(IME_BLOCK_FORMAT)},",
+            f"    {count}, {block_size}, {name}_keys_opt, {name}_pool_opt",
+            "};",
+        ]
+
+    h_content += [
         "\n\n// IME DATA (Optimized v4)\n",
         "struct __attribute__((packed)) ImeIndexRecord_Opt {",
         "    uint16_t key_offset;    // 2 bytes", "    uint8_t  key_len;       // 1 byte",
         "    uint8_t  padding;       // 1 byte for alignment",
         "    uint16_t data_offset;   // 2 bytes", "    uint16_t data_len;      // 2 bytes",
         "};", "",
-        format_byte_array_to_c("zhuyin_idx_raw_opt", ime_idx_data), "",
-        format_byte_array_to_c("zhuyin_pool_opt", ime_pool_data), "",
-        "const ImeIndexRecord_Opt* const zhuyin_idx_opt = reinterpret_cast<const ImeIndexRecord_Opt*>(zhuyin_idx_raw_opt);",
-        f"const size_t zhuyin_idx_count_opt = {len(ime_idx_data) // struct.calcsize(IME_INDEX_FORMAT_OPTIMIZED)};",
     ]
-    
-    output_dir = os.path.dirname(OUTPUT_H_FILE_PATH)
-    if not os.path.exists(output_dir): os.makedirs(output_dir)
-    with open(OUTPUT_H_FILE_PATH, "w", encoding="utf-8") as f:
-        f.write("\n".join(h_content))
+    if any(data is not None and ime_index_version(data) == IME_INDEX_FILE_VERSION_BLOCKED
+           for data in [idx_data for idx_data, _ in ime_indexes.values()] + [phrase_idx_data]):
+        h_content += [
+            "// 區塊索引 (資料池超過 64 KB 時使用)：每個區塊的第一個 key 完整存放，其餘 key 只存與前一個 key 不同的後綴。",
+            "// key 區每筆: [共同前綴長度][後綴長度][後綴][資料長度 (LEB128)]；資料依序存放，位移由區塊的 data_offset 累加。",
+            "#include <string.h>",
+            "struct __attribute__((packed)) ImeBlock_Opt {",
+            "    uint32_t key_offset;    // 區塊在 key 區的位移", "    uint32_t data_offset;   // 區塊第一筆資料在資料池的位移",
+            "};",
+            "struct ImeBlockIndex_Opt {",
+            "    const ImeBlock_Opt* blocks; uint32_t block_count;",
+            "    uint32_t count; uint16_t block_size;",
+            "    const uint8_t* keys; const uint8_t* pool;",
+            "};",
+            "",
+            "inline uint32_t ime_read_varint(const uint8_t*& p) {",
+            "    uint32_t value = 0; uint8_t shift = 0;",
+            "    while (*p & 0x80) { value |= (uint32_t)(*p++ & 0x7F) << shift; shift += 7; }",
+            "    return value | ((uint32_t)*p++ << shift);",
+            "}",
+            "",
+            "inline int ime_compare_key(const uint8_t* a, uint8_t a_len, const uint8_t* b, uint8_t b_len) {",
+            "    int c = memcmp(a, b, a_len < b_len ? a_len : b_len);",
+            "    return c ? c : (int)a_len - (int)b_len;",
+            "}",
+            "",
+            "// 找到 key 時回傳候選字資料並寫入 data_len，否則回傳 nullptr",
+            "inline const uint8_t* ime_block_lookup(const ImeBlockIndex_Opt& index, const uint8_t* key, uint8_t key_len, uint32_t* data_len) {",
+            "    uint32_t low = 0, high = index.block_count;",
+            "    while (low < high) {",
+            "        uint32_t mid = (low + high) / 2;",
+            "        const uint8_t* first = index.keys + index.blocks[mid].key_offset;",
+            "        if (ime_compare_key(first + 2, first[1], key, key_len) <= 0) low = mid + 1; else high = mid;",
+            "    }",
+            "    if (low == 0) return nullptr;",
+            "    uint32_t block = low - 1;",
+            "    const uint8_t* p = index.keys + index.blocks[block].key_offset;",
+            "    uint32_t data_offset = index.blocks[block].data_offset;",
+            "    uint32_t entries = index.count - block * index.block_size;",
+            "    if (entries > index.block_size) entries = index.block_size;",
+            "    uint8_t current[255];",
+            "    for (uint32_t i = 0; i < entries; i++) {",
+            "        uint8_t shared = *p++, suffix_len = *p++;",
+            "        memcpy(current + shared, p, suffix_len); p += suffix_len;",
+            "        uint32_t length = ime_read_varint(p);",
+            "        int c = ime_compare_key(current, shared + suffix_len, key, key_len);",
+            "        if (c == 0) { *data_len = length; return index.pool + data_offset; }",
+            "        if (c > 0) break;",
+            "        data_offset += length;",
+            "    }",
+            "    return nullptr;",
+            "}",
+            "",
+        ]
+    for scheme_name, (ime_idx_data, ime_pool_data) in ime_indexes.items():
+        h_content += [f"// 輸入法方案: {scheme_name}"] + format_ime_index_to_c(scheme_name, ime_idx_data, ime_pool_data) + [""]
+    if phrase_idx_data is not None:
+        h_content += ["\n\n// PHRASE DATA (key: syllables joined by '-', data: [count][costs...][UTF-8 phrases])\n"]
+        h_content += format_ime_index_to_c("phrase", phrase_idx_data, phrase_pool_data)
+    return h_content
+
+# ==============================================================================
+# --- 增量建置快取 ---
+# ==============================================================================
+class BuildCache:
+    """
+    以內容雜湊為鍵的建置快取 (類似 make)：
+    - 字形: 以 (字型檔雜湊, 大小, index) 為一組存成一個檔案，內含 {字元: 渲染結果}
+    - 步驟結果: 以輸入檔內容與相關設定的雜湊為鍵
+    - 輸出檔: 記錄上次寫出時的輸入雜湊，相同且檔案都還在時略過寫檔
+    快取目錄超過 max_bytes 時，依最後使用時間刪除最舊的檔案。
+    """
+    def __init__(self, cache_dir, max_bytes=BUILD_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def hash_bytes(*chunks):
+        digest = hashlib.sha256(str(BUILD_CACHE_VERSION).encode('utf-8'))
+        for chunk in chunks:
+            digest.update(len(chunk).to_bytes(8, "little"))
+            digest.update(chunk)
+        return digest.hexdigest()[:32]
+
+    @staticmethod
+    def hash_files(*paths):
+        """雜湊檔案內容；檔案不存在時以路徑本身代替，讓「新增檔案」也會使快取失效。"""
+        chunks = []
+        for path in paths:
+            if path and os.path.exists(path):
+                with open(path, "rb") as f:
+                    chunks.append(f.read())
+            else:
+                chunks.append(f"<missing:{path}>".encode('utf-8'))
+        return BuildCache.hash_bytes(*chunks)
+
+    def _path(self, name):
+        return os.path.join(self.cache_dir, name)
+
+    def _load(self, name):
+        path = self._path(name)
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+        os.utime(path) # 更新最後使用時間，供淘汰時參考
+        return value
+
+    def _store(self, name, value):
+        path = self._path(name)
+        with open(path + ".tmp", "wb") as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + ".tmp", path)
+        self.evict(keep=path)
+
+    def load_glyphs(self, glyph_key):
+        return self._load(f"glyphs-{glyph_key}.pkl") or {}
+
+    def save_glyphs(self, glyph_key, glyphs):
+        self._store(f"glyphs-{glyph_key}.pkl", glyphs)
+
+    def load_stage(self, stage, key):
+        return self._load(f"{stage}-{key}.pkl")
+
+    def save_stage(self, stage, key, value):
+        self._store(f"{stage}-{key}.pkl", value)
+
+    def outputs_fresh(self, stage, key, output_paths):
+        return self._load(f"{stage}.stamp") == key and all(os.path.exists(path) for path in output_paths)
+
+    def mark_outputs(self, stage, key):
+        self._store(f"{stage}.stamp", key)
+
+    def evict(self, keep=None):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            path = self._path(name)
+            if os.path.isfile(path):
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes: break
+            if path == keep: continue
+            os.remove(path)
+            total -= size
+
+def run_cached_stage(cache, stage, input_paths, settings, compute):
+    """
+    執行一個建置步驟；以輸入檔內容與相關設定值 (repr) 的雜湊為鍵，
+    輸入未變時直接回傳快取的結果。
+    """
+    if cache is None: return compute()
+    key = BuildCache.hash_bytes(BuildCache.hash_files(*input_paths).encode('utf-8'), repr(settings).encode('utf-8'))
+    result = cache.load_stage(stage, key)
+    if result is not None:
+        print(f"步驟 '{stage}' 的輸入未變更，沿用快取結果。")
+        return result
+    result = compute()
+    if result[0] is not None: cache.save_stage(stage, key, result)
+    return result
+
+class BuildReport:
+    """
+    記錄一次建置的各步驟耗時 (wall time) 與 Python 峰值記憶體 (tracemalloc)、統計數字與輸出大小，
+    並寫成 JSON 報告。begin_stage 會結束上一個步驟，finish 結束最後一個步驟。
+    平行渲染的工作行程不在 tracemalloc 的量測範圍內。
+    """
+    def __init__(self, trace_memory=True):
+        self.trace_memory = trace_memory
+        self.started_at = time.strftime("%Y-%m-%dT%H:%M:%S")
+        self.start_time = time.perf_counter()
+        self.status = "error" # build 丟出例外時維持此值
+        self.stages = []
+        self.stats = {}
+        self.sizes = {}   # 各輸出陣列的位元組數 (與 .h 中的陣列一一對應)
+        self.files = {}   # 實際輸出的檔案大小
+        self._current = None
+        if trace_memory: tracemalloc.start()
+
+    def begin_stage(self, name):
+        self._end_stage()
+        if self.trace_memory: tracemalloc.reset_peak()
+        self._current = (name, time.perf_counter())
+
+    def _end_stage(self):
+        if self._current is None: return
+        name, start_time = self._current
+        stage = {"name": name, "seconds": round(time.perf_counter() - start_time, 4)}
+        if self.trace_memory: stage["peak_bytes"] = tracemalloc.get_traced_memory()[1]
+        self.stages.append(stage)
+        self._current = None
+
+    def add_stats(self, **values):
+        """累加數值統計 (同一種統計可能來自多次呼叫，例如建置矩陣的每個大小)。"""
+        for name, value in values.items():
+            self.stats[name] = self.stats.get(name, 0) + value
+
+    def record_files(self, paths):
+        for path in paths:
+            self.files[path] = os.path.getsize(path)
+
+    def finish(self):
+        self._end_stage()
+        self.total_seconds = round(time.perf_counter() - self.start_time, 4)
+        if "raster_seconds" in self.stats: self.stats["raster_seconds"] = round(self.stats["raster_seconds"], 4)
+        if self.trace_memory and tracemalloc.is_tracing(): tracemalloc.stop()
+
+    def to_dict(self):
+        return {
+            "started_at": self.started_at, "status": self.status, "total_seconds": self.total_seconds,
+            "python": sys.version.split()[0], "pillow": PIL.__version__,
+            "settings": {
+                "font": FONT_SOURCE_PATH, "font_index": FONT_INDEX, "font_size": FONT_SIZE,
+                "font_build_matrix": FONT_BUILD_MATRIX,
+                "charset_mode": CHARSET_MODE, "charset_file": CHARSET_FILE_PATH if CHARSET_MODE == 'FILE' else None,
+                "coverage_mode": COVERAGE_MODE, "ime_schemes": IME_ENABLED_SCHEMES,
+                "bitmap_format": GLYPH_BITMAP_FORMAT, "compression": GLYPH_COMPRESSION,
+                "ime_index_layout": IME_INDEX_LAYOUT, "header_array_mode": HEADER_ARRAY_MODE,
+                "build_cache": BUILD_CACHE_DIR is not None,
+            },
+            "stages": self.stages, "stats": self.stats, "sizes": self.sizes, "files": self.files,
+        }
+
+    def print_summary(self):
+        print(f"\n{'步驟':<10} {'耗時 (s)':>10} {'峰值記憶體 (MB)':>16}")
+        for stage in self.stages:
+            peak = f"{stage['peak_bytes'] / 1024 / 1024:.1f}" if "peak_bytes" in stage else "-"
+            print(f"{stage['name']:<10} {stage['seconds']:>10.2f} {peak:>16}")
+        print(f"{'總計':<10} {self.total_seconds:>10.2f}")
+        if self.sizes:
+            print("輸出陣列: " + "，".join(f"{name} {size:,} bytes" for name, size in self.sizes.items()))
+
+    def write(self, path, history_path=None):
+        """寫出 JSON 報告；提供 history_path 時另外附加一行 (JSON Lines) 以便比較歷次建置。"""
+        report = self.to_dict()
+        for output_path in (path, history_path):
+            output_dir = os.path.dirname(output_path) if output_path else None
+            if output_dir and not os.path.exists(output_dir): os.makedirs(output_dir)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        if history_path:
+            with open(history_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(report, ensure_ascii=False) + "\n")
+        print(f"建置報告已儲存至: {path}")
 
 # ==============================================================================
 # --- 執行入口 ---
@@ -0,0 +1,40 @@
+import json
+import os
+import sys
+
+from full_hardcode_converter import pack_font_map_records, write_font_map_file
+
+# ==============================================================================
+# --- .map (JSON) -> .fmap (二進位) 遷移工具 ---
+# ==============================================================================
+# 舊版的 .map 只記錄 [offset, width, height]，沒有 x_advance / x_offset / y_offset。
+# 遷移時以 width 作為 x_advance、偏移量填 0，並且不設 FONT_MAP_FLAG_METRICS，
+# main.py 看到沒有此旗標的 .fmap 會沿用舊版的 width + 1 排版，結果與遷移前一致。
+# .font 點陣圖資料池的格式不變，可直接沿用。
+#
+# 用法: python migrate_font_map.py <檔案.map> [<檔案.map> ...]
+
+def migrate_map_file(map_path):
+    with open(map_path, "r", encoding="utf-8") as f:
+        map_data = json.load(f)
+    metadata = map_data.get("metadata", {})
+    font_map_records = []
+    for unicode_str, (offset, width, height) in map_data.get("characters", {}).items():
+        font_map_records.append({
+            "unicode": int(unicode_str), "offset": offset, "width": width, "height": height,
+            "x_advance": width, "x_offset": 0, "y_offset": 0, "padding": 0
+        })
+    fmap_path = os.path.splitext(map_path)[0] + ".fmap"
+    write_font_map_file(
+        fmap_path, metadata.get("font_size", 24), pack_font_map_records(font_map_records),
+        metadata.get("format", "1-byte-grayscale"), metrics=False
+    )
+    print(f"{map_path} -> {fmap_path} ({len(font_map_records)} 筆紀錄)")
+    return fmap_path
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("用法: python migrate_font_map.py <檔案.map> [<檔案.map> ...]")
+        sys.exit(1)
+    for path in sys.argv[1:]:
+        migrate_map_file(path)
@@ -0,0 +1,36 @@
+import json
+import os
+import sys
+
+from full_hardcode_converter import pack_ime_index, write_ime_index_file
+
+# ==============================================================================
+# --- .idx (JSON) + .dat -> .imx (二進位) 遷移工具 ---
+# ==============================================================================
+# 舊版模擬器檔案以 JSON 記錄 {按鍵組合: [offset, length]}，候選字放在 .dat。
+# 此工具把兩者合併成與 .h 相同的「索引 + 資料池」格式，輸出到同名的 .imx。
+#
+# 用法: python migrate_ime_index.py <檔案.idx> [<檔案.dat>]
+
+def migrate_ime_files(idx_path, dat_path=None):
+    if dat_path is None:
+        dat_path = os.path.splitext(idx_path)[0] + ".dat"
+    with open(idx_path, "r", encoding="utf-8") as f:
+        idx_data = json.load(f)
+    with open(dat_path, "rb") as f:
+        dat_data = f.read()
+    ime_map = {
+        key: dat_data[offset:offset + length].decode("utf-8")
+        for key, (offset, length) in idx_data.items()
+    }
+    ime_idx_data, ime_pool_data = pack_ime_index(ime_map)
+    imx_path = os.path.splitext(idx_path)[0] + ".imx"
+    write_ime_index_file(imx_path, ime_idx_data, ime_pool_data)
+    print(f"{idx_path} + {dat_path} -> {imx_path} ({len(ime_map)} 筆索引, 資料池 {len(ime_pool_data)} bytes)")
+    return imx_path
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (2, 3):
+        print("用法: python migrate_ime_index.py <檔案.idx> [<檔案.dat>]")
+        sys.exit(1)
+    migrate_ime_files(*sys.argv[1:])